@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 只在512字节的记录边界上判断是否切块：tar里每个文件都从512字节对齐的位置开始，
+# 一个文件的内容变化不会让后面文件的切块位置错开，又能用C实现的crc32判断边界，不用在Python里逐字节计算滚动哈希
+BLOCK_SIZE = 512
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# 平均大小之前用更难满足的掩码，之后用更容易满足的掩码，让块大小集中在平均值附近
+MASK_BEFORE_AVG = (1 << 12) - 1
+MASK_AFTER_AVG = (1 << 9) - 1
+ZLIB_LEVEL = 1
+
+CHUNK_DIRECTORY = 'chunks'
+SNAPSHOT_DIRECTORY = 'snapshots'
+CHUNK_SUFFIXES = {'zstd': '.zst', 'zlib': '.z'}
+
+
+def _find_cut(buffer, min_size, avg_size, max_size):
+    length = len(buffer)
+    if length <= min_size:
+        return length
+    end = min(length, max_size)
+    crc32 = zlib.crc32
+    with memoryview(buffer) as view:
+        for position in range(min_size, end - BLOCK_SIZE + 1, BLOCK_SIZE):
+            mask = MASK_BEFORE_AVG if position < avg_size else MASK_AFTER_AVG
+            if not crc32(view[position:position + BLOCK_SIZE]) & mask:
+                return position + BLOCK_SIZE
+    return end
+
+
+def iter_chunks(file, min_size=MIN_CHUNK_SIZE, avg_size=AVG_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    # 从二进制流中按内容切块，逐块产出bytes，内存占用只和max_size有关
+    # 某条记录的crc32满足掩码就在它后面切开，相同的内容总是切出相同的块，数据变化只影响附近的块
+    if min_size % BLOCK_SIZE or max_size % BLOCK_SIZE:
+        raise ValueError(f"Chunk sizes must be multiples of {BLOCK_SIZE} bytes.")
+    buffer = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buffer) < max_size:
+            data = file.read(max_size)
+            if data:
+                buffer += data
+            else:
+                eof = True
+        if not buffer:
+            return
+        cut = _find_cut(buffer, min_size, avg_size, max_size)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+
+class ChunkStore:
+    # 按sha256寻址的去重块存储，内容相同的块只保存一份，目录结构：
+    # <root>/chunks/<sha256前两位>/<sha256>.zst 或 .z  压缩后的块
+    # <root>/snapshots/<快照ID>.json  快照清单，按顺序记录每个数据卷由哪些块组成
+    _lock = threading.Lock()
+
+    def __init__(self, root):
+        self.root = root
+        self.chunk_directory = os.path.join(root, CHUNK_DIRECTORY)
+        self.snapshot_directory = os.path.join(root, SNAPSHOT_DIRECTORY)
+
+    def _chunk_path(self, digest, suffix):
+        return os.path.join(self.chunk_directory, digest[:2], digest + suffix)
+
+    def _find_chunk(self, digest):
+        for suffix in CHUNK_SUFFIXES.values():
+            path = self._chunk_path(digest, suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def has(self, digest):
+        return self._find_chunk(digest) is not None
+
+    def put(self, data):
+        # 保存一个块，返回 (sha256, 新写入的字节数)，块已经存在时不再写入，新写入的字节数为0
+        digest = hashlib.sha256(data).hexdigest()
+        if self.has(digest):
+            return digest, 0
+        if zstandard is not None:
+            path = self._chunk_path(digest, CHUNK_SUFFIXES['zstd'])
+            compressed = zstandard.ZstdCompressor().compress(data)
+        else:
+            path = self._chunk_path(digest, CHUNK_SUFFIXES['zlib'])
+            compressed = zlib.compress(data, ZLIB_LEVEL)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，中断的备份不会留下不完整的块
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(compressed)
+        os.replace(temp_path, path)
+        return digest, len(compressed)
+
+    def get(self, digest):
+        path = self._find_chunk(digest)
+        if path is None:
+            raise ValueError(f"Chunk {digest} is missing from store '{self.root}'.")
+        with open(path, 'rb') as file:
+            compressed = file.read()
+        if path.endswith(CHUNK_SUFFIXES['zstd']):
+            if zstandard is None:
+                raise ImportError("The zstandard package is required to read .zst chunks.")
+            data = zstandard.ZstdDecompressor().decompress(compressed)
+        else:
+            data = zlib.decompress(compressed)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} in store '{self.root}' is corrupted.")
+        return data
+
+    def store_stream(self, file):
+        # 把一个二进制流切块存入仓库，返回这个流的块列表和新写入的数据量
+        chunks = []
+        size = 0
+        new_chunks = 0
+        new_bytes = 0
+        for data in iter_chunks(file):
+            digest, written = self.put(data)
+            chunks.append([digest, len(data)])
+            size += len(data)
+            if written:
+                new_chunks += 1
+                new_bytes += written
+        return {'size': size, 'chunks': chunks, 'new_chunks': new_chunks, 'new_bytes': new_bytes}
+
+    def restore_stream(self, chunks, file):
+        # 按顺序取出块写入file，每个块都会校验sha256
+        for digest, _ in chunks:
+            file.write(self.get(digest))
+
+    def write_snapshot(self, snapshot):
+        os.makedirs(self.snapshot_directory, exist_ok=True)
+        path = os.path.join(self.snapshot_directory, snapshot['id'] + '.json')
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file)
+        os.replace(temp_path, path)
+        return path
+
+    def list_snapshots(self):
+        try:
+            names = os.listdir(self.snapshot_directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+    def load_snapshot(self, snapshot_id=None):
+        # snapshot_id为None时读取最新的快照
+        if snapshot_id is None:
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                raise ValueError(f"No snapshots found in store '{self.root}'.")
+            snapshot_id = snapshots[-1]
+        path = os.path.join(self.snapshot_directory, snapshot_id + '.json')
+        if not os.path.exists(path):
+            raise ValueError(f"Snapshot '{snapshot_id}' not found in store '{self.root}'.")
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def new_snapshot_id(self):
+        # 快照ID按时间排序，同一秒内的多次备份加序号区分
+        with self._lock:
+            base = time.strftime('%Y%m%d-%H%M%S')
+            snapshot_id = base
+            existing = set(self.list_snapshots())
+            sequence = 1
+            while snapshot_id in existing:
+                snapshot_id = f"{base}-{sequence}"
+                sequence += 1
+            return snapshot_id
+
+    def remove_snapshot(self, snapshot_id):
+        # 删除快照，再删除不再被任何快照引用的块（包括失败的备份留下的块），返回删除的块数
+        # 没有写进快照的块都会被删除，所以不要在备份进行时调用
+        with self._lock:
+            os.remove(os.path.join(self.snapshot_directory, snapshot_id + '.json'))
+            referenced = set()
+            for other in self.list_snapshots():
+                for volume in self.load_snapshot(other)['volumes']:
+                    referenced.update(digest for digest, _ in volume.get('chunks', []))
+            removed = 0
+            for root, _, names in os.walk(self.chunk_directory):
+                for name in names:
+                    if name.split('.', 1)[0] not in referenced:
+                        os.remove(os.path.join(root, name))
+                        removed += 1
+            return removed
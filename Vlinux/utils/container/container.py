@@ -1,4 +1,8 @@
 import subprocess
+import json
+import re
+import shlex
+import threading
 import time
 import yaml
 import paramiko
@@ -14,12 +18,142 @@ parent_dir = os.path.dirname(script_dir)
 # 添加上级目录到系统路径中
 sys.path.append(parent_dir)
 
-from file import SSHSingleton, FileTransfer
+from chunkstore import ChunkStore
+from file import CACHE_DIRECTORY, FileTransfer
+from remote import LocalExecutor, RemoteExecutor, run_concurrently
+
+# 等待服务状态变化时第一次退避的秒数，之后每次翻倍，最多到sleep_time
+MIN_BACKOFF = 0.5
+# 按镜像名自动识别的应用层就绪探测，在容器里执行，退出码为0表示就绪
+# mysql在初始化阶段会先起一个不监听网络的临时服务，所以探测走127.0.0.1的TCP连接
+READINESS_PROBES = {
+    'mysql': 'mysql -h 127.0.0.1 -uroot ${MYSQL_ROOT_PASSWORD:+-p"$MYSQL_ROOT_PASSWORD"} -e "SELECT 1"',
+    # MariaDB 11以后的镜像不再带mysql、mysqladmin这些旧名字的命令，优先用mariadb-admin；
+    # ping在服务能接受连接时就返回0（即使认证失败），所以不用传密码
+    'mariadb': 'if command -v mariadb-admin >/dev/null 2>&1; then mariadb-admin ping -h 127.0.0.1 --silent; '
+               'else mysqladmin ping -h 127.0.0.1 --silent; fi',
+    'percona': 'mysql -h 127.0.0.1 -uroot ${MYSQL_ROOT_PASSWORD:+-p"$MYSQL_ROOT_PASSWORD"} -e "SELECT 1"',
+    'redis': 'redis-cli ${REDIS_PASSWORD:+-a "$REDIS_PASSWORD"} ping | grep -q PONG',
+}
+# 容器状态快照的有效期（秒）
+STATUS_CACHE_TTL = 1.0
+COMPOSE_FILE_NAME = "docker-compose.yml"
+# 在远程查找compose文件时最多向下查找的目录层数，避免在家目录上扫描整棵目录树
+REMOTE_FIND_MAXDEPTH = 3
+# 备份数据卷时用来打包的镜像，以及压缩方式对应的压缩命令和归档文件扩展名
+BACKUP_IMAGE = 'busybox'
+BACKUP_COMPRESSORS = {'zstd': ('zstd -q -T0 -c', '.tar.zst'), 'gzip': ('gzip -c', '.tar.gz')}
+BACKUP_MANIFEST_NAME = 'manifest.json'
+# 记录最近一次成功备份的文件，增量备份从这次备份的时间开始
+BACKUP_LATEST_NAME = 'latest.json'
+
+_UPTIME = re.compile(r"Up (?:(\d+)|About an?|Less than a) (second|minute|hour|day|week|month|year)")
+_UPTIME_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800, 'month': 2592000, 'year': 31536000}
+
+
+class ComposeDiscoveryCache:
+    # 持久化的compose文件发现缓存，保存在CACHE_DIRECTORY下的一个JSON文件里，只有当前用户可读写
+    # 本地条目记录compose文件路径、修改时间和大小；远程条目记录找到的compose文件路径
+    # 不保存解析后的配置：JSON会把整数键、日期变成字符串，配置里还有数据库密码之类的环境变量
+    _lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIRECTORY, 'compose_discovery.json')
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def set(self, key, entry):
+        with self._lock:
+            entries = self._load()
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+            # 旧版本在条目里保存过解析后的配置，重写时一并去掉
+            for value in entries.values():
+                value.pop('config', None)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as file:
+                    json.dump(entries, file)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                # 缓存写不进去不影响正常使用
+                print(f"Failed to save compose discovery cache: {e}")
+
+
+class ContainerStatusCache:
+    # 一次 docker ps -a 取回所有容器的状态，ttl秒内的查询都用这份快照，多个服务同时等待时也只查一次
+    def __init__(self, list_containers, ttl=STATUS_CACHE_TTL):
+        # list_containers返回 docker ps -a --format '{{json .}}' 的输出
+        self._list_containers = list_containers
+        self.ttl = ttl
+        self._snapshot = None
+        self._taken_at = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is None or time.time() - self._taken_at > self.ttl:
+                self._snapshot = [self.parse_container(line) for line in self._list_containers().splitlines() if line.strip()]
+                self._taken_at = time.time()
+            return self._snapshot
+
+    def find(self, name):
+        # 容器名包含name，或者docker-compose的服务名就是name
+        return [container for container in self.snapshot() if name in container['name'] or container['service'] == name]
+
+    @staticmethod
+    def parse_container(line):
+        raw = json.loads(line)
+        status = raw.get('Status', '')
+        labels = dict(label.split('=', 1) for label in raw.get('Labels', '').split(',') if '=' in label)
+        state = raw.get('State')
+        if not state:
+            # 老版本docker没有State字段，从Status推断
+            state = 'running' if status.startswith('Up') else status.split(' ', 1)[0].lower()
+        return {'name': raw.get('Names', ''), 'id': raw.get('ID', ''), 'image': raw.get('Image', ''),
+                'service': labels.get('com.docker.compose.service'), 'state': state,
+                'health': ContainerStatusCache.parse_health(status), 'uptime': ContainerStatusCache.parse_uptime(status),
+                'status': status}
+
+    @staticmethod
+    def parse_health(status):
+        # docker ps 的Status形如 "Up 5 seconds (healthy)"、"Up 2 seconds (health: starting)"
+        if '(healthy)' in status:
+            return 'healthy'
+        if '(unhealthy)' in status:
+            return 'unhealthy'
+        if 'health: starting' in status:
+            return 'starting'
+        return 'none'
+
+    @staticmethod
+    def parse_uptime(status):
+        # 返回运行了多少秒，没在运行时返回None；docker只给出近似值，例如 "Up About an hour"
+        match = _UPTIME.match(status)
+        if match is None:
+            return None
+        return int(match.group(1) or 1) * _UPTIME_UNITS[match.group(2)]
 
 
 class Container:
     def __init__(self, local_path=None, remote_path=None, location_type='local',service_name=None, remote_host=None, remote_user=None, private_key_path=None,remote_password=None,
-                 max_attempts=10, sleep_time=5):
+                 max_attempts=10, sleep_time=5, probes=None):
         self.local_path = local_path
         self.remote_path = remote_path
         self.service_name = service_name
@@ -30,36 +164,67 @@ class Container:
         self.max_attempts = max_attempts
         self.sleep_time = sleep_time
         self.private_key_path = private_key_path
+        # 服务名到就绪探测命令的映射，覆盖按镜像自动识别的探测，值为None时不做应用层探测
+        self.probes = probes or {}
+        self.status_cache = ContainerStatusCache(self._list_containers)
+        self.discovery_cache = ComposeDiscoveryCache()
+        # load_config同时设置local_yml_path
         self.load_config()
-        self.ssh_singleton = SSHSingleton()
-        self.local_yml_path = self.get_local_yml_path()
-        self.remote_yml_path = self.get_remote_yml_path()
-
+        # 最近一次按依赖分层操作服务时每个服务的耗时
+        self.last_report = {}
+        self.remote = RemoteExecutor(self.remote_host, self.remote_user, password=self.remote_password, private_key_path=self.private_key_path)
+        # 只在远程模式下才需要远程的compose文件
+        self.remote_yml_path = self.get_remote_yml_path() if self.location_type == 'remote' else None
 
-    def _establish_ssh_connection(self):
-        self.ssh_singleton.connect(self.remote_host, self.remote_user, password=self.remote_password, private_key_path=self.private_key_path)
 
-    def execute_ssh_command(self, command):
+    def run_ssh_command(self, command, timeout=None, check=False):
+        # 返回带退出码的CommandResult
         print("Executing SSH command:", command)
-        self._establish_ssh_connection()
-        ssh = self.ssh_singleton.get_ssh()
-        stdin, stdout, stderr = ssh.exec_command(command)
-        stdin = None  # 不需要处理标准输入，将其置为 None      
-        output = stdout.read().decode('utf-8')
-        error = stderr.read().decode('utf-8')        
-        return stdin,output, error
+        return self.remote.run(command, timeout=timeout, check=check)
+
+    def execute_ssh_command(self, command, timeout=None):
+        result = self.run_ssh_command(command, timeout=timeout)
+        if not result.ok:
+            print(f"SSH command exited with status {result.exit_status}: {result.stderr.strip()}")
+        # 不需要处理标准输入，第一个返回值为 None
+        return None, result.stdout, result.stderr
         
     # local_path目录里可能不仅有yaml文件，还有其他文件，所以要找到yaml文件
-    def get_local_yml_path(self):
+    def _find_local_yml_path(self):
         for root, dirs, files in os.walk(self.local_path):
             for file in files:
-                if file == "docker-compose.yml":
+                if file == COMPOSE_FILE_NAME:
                     return os.path.join(root, file)
         raise FileNotFoundError("docker-compose.yml not found in the specified directory.")
-       
-  
+
+    def _load_local_compose(self):
+        # 返回 (compose文件路径, 解析后的配置)，缓存里记录的compose文件还在就不再遍历目录查找
+        # 配置每次都从文件重新解析，和直接读文件得到的结果完全一致
+        key = f"local|{os.path.abspath(self.local_path)}"
+        entry = self.discovery_cache.get(key)
+        if entry is not None and os.path.isfile(entry['path']):
+            yml_path = entry['path']
+        else:
+            yml_path = self._find_local_yml_path()
+
+        with open(yml_path, 'rb') as file:
+            config = yaml.safe_load(file)
+        file_stat = os.stat(yml_path)
+        if entry is None or entry.get('path') != yml_path or entry.get('mtime') != file_stat.st_mtime_ns or entry.get('size') != file_stat.st_size:
+            self.discovery_cache.set(key, {'path': yml_path, 'mtime': file_stat.st_mtime_ns, 'size': file_stat.st_size})
+        return yml_path, config
+
+    def get_local_yml_path(self):
+        return self._load_local_compose()[0]
+
     def get_remote_yml_path(self):
-        command = f"find {self.remote_path} -type f -name docker-compose.yml"
+        # 缓存里记录的远程compose文件还在就直接用，否则在有限深度内重新查找
+        key = f"remote|{self.remote_host}|{self.remote_user}|{self.remote_path}"
+        entry = self.discovery_cache.get(key)
+        if entry is not None and self.remote.run(f"test -f {shlex.quote(entry['path'])}").ok:
+            return entry['path']
+
+        command = f"find {self.remote_path} -maxdepth {REMOTE_FIND_MAXDEPTH} -type f -name {COMPOSE_FILE_NAME} -print -quit"
         _,stdout, stderr = self.execute_ssh_command(command)
         remote_yml_path = stdout.strip()
     
@@ -76,12 +241,12 @@ class Container:
             if not remote_yml_path:
                 raise Exception("Failed to find yml file in remote path after uploading.")
     
+        self.discovery_cache.set(key, {'path': remote_yml_path})
         return remote_yml_path
 
     
     def load_config(self):
-        with open(self.get_local_yml_path(), "r") as config_file:
-            self.config = yaml.safe_load(config_file)    
+        self.local_yml_path, self.config = self._load_local_compose()
     
     def up_services(self):
         # 启动指定的服务或所有服务
@@ -91,36 +256,113 @@ class Container:
             self.up_service(self.service_name)
         elif isinstance(self.service_name, list):
             if self.service_name:
-                for name in self.service_name:
-                    self.up_service(name)
+                self.orchestrate_services(self.service_name, 'up')
             else:
-                self.start_all_services()
+                self.up_all_services()
         else:
             raise ValueError("Invalid service_name type. Must be a string or a list of strings or None.")
 
-    def up_service(self, name):
+    def get_service_levels(self, names):
+        # 根据配置里的depends_on把服务分层：同一层的服务互不依赖，可以同时操作，每一层只依赖前面的层
+        # 只考虑names之间的依赖，names之外的依赖由docker-compose自己处理
+        names = list(dict.fromkeys(names))
+        services = self.config.get('services') or {}
+        dependencies = {}
+        for name in names:
+            depends_on = (services.get(name) or {}).get('depends_on') or []
+            # depends_on可以是列表，也可以是带condition的字典
+            dependencies[name] = {dependency for dependency in depends_on if dependency in names and dependency != name}
+
+        levels = []
+        remaining = dict(dependencies)
+        done = set()
+        while remaining:
+            level = [name for name in names if name in remaining and remaining[name] <= done]
+            if not level:
+                raise ValueError(f"Circular depends_on between services: {', '.join(sorted(remaining))}")
+            levels.append(level)
+            done.update(level)
+            for name in level:
+                del remaining[name]
+        return levels
+
+    def _run_compose(self, *args):
+        # 执行一条docker-compose子命令，一条命令里可以带多个服务名，由docker-compose同时处理
+        if self.location_type == 'remote':
+            command = f"cd {os.path.dirname(self.remote_yml_path)} && sudo docker-compose -f {self.remote_yml_path} {' '.join(args)}"
+            self.execute_ssh_command(command)
+        elif self.location_type == 'local':
+            subprocess.run(["sudo", "docker-compose", "-f", self.local_yml_path, *args], cwd=os.path.dirname(self.local_yml_path))
+        else:
+            raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
+
+    def orchestrate_services(self, names, action, remove_volumes=False):
+        # 按依赖分层操作多个服务：up从被依赖的服务开始，stop和down反过来从依赖别人的服务开始
+        # 每一层用一条docker-compose命令同时操作，再同时等待这一层所有服务，返回每个服务的耗时
+        if action == 'up':
+            wait, failure_message = self.wait_for_container_ready, "Failed to start {} service: service is not ready."
+        elif action == 'stop':
+            wait, failure_message = self.wait_for_container_stopped, "Failed to stop {} service."
+        elif action == 'down':
+            wait, failure_message = self.wait_for_container_removed, "{} services may not have been completely removed."
+        else:
+            raise ValueError("Invalid action. Must be 'up', 'stop' or 'down'.")
+
+        levels = self.get_service_levels(names)
+        if action != 'up':
+            levels.reverse()
+        report = {}
+        start_time = time.time()
+        for index, level in enumerate(levels):
+            print(f"{action} level {index + 1}/{len(levels)}: {', '.join(level)}")
+            level_start = time.time()
+            if action == 'up':
+                self._run_compose('up', '-d', *level)
+            elif action == 'stop':
+                self._run_compose('stop', *level)
+            else:
+                self._run_compose('down', '--remove-orphans', *level)
+                if remove_volumes:
+                    for name in level:
+                        self._remove_service_volumes(name)
+
+            def wait_for(name):
+                return wait(name), time.time() - level_start
+
+            for name, (done, seconds) in zip(level, run_concurrently(wait_for, level)):
+                report[name] = {'level': index, 'ok': done, 'seconds': seconds}
+                if not done:
+                    print(failure_message.format(name))
+
+        print(f"{action} finished in {time.time() - start_time:.1f}s:")
+        for name, entry in report.items():
+            print(f"  level {entry['level'] + 1}  {name:<30} {'ok' if entry['ok'] else 'FAILED':<6} {entry['seconds']:.1f}s")
+        self.last_report = report
+        return report
+
+    def up_service(self, name, wait=True):
         if self.location_type == 'remote':
-            self.up_service_remote(name)
+            self.up_service_remote(name, wait)
         elif self.location_type == 'local':
-            self.up_service_local(name)
+            self.up_service_local(name, wait)
         else:
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
 
-    def up_service_remote(self, name):
+    def up_service_remote(self, name, wait=True):
         print(f"Starting {name} service...")
         command = f"cd {os.path.dirname(self.remote_yml_path)} && sudo docker-compose -f {self.remote_yml_path} up -d {name}"
         self.execute_ssh_command(command)
 
-        if name is not None and not self.wait_for_container_ready(name):
+        if wait and name is not None and not self.wait_for_container_ready(name):
             print(f"Failed to start {name} service: service is not ready.")
             return
 
-    def up_service_local(self, name):
+    def up_service_local(self, name, wait=True):
         print(f"Starting local {name} service...")
         subprocess.run(["sudo", "docker-compose", "-f", self.local_yml_path, "up", "-d", name],
                        cwd=os.path.dirname(self.local_yml_path))
 
-        if name is not None and not self.wait_for_container_ready(name):
+        if wait and name is not None and not self.wait_for_container_ready(name):
             print(f"Failed to start local {name} service: service is not ready.")
             return
 
@@ -138,41 +380,108 @@ class Container:
         else:
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
 
-    def wait_for_container_ready(self, name):
-        print("Waiting for service to be ready...")
-        print(self.max_attempts)
-        for attempt in range(1, self.max_attempts + 1):
-            print(f"Attempt {attempt}/{self.max_attempts}")
-            time.sleep(self.sleep_time)
-            if self.check_status(name, 'up'):
-                print("service is ready.")
+    def _wait_until(self, name, condition, description):
+        # 立即检查一次，之后按指数退避再检查，退避期间这个服务有docker事件时提前醒来
+        # 总等待时间和原来一样是 max_attempts * sleep_time
+        deadline = time.time() + self.max_attempts * self.sleep_time
+        delay = MIN_BACKOFF
+        # 刚执行过docker-compose命令，之前的状态快照已经过时
+        self.status_cache.invalidate()
+        attempt = 0
+        while True:
+            attempt += 1
+            if condition(name):
+                print(f"{name} service is {description}.")
                 return True
-            else:
-                print("container is not ready.")
-        print("service is not ready after {} attempts.".format(self.max_attempts))
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self._wait_for_event(name, min(delay, remaining))
+            delay = min(delay * 2, self.sleep_time)
+        print(f"{name} service is not {description} after {attempt} checks.")
         return False
-    
-    def check_status(self, name, action):
-        if action == 'up':
-            command = ["sudo", "docker", "ps", "-a", "--filter", f"name={name}", "--format", "{{.Names}}"]
-        elif action == 'removed':
-            command = ["sudo", "docker", "ps", "-a", "--filter", f"name={name}", "--format", "{{.Names}}"]
-        elif action == 'stopped':
-            command = ["sudo", "docker", "ps", "--filter", f"name={name}", "--format", "{{.Names}}"]
+
+    def _wait_for_event(self, name, timeout):
+        # 阻塞到这个服务的容器产生下一个docker事件，或者超时；读到第一个事件就返回，不等docker events结束
+        # docker events不可用时退化为普通的sleep，避免空转
+        start_time = time.time()
+        # docker events自己不会退出，用timeout保证它最终结束
+        command = (f"timeout {timeout:.1f} sudo docker events --filter label=com.docker.compose.service={name} "
+                   f"--format '{{{{.Action}}}}'")
+        output = self._host_executor().read_line(command, timeout)
+        if output.strip():
+            # 有事件说明状态变了，下次检查重新取快照
+            self.status_cache.invalidate()
         else:
-            raise ValueError("Invalid action. Must be 'up', 'removed' or 'stopped'.")
-        
+            time.sleep(max(0, timeout - (time.time() - start_time)))
+
+    def _list_containers(self):
+        command = ["sudo", "docker", "ps", "-a", "--no-trunc", "--format", "{{json .}}"]
         if self.location_type == 'remote':
-            _,stdout, stderr = self.execute_ssh_command(" ".join(command))
-            if name in stdout:
-                return True
+            result = self.remote.run(" ".join(shlex.quote(part) for part in command))
+            output = result.stdout if result.ok else ''
         elif self.location_type == 'local':
             result = subprocess.run(command, capture_output=True, text=True)
-            if result.returncode == 0 and name in result.stdout:
-                return True
+            output = result.stdout if result.returncode == 0 else ''
         else:
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
-        return False
+        return output
+
+    def get_service_state(self, name):
+        # 返回服务容器的状态，例如 {'name': 'x_db_1', 'state': 'running', 'health': 'healthy', 'uptime': 5, ...}，容器不存在时返回None
+        # health是none、starting、healthy、unhealthy之一，没有定义healthcheck时为none
+        containers = self.status_cache.find(name)
+        # 同一个服务有多个容器时优先返回在运行的
+        containers.sort(key=lambda container: container['state'] != 'running')
+        return containers[0] if containers else None
+
+    def get_readiness_probe(self, name):
+        if name in self.probes:
+            return self.probes[name]
+        image = ((self.config.get('services') or {}).get(name) or {}).get('image', '')
+        image = image.rsplit('/', 1)[-1].split(':', 1)[0]
+        for prefix, probe in READINESS_PROBES.items():
+            if image.startswith(prefix):
+                return probe
+        return None
+
+    def run_readiness_probe(self, name):
+        # 在服务容器里执行应用层探测，没有探测命令时视为就绪
+        probe = self.get_readiness_probe(name)
+        if not probe:
+            return True
+        if self.location_type == 'remote':
+            command = (f"cd {os.path.dirname(self.remote_yml_path)} && "
+                       f"sudo docker-compose -f {self.remote_yml_path} exec -T {name} sh -c {shlex.quote(probe)}")
+            return self.remote.run(command, timeout=self.sleep_time * 2).ok
+        try:
+            result = subprocess.run(["sudo", "docker-compose", "-f", self.local_yml_path, "exec", "-T", name, "sh", "-c", probe],
+                                    cwd=os.path.dirname(self.local_yml_path), capture_output=True, timeout=self.sleep_time * 2)
+        except subprocess.TimeoutExpired:
+            return False
+        return result.returncode == 0
+
+    def is_service_ready(self, name):
+        # 容器在运行；定义了healthcheck时要求healthy；能识别的服务再做一次应用层探测
+        state = self.get_service_state(name)
+        if state is None or state['state'] != 'running':
+            return False
+        if state['health'] not in ('none', 'healthy'):
+            return False
+        return self.run_readiness_probe(name)
+
+    def wait_for_container_ready(self, name):
+        print(f"Waiting for {name} service to be ready...")
+        return self._wait_until(name, self.is_service_ready, 'ready')
+    
+    def check_status(self, name, action):
+        # 'up'和'removed'查容器是否存在，'stopped'查是否有容器还在运行，都从状态快照里查
+        if action not in ('up', 'removed', 'stopped'):
+            raise ValueError("Invalid action. Must be 'up', 'removed' or 'stopped'.")
+        containers = self.status_cache.find(name)
+        if action == 'stopped':
+            return any(container['state'] == 'running' for container in containers)
+        return bool(containers)
 
     
     def stop_services(self):
@@ -183,35 +492,34 @@ class Container:
             self.stop_service(self.service_name)
         elif isinstance(self.service_name, list):
             if self.service_name:
-                for name in self.service_name:
-                    self.stop_service(name)
+                self.orchestrate_services(self.service_name, 'stop')
             else:
                 self.stop_all_services()
         else:
             raise ValueError("Invalid service_name type. Must be a string or a list of strings or None.")
 
-    def stop_service(self, name):
+    def stop_service(self, name, wait=True):
         if self.location_type == 'remote':
-            self.stop_service_remote(name)
+            self.stop_service_remote(name, wait)
         elif self.location_type == 'local':
-            self.stop_service_local(name)
+            self.stop_service_local(name, wait)
         else:
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
 
-    def stop_service_remote(self, name):
+    def stop_service_remote(self, name, wait=True):
         print(f"Stopping {name} service...")
         command = f"cd {os.path.dirname(self.remote_yml_path)} && sudo docker-compose -f {self.remote_yml_path} stop {name}"
         self.execute_ssh_command(command)
 
-        if name is not None and not self.wait_for_container_stopped(name):
+        if wait and name is not None and not self.wait_for_container_stopped(name):
             print(f"Failed to stop {name} service.")
 
-    def stop_service_local(self, name):
+    def stop_service_local(self, name, wait=True):
         print(f"Stopping local {name} service...")
         subprocess.run(["sudo", "docker-compose", "-f", self.local_yml_path, "stop", name],
                        cwd=os.path.dirname(self.local_yml_path))
 
-        if name is not None and not self.wait_for_container_stopped(name):
+        if wait and name is not None and not self.wait_for_container_stopped(name):
             print(f"Failed to stop local {name} service.")
 
     def stop_all_services(self):
@@ -228,17 +536,8 @@ class Container:
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
 
     def wait_for_container_stopped(self, name):
-        print("Waiting for service to be stopped...")
-        for attempt in range(1, self.max_attempts + 1):
-            print(f"Attempt {attempt}/{self.max_attempts}")
-            time.sleep(self.sleep_time)
-            if not self.check_status(name,'stopped'):
-                print("service is stopped.")
-                return True
-            else:
-                print("service is still running.")
-        print("Database is still running after {} attempts.".format(self.max_attempts))
-        return False
+        print(f"Waiting for {name} service to be stopped...")
+        return self._wait_until(name, lambda name: not self.check_status(name, 'stopped'), 'stopped')
 
     def down_services(self, remove_volumes=False):
         # 移除指定的服务或所有服务
@@ -248,18 +547,17 @@ class Container:
             self.down_service(self.service_name, remove_volumes=remove_volumes)
         elif isinstance(self.service_name, list):
             if self.service_name:
-                for name in self.service_name:
-                    self.down_service(name, remove_volumes=remove_volumes)
+                self.orchestrate_services(self.service_name, 'down', remove_volumes=remove_volumes)
             else:
                 self.down_all_services(remove_volumes=remove_volumes)
         else:
             raise ValueError("Invalid service_name type. Must be a string or a list of strings or None.")
 
-    def down_service(self, name, remove_volumes=False):
+    def down_service(self, name, remove_volumes=False, wait=True):
         if self.location_type == 'remote':
-            self.down_service_remote(name, remove_volumes)
+            self.down_service_remote(name, remove_volumes, wait)
         elif self.location_type == 'local':
-            self.down_service_local(name, remove_volumes)
+            self.down_service_local(name, remove_volumes, wait)
         else:
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
 
@@ -269,10 +567,27 @@ class Container:
         directory_name = os.path.basename(os.path.dirname(yml_path))
         if service_name in self.config['services'] and 'volumes' in self.config['services'][service_name]:
             for volume in self.config['services'][service_name]['volumes']:
-                volumes.append(f"{directory_name}_{volume.split(':')[0]}")
+                # 长格式写法是字典；绑定挂载的宿主机目录不是docker数据卷，跳过
+                if isinstance(volume, dict):
+                    source = volume.get('source') if volume.get('type', 'volume') == 'volume' else None
+                else:
+                    source = volume.split(':')[0]
+                if not source or source.startswith(('.', '/', '~')):
+                    continue
+                volumes.append(f"{directory_name}_{source}")
         return volumes
 
-    def down_service_remote(self, name, remove_volumes=False):
+    def _remove_service_volumes(self, name):
+        # 删除服务关联的数据卷
+        print(f"Removing volumes associated with {name} service...")
+        for volume in self.get_volumes(name):
+            if self.location_type == 'remote':
+                command = (f"cd {os.path.dirname(self.remote_yml_path)} && "f"sudo docker volume rm {volume}")
+                self.execute_ssh_command(command)
+            else:
+                subprocess.run(["sudo", "docker", "volume", "rm", volume])
+
+    def down_service_remote(self, name, remove_volumes=False, wait=True):
         print(f"Removing {name} service ...")
         # Remove the service containers
         command = (f"cd {os.path.dirname(self.remote_yml_path)} && "
@@ -281,16 +596,12 @@ class Container:
         
         if remove_volumes:
             # Remove the volumes associated with the service
-            print(f"Removing volumes associated with {name} service...")
-            volumes = self.get_volumes(name)
-            for volume in volumes:
-                command = (f"cd {os.path.dirname(self.remote_yml_path)} && "f"sudo docker volume rm {volume}")
-                self.execute_ssh_command(command)
+            self._remove_service_volumes(name)
 
-        if name is not None and not self.wait_for_container_removed(name):
+        if wait and name is not None and not self.wait_for_container_removed(name):
             print(f"{name} services may not have been completely removed.")
 
-    def down_service_local(self, name, remove_volumes=False):
+    def down_service_local(self, name, remove_volumes=False, wait=True):
         print(f"Removing local {name}  services...")
         # Remove the service containers
         command = ["sudo", "docker-compose", "-f", self.local_yml_path, "down", "--remove-orphans", name]
@@ -298,13 +609,9 @@ class Container:
         
         if remove_volumes:
             # Remove the volumes associated with the service
-            print(f"Removing all volumes associated with {name} service...")
-            volumes = self.get_volumes(name)
-            for volume in volumes:
-                command = ["sudo", "docker", "volume", "rm", volume]
-                subprocess.run(command)
+            self._remove_service_volumes(name)
 
-        if not self.wait_for_container_removed(name):
+        if wait and not self.wait_for_container_removed(name):
             print(f"Local {name} services may not have been completely removed.")
 
     def down_all_services(self, remove_volumes=False):
@@ -330,85 +637,225 @@ class Container:
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
 
     def wait_for_container_removed(self, name):
-        print("Waiting for service to be removed...")
-        for attempt in range(1, self.max_attempts + 1):
-            print(f"Attempt {attempt}/{self.max_attempts}")
-            time.sleep(self.sleep_time)
-            if not self.check_status(name, 'removed'):
-                print("service is removed.")
-                return True
-            else:
-                print("container is still running.")
-        print("service is not ready after {} attempts.".format(self.max_attempts))
-        return False
+        print(f"Waiting for {name} service to be removed...")
+        return self._wait_until(name, lambda name: not self.check_status(name, 'removed'), 'removed')
     
-    def backup_service_data_volumes(self, target_directory):
+    def backup_service_data_volumes(self, target_directory, incremental=False, workers=4, compression='zstd'):
         # 备份指定的服务或所有服务
         if self.service_name is None:
-            self.backup_all_service_data_volumes(target_directory)
+            return self.backup_all_service_data_volumes(target_directory, incremental, workers, compression)
         elif isinstance(self.service_name, str):
-            self.backup_service_data_volume(self.service_name, target_directory)
+            return self.backup_volumes([self.service_name], target_directory, incremental, workers, compression)
         elif isinstance(self.service_name, list):
             if self.service_name:
-                for name in self.service_name:
-                    self.backup_service_data_volume(name, target_directory)
+                return self.backup_volumes(self.service_name, target_directory, incremental, workers, compression)
             else:
-                self.backup_all_service_data_volumes(target_directory)
+                return self.backup_all_service_data_volumes(target_directory, incremental, workers, compression)
         else:
             raise ValueError("Invalid service_name type. Must be a string or a list of strings or None.")
 
-    def backup_service_data_volume(self, name, target_directory):
-        if self.location_type == 'remote':
-            self.backup_service_data_volume_remote(name, target_directory)
-        elif self.location_type == 'local':
-            self.backup_service_data_volume_local(name, target_directory)
-        else:
+    def backup_service_data_volume(self, name, target_directory, incremental=False, compression='zstd'):
+        if self.location_type not in ('remote', 'local'):
             raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
+        return self.backup_volumes([name], target_directory, incremental, compression=compression)
 
-        
     def backup_service_data_volume_remote(self, name, target_directory):
-        print(f"Backing up {name} service data volumes on remote host...")
-        volumes = self.get_volumes(name)
-        for volume in volumes:
-            backup_script = f"""
-                #!/bin/bash
-                docker run --rm -v {volume}:/volume_data -v {target_directory}:/backup/{name} busybox cp -r /volume_data /backup/{name}
-            """
-            command = f"echo '{backup_script}' > /tmp/service_backup.sh && chmod +x /tmp/service_backup.sh && /tmp/service_backup.sh"
-            self.execute_ssh_command(command)
+        return self.backup_volumes([name], target_directory)
 
     def backup_service_data_volume_local(self, name, target_directory):
-        print(f"Backing up {name} service data volumes locally...")
-        volumes = self.get_volumes(name)
-        for volume in volumes:
-            backup_script = f"""
-                #!/bin/bash
-                docker run --rm -v {volume}:/volume_data -v {target_directory}:/backup/{name} busybox cp -r /volume_data /backup/{name}
-            """
-            with open("/tmp/service_backup.sh", "w") as f:
-                f.write(backup_script)
-            subprocess.run(["bash", "/tmp/service_backup.sh"])
-            os.remove("/tmp/service_backup.sh")
-
-
-    def backup_all_service_data_volumes(self, target_directory):
-        # 备份所有数据卷
+        return self.backup_volumes([name], target_directory)
+
+    def backup_all_service_data_volumes(self, target_directory, incremental=False, workers=4, compression='zstd'):
+        # 备份所有带数据卷的服务
+        names = [name for name in self.config['services'] if self.get_volumes(name)]
+        return self.backup_volumes(names, target_directory, incremental, workers, compression)
+
+    def _host_executor(self):
+        # 备份命令在docker所在的主机上执行
         if self.location_type == 'remote':
-            yml_path = self.remote_yml_path
-        elif self.location_type == 'local':
-            yml_path = self.local_yml_path
-        else:
-            raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
+            return self.remote
+        if self.location_type == 'local':
+            return LocalExecutor()
+        raise ValueError("Invalid location_type. Must be 'remote' or 'local'.")
 
-        directory_name = os.path.basename(os.path.dirname(yml_path))
-        for service_name in self.config['services']:
-            if 'volumes' in self.config['services'][service_name]:
-                volumes = self.get_volumes(service_name)
-                for volume in volumes:
-                    if self.location_type == 'remote':
-                        self.backup_service_data_volume_remote(volume, target_directory, directory_name, service_name)
-                    elif self.location_type == 'local':
-                        self.backup_service_data_volume_local(volume, target_directory, directory_name, service_name)
+    @staticmethod
+    def _create_run_directory(executor, target_directory, started):
+        # 备份目录按时间命名，同一秒内开始的备份加序号区分；用不带-p的mkdir独占地创建，目录已经存在时换下一个序号
+        base = time.strftime('%Y%m%d-%H%M%S', time.localtime(started))
+        executor.run(f"mkdir -p {shlex.quote(target_directory)}", check=True)
+        run_id = base
+        sequence = 1
+        while True:
+            run_directory = os.path.join(target_directory, run_id)
+            result = executor.run(f"mkdir {shlex.quote(run_directory)}")
+            if result.ok:
+                return run_id, run_directory
+            if not executor.run(f"test -d {shlex.quote(run_directory)}").ok:
+                result.check()
+            run_id = f"{base}-{sequence}"
+            sequence += 1
+
+    def backup_volumes(self, names, target_directory, incremental=False, workers=4, compression='zstd'):
+        # 每个数据卷用一个临时容器打成tar包，经管道压缩后直接写入备份文件，最多workers个数据卷同时备份
+        # 备份文件写在docker所在主机的 target_directory/<备份时间>/<服务名>/<数据卷><扩展名>，同目录下的manifest.json记录每个文件的大小和sha256
+        # incremental为True时只打包上次成功备份之后修改过的文件（按修改时间判断，删除的文件不会体现在增量里）
+        if compression not in BACKUP_COMPRESSORS:
+            raise ValueError(f"Invalid compression. Must be one of: {', '.join(BACKUP_COMPRESSORS)}.")
+        compress_command, extension = BACKUP_COMPRESSORS[compression]
+        executor = self._host_executor()
+        latest_path = os.path.join(target_directory, BACKUP_LATEST_NAME)
+
+        previous = None
+        if incremental:
+            result = executor.run(f"cat {shlex.quote(latest_path)}")
+            if result.ok:
+                previous = json.loads(result.stdout)
+            else:
+                print("No previous backup found, taking a full backup.")
+
+        started = time.time()
+        run_id, run_directory = self._create_run_directory(executor, target_directory, started)
+        # 增量的时间窗口用docker所在主机的时钟计算，本机和主机的时钟可能不一致
+        host_started = int(executor.run("date +%s", check=True).stdout.strip())
+        since = previous.get('host_created', previous['created']) if previous else None
+        items = [(name, volume) for name in names for volume in self.get_volumes(name)]
+        print(f"Backing up {len(items)} volumes ({'incremental' if previous else 'full'}) into {run_directory}...")
+
+        def backup(item):
+            service, volume = item
+            archive = os.path.join(run_directory, service, volume + extension)
+            if since is None:
+                tar = "tar -C /volume_data -cf - ."
+            else:
+                # find -mmin按分钟计算，多算一分钟避免漏掉边界上的文件；分钟数在容器里按主机时钟算
+                # 没有文件变化时tar会报空归档，这时直接输出一个空的tar包（全零的结束块）
+                tar = (f"cd /volume_data && minutes=$(( ($(date +%s) - {int(since)} + 59) / 60 + 1 )) && "
+                       f"find . -type f -mmin -$minutes > /tmp/changed_files && "
+                       f"if [ -s /tmp/changed_files ]; then tar -cf - -T /tmp/changed_files; else head -c 10240 /dev/zero; fi")
+            command = (f"mkdir -p {shlex.quote(os.path.dirname(archive))} && "
+                       f"sudo docker run --rm -v {volume}:/volume_data:ro {BACKUP_IMAGE} sh -c {shlex.quote(tar)} | "
+                       f"{compress_command} > {shlex.quote(archive)} && "
+                       f"stat -c %s {shlex.quote(archive)} && sha256sum {shlex.quote(archive)}")
+            start_time = time.time()
+            # 管道中任意一步失败都要让整条命令失败
+            result = executor.run(f"bash -o pipefail -c {shlex.quote(command)}")
+            entry = {'service': service, 'volume': volume, 'file': os.path.relpath(archive, run_directory),
+                     'seconds': round(time.time() - start_time, 3)}
+            if not result.ok:
+                entry['error'] = result.stderr.strip() or f"exit status {result.exit_status}"
+                print(f"Failed to back up volume {volume}: {entry['error']}")
+                return entry
+            size_line, checksum_line = result.stdout.strip().splitlines()[-2:]
+            entry['size'] = int(size_line)
+            entry['sha256'] = checksum_line.split()[0]
+            print(f"Backed up {volume}: {entry['size'] / 1048576:.1f} MB in {entry['seconds']:.1f}s")
+            return entry
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            entries = list(pool.map(backup, items))
+
+        failed = [entry for entry in entries if 'error' in entry]
+        manifest = {'id': run_id, 'created': started, 'host_created': host_started,
+                    'mode': 'incremental' if previous else 'full',
+                    'base': previous['id'] if previous else None, 'since': since,
+                    'compression': compression, 'volumes': entries}
+        executor.run(f"mkdir -p {shlex.quote(run_directory)} && printf '%s' {shlex.quote(json.dumps(manifest, indent=2))} > "
+                     f"{shlex.quote(os.path.join(run_directory, BACKUP_MANIFEST_NAME))}", check=True)
+        total = sum(entry.get('size', 0) for entry in entries)
+        print(f"Backed up {len(entries) - len(failed)}/{len(entries)} volumes ({total / 1048576:.1f} MB) "
+              f"in {time.time() - started:.1f}s.")
+        if failed:
+            raise RuntimeError(f"Failed to back up volumes: {', '.join(entry['volume'] for entry in failed)}")
+        # 全部成功才更新latest，下次增量备份从这次开始
+        executor.run(f"printf '%s' {shlex.quote(json.dumps({'id': run_id, 'created': started, 'host_created': host_started}))} > {shlex.quote(latest_path)}",
+                     check=True)
+        return manifest
+
+    def _selected_services(self):
+        # service_name为None或空列表时选择所有带数据卷的服务
+        if isinstance(self.service_name, str):
+            return [self.service_name]
+        if self.service_name is None or isinstance(self.service_name, list):
+            if self.service_name:
+                return list(self.service_name)
+            return [name for name in self.config['services'] if self.get_volumes(name)]
+        raise ValueError("Invalid service_name type. Must be a string or a list of strings or None.")
+
+    def dedup_backup_service_data_volumes(self, store_directory, workers=2):
+        return self.dedup_backup_volumes(self._selected_services(), store_directory, workers)
+
+    def dedup_backup_volumes(self, names, store_directory, workers=2):
+        # 把每个数据卷的tar流按内容切块，存进本机store_directory下的去重块存储，只有变化过的块会被写入
+        # 每次备份写一个快照清单，任何一个快照都可以单独恢复，不依赖之前的快照
+        store = ChunkStore(store_directory)
+        executor = self._host_executor()
+        started = time.time()
+        snapshot_id = store.new_snapshot_id()
+        items = [(name, volume) for name in names for volume in self.get_volumes(name)]
+        print(f"Backing up {len(items)} volumes into snapshot {snapshot_id} of {store_directory}...")
+
+        def backup(item):
+            service, volume = item
+            start_time = time.time()
+            entry = {'service': service, 'volume': volume}
+            command = f"sudo docker run --rm -v {volume}:/volume_data:ro {BACKUP_IMAGE} tar -C /volume_data -cf - ."
+            try:
+                with executor.stream(command) as stream:
+                    entry.update(store.store_stream(stream))
+            except Exception as e:
+                entry['error'] = str(e)
+                print(f"Failed to back up volume {volume}: {e}")
+                return entry
+            entry['seconds'] = round(time.time() - start_time, 3)
+            print(f"Backed up {volume}: {entry['size'] / 1048576:.1f} MB, {entry['new_chunks']}/{len(entry['chunks'])} new chunks "
+                  f"({entry['new_bytes'] / 1048576:.1f} MB written) in {entry['seconds']:.1f}s")
+            return entry
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            entries = list(pool.map(backup, items))
+
+        failed = [entry for entry in entries if 'error' in entry]
+        if failed:
+            # 失败时不写快照，已经写入的块会在下次删除快照时清理
+            raise RuntimeError(f"Failed to back up volumes: {', '.join(entry['volume'] for entry in failed)}")
+        snapshot = {'id': snapshot_id, 'created': started, 'host': executor.host, 'volumes': entries}
+        store.write_snapshot(snapshot)
+        total = sum(entry['size'] for entry in entries)
+        written = sum(entry['new_bytes'] for entry in entries)
+        print(f"Snapshot {snapshot_id}: {total / 1048576:.1f} MB in {len(entries)} volumes, {written / 1048576:.1f} MB written "
+              f"in {time.time() - started:.1f}s.")
+        return snapshot
+
+    def restore_service_data_volumes(self, store_directory, snapshot_id=None, workers=2):
+        # 从快照恢复选中服务的数据卷，snapshot_id为None时使用最新的快照
+        # 数据卷原有的内容会被清空，恢复前应先停止使用这些数据卷的服务
+        store = ChunkStore(store_directory)
+        snapshot = store.load_snapshot(snapshot_id)
+        names = set(self._selected_services())
+        entries = [entry for entry in snapshot['volumes'] if entry['service'] in names]
+        executor = self._host_executor()
+        started = time.time()
+        print(f"Restoring {len(entries)} volumes from snapshot {snapshot['id']}...")
+
+        def restore(entry):
+            volume = entry['volume']
+            script = "find /volume_data -mindepth 1 -maxdepth 1 -exec rm -rf {} + && tar -C /volume_data -xf -"
+            command = f"sudo docker run --rm -i -v {volume}:/volume_data {BACKUP_IMAGE} sh -c {shlex.quote(script)}"
+            try:
+                with executor.stream(command, 'w') as stream:
+                    store.restore_stream(entry['chunks'], stream)
+            except Exception as e:
+                print(f"Failed to restore volume {volume}: {e}")
+                return volume
+            print(f"Restored {volume}: {entry['size'] / 1048576:.1f} MB")
+            return None
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            failed = [volume for volume in pool.map(restore, entries) if volume]
+        print(f"Restored {len(entries) - len(failed)}/{len(entries)} volumes in {time.time() - started:.1f}s.")
+        if failed:
+            raise RuntimeError(f"Failed to restore volumes: {', '.join(failed)}")
+        return snapshot
 
 """
 attention:
@@ -1,9 +1,375 @@
 import paramiko
 import os
+import logging
 import stat
-from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import json
+import shlex
+import threading
+import time
+import queue
+import contextlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# 本地缓存目录，存放传输日志等需要跨进程保存的状态
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'zlib')
+# 传输和计算校验和时每次读写的字节数
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+# SFTP单个读写请求的大小和同时在途的请求数，高延迟链路上调大可以提高吞吐
+DEFAULT_REQUEST_SIZE = 32768
+DEFAULT_MAX_REQUESTS = 128
+# SFTP通道的窗口大小，窗口太小时高延迟链路上大部分时间在等对端确认
+DEFAULT_WINDOW_SIZE = 16 * 1024 * 1024
+# 超过这个大小的文件拆成多个范围，在多个SFTP通道上并行传输
+DEFAULT_PARALLEL_THRESHOLD = 64 * 1024 * 1024
+# 并行传输时每个范围的最大字节数，也是中断后续传的粒度
+PARALLEL_RANGE_SIZE = 32 * 1024 * 1024
+# verify为'auto'时，续传过的文件和不小于这个大小的文件才比对sha256，其他文件只比对大小
+VERIFY_SIZE_THRESHOLD = 64 * 1024 * 1024
+# 目录传输时小于这个大小的文件按批提交，一批文件在同一个工作线程里依次传输，省掉每个文件的调度开销
+SMALL_FILE_SIZE = 1024 * 1024
+SMALL_FILE_BATCH = 64
+# SSH连接池的默认参数：保活间隔、空闲多久后断开、每个连接上同时打开的会话数、每个主机最多的连接数
+# sshd默认MaxSessions为10，通道关闭是异步的，刚关闭的通道在服务端可能还占着名额，所以每个连接最多用8个
+SSH_KEEPALIVE_INTERVAL = 30
+SSH_IDLE_TIMEOUT = 300
+SSH_MAX_SESSIONS = 8
+SSH_MAX_CONNECTIONS = 4
+# 等待空闲会话名额的最长时间
+SSH_CHECKOUT_TIMEOUT = 300
 
+
+def file_checksum(file, chunk_size=TRANSFER_CHUNK_SIZE):
+    # 分块计算sha256，file可以是本地文件对象，也可以是SFTP文件对象
+    digest = hashlib.sha256()
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            break
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class TransferJournal:
+    # 记录一次目录传输中已经完成并校验过的文件，传输中断后重试时跳过这些文件
+    # 每完成一个文件追加一行JSON，整个目录传输成功后删除日志
+    def __init__(self, direction, remote_host, local_path, remote_path):
+        key = hashlib.sha1(f"{direction}|{remote_host}|{local_path}|{remote_path}".encode('utf-8')).hexdigest()
+        self.path = os.path.join(CACHE_DIRECTORY, 'transfer_journals', f"{key}.jsonl")
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 进程被杀时最后一行可能没写完
+                        continue
+                    self._entries[entry['path']] = entry
+
+    def is_done(self, relative_path, size, mtime):
+        entry = self._entries.get(relative_path)
+        return entry is not None and entry['size'] == size and entry['mtime'] == mtime
+
+    def mark_done(self, relative_path, size, mtime, checksum):
+        entry = {'path': relative_path, 'size': size, 'mtime': mtime, 'sha256': checksum}
+        with self._lock:
+            self._entries[relative_path] = entry
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry) + '\n')
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def range_journal_path(direction, remote_host, local_path, remote_path):
+    key = hashlib.sha1(f"{direction}|{remote_host}|{local_path}|{remote_path}".encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIRECTORY, 'transfer_ranges', f"{key}.json")
+
+
+class RangeJournal:
+    # 记录一个大文件已经传完的范围。并行传输时各个范围乱序写入，中断后目标文件的大小只是写得最远的位置，
+    # 前面可能还有没写完的范围，所以不能按文件大小续传，只能重传没有记录完成的范围
+    # 开始写入前就创建记录文件，记录文件存在说明这个文件还没有传完，传完后删除
+    # 源文件的大小、修改时间或范围的切法变了时，之前的记录作废
+    def __init__(self, direction, remote_host, local_path, remote_path, size, mtime, ranges):
+        self.path = range_journal_path(direction, remote_host, local_path, remote_path)
+        self.signature = [size, mtime]
+        self.ranges = [tuple(byte_range) for byte_range in ranges]
+        self.done = set()
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            if entry['signature'] == self.signature and [tuple(byte_range) for byte_range in entry['ranges']] == self.ranges:
+                self.done = {tuple(byte_range) for byte_range in entry['done']}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def pending(self):
+        return [byte_range for byte_range in self.ranges if byte_range not in self.done]
+
+    def in_progress(self):
+        return os.path.exists(self.path)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'signature': self.signature, 'ranges': self.ranges, 'done': sorted(self.done)}, file)
+        os.replace(temp_path, self.path)
+
+    def start(self):
+        with self._lock:
+            self._save()
+
+    def mark_done(self, start, end):
+        with self._lock:
+            self.done.add((start, end))
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self.done = set()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class SFTPChannelPool:
+    # 有上限的SFTP通道池，通道用完后放回池里给下一个文件复用，避免每个文件都新开通道
+    # 大文件并行传输时额外的通道也从这个池里借，一次传输用到的SFTP通道总数不会超过上限
+    def __init__(self, open_channel, max_channels):
+        self._open_channel = open_channel
+        self._max_channels = max_channels
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def channel(self):
+        with self._checked_out(self._checkout()) as sftp:
+            yield sftp
+
+    @contextmanager
+    def extra_channel(self):
+        # 池里有空闲通道或者还没到上限时借出一个通道，否则得到None，不等待
+        sftp = self._checkout(block=False)
+        if sftp is None:
+            yield None
+            return
+        with self._checked_out(sftp):
+            yield sftp
+
+    @contextmanager
+    def _checked_out(self, sftp):
+        try:
+            yield sftp
+        except Exception:
+            # 出错的通道可能已经不可用，直接丢弃，下次按需重新打开
+            self._discard(sftp)
+            raise
+        self._idle.put(sftp)
+
+    def _checkout(self, block=True):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self._max_channels
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get() if block else None
+        try:
+            return self._open_channel()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, sftp):
+        with self._lock:
+            self._created -= 1
+        try:
+            sftp.close()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                sftp = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(sftp)
+
+
+class PooledSFTPClient(paramiko.SFTPClient):
+    # 关闭时把占用的会话名额还给SSH连接池
+    _release = None
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class _PooledConnection:
+    def __init__(self, client):
+        self.client = client
+        self.active = 0
+        self.last_used = time.time()
+
+    def is_healthy(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active() and transport.is_authenticated()
+
+
+class SSHConnectionPool:
+    # 进程内共享的SSH连接池，按 (主机, 用户, 认证方式) 区分连接，每个主机只握手一次
+    # 每次执行命令或打开SFTP都要先借出一个会话名额，用完归还；一个连接的名额用满时再向同一主机建立新连接
+    # 连接开启TCP保活，借出前检查连接是否还活着，空闲超过idle_timeout的连接会被关闭
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._connections = {}
+                instance._connecting = {}
+                instance._condition = threading.Condition()
+                instance.keepalive_interval = SSH_KEEPALIVE_INTERVAL
+                instance.idle_timeout = SSH_IDLE_TIMEOUT
+                instance.max_sessions = SSH_MAX_SESSIONS
+                instance.max_connections = SSH_MAX_CONNECTIONS
+                cls._instance = instance
+        return cls._instance
+
+    @staticmethod
+    def _key(host, username, password, private_key_path):
+        if password is None and private_key_path is None:
+            raise ValueError("Either password or private_key_path must be provided.")
+        # 密码不直接放进键里
+        auth = private_key_path if private_key_path else hashlib.sha256(password.encode('utf-8')).hexdigest()
+        return host, username, auth
+
+    def _connect(self, host, username, password, private_key_path):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            print(f"Trying to connect to {host}...")
+            if private_key_path:
+                private_key = paramiko.RSAKey.from_private_key_file(private_key_path)
+                client.connect(host, username=username, pkey=private_key)
+            else:
+                client.connect(host, username=username, password=password)
+            client.get_transport().set_keepalive(self.keepalive_interval)
+            print(f"Connected to {host}.")
+            return client
+        except paramiko.AuthenticationException as e:
+            print(f"Failed to authenticate with host {host}: {str(e)}")
+            raise
+        except paramiko.SSHException as e:
+            print(f"SSH connection to host {host} failed: {str(e)}")
+            raise
+
+    def _evict(self, now):
+        # 在持有锁时调用：关闭空闲太久或已经断开的连接
+        for key, connections in list(self._connections.items()):
+            for connection in list(connections):
+                if connection.active:
+                    continue
+                if now - connection.last_used > self.idle_timeout or not connection.is_healthy():
+                    connections.remove(connection)
+                    connection.client.close()
+            if not connections:
+                del self._connections[key]
+
+    def checkout(self, host, username, password=None, private_key_path=None, timeout=SSH_CHECKOUT_TIMEOUT):
+        # 借出一个会话名额，返回所在的连接，用完必须调用checkin
+        key = self._key(host, username, password, private_key_path)
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                now = time.time()
+                self._evict(now)
+                connections = self._connections.setdefault(key, [])
+                for connection in connections:
+                    if connection.active < self.max_sessions:
+                        # 空闲超过保活间隔的连接先探测一下，对端已经断开时丢弃
+                        if now - connection.last_used > self.keepalive_interval and not connection.is_healthy():
+                            continue
+                        connection.active += 1
+                        return connection
+                connecting = self._connecting.get(key, 0)
+                if len(connections) + connecting < self.max_connections:
+                    self._connecting[key] = connecting + 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise RuntimeError(f"Timed out waiting for a free SSH session on {host}")
+                self._condition.wait(remaining)
+
+        # 握手不持有锁，避免阻塞其他主机的借出
+        connection = None
+        try:
+            connection = _PooledConnection(self._connect(host, username, password, private_key_path))
+            connection.active = 1
+        finally:
+            with self._condition:
+                self._connecting[key] -= 1
+                if connection is not None:
+                    self._connections.setdefault(key, []).append(connection)
+                self._condition.notify_all()
+        return connection
+
+    def checkin(self, connection):
+        with self._condition:
+            connection.active -= 1
+            connection.last_used = time.time()
+            self._condition.notify_all()
+
+    @contextmanager
+    def session(self, host, username, password=None, private_key_path=None):
+        # 在with块内独占一个会话名额，可以在返回的SSHClient上执行命令
+        connection = self.checkout(host, username, password, private_key_path)
+        try:
+            yield connection.client
+        finally:
+            self.checkin(connection)
+
+    def open_sftp(self, host, username, password=None, private_key_path=None, window_size=None):
+        # 打开的SFTP会话一直占用一个名额，直到调用close
+        connection = self.checkout(host, username, password, private_key_path)
+        try:
+            sftp = PooledSFTPClient.from_transport(connection.client.get_transport(), window_size=window_size)
+        except Exception:
+            self.checkin(connection)
+            raise
+        sftp._release = lambda: self.checkin(connection)
+        return sftp
+
+    def close_all(self):
+        with self._condition:
+            for connections in self._connections.values():
+                for connection in connections:
+                    connection.client.close()
+            self._connections = {}
+
+
+# 保留给旧代码使用，新代码请使用SSHConnectionPool
 class SSHSingleton:
     _instance = None
 
@@ -46,15 +412,122 @@ class SSHSingleton:
             self._ssh = None
 
 class FileTransfer: 
-    def __init__(self, remote_host, remote_user, remote_password=None, private_key_path=None):
+    def __init__(self, remote_host, remote_user, remote_password=None, private_key_path=None, resume=True, verify='auto',
+                 request_size=DEFAULT_REQUEST_SIZE, max_requests=DEFAULT_MAX_REQUESTS, window_size=DEFAULT_WINDOW_SIZE,
+                 parallel_threshold=DEFAULT_PARALLEL_THRESHOLD, parallel_channels=4, max_workers=8):
         self.remote_host = remote_host
         self.remote_user = remote_user
         self.remote_password = remote_password
         self.private_key_path = private_key_path
-        self.ssh_singleton = SSHSingleton()
+        # resume为True时从已传输的字节处继续传输
+        # verify为True时每个文件传输完成后都比对两端的sha256；为'auto'时只比对续传过的文件和大文件的sha256，
+        # 其余文件只比对大小，不用每个文件都在远程跑一次sha256sum；为False时只比对大小
+        self.resume = resume
+        self.verify = verify
+        # 传输调优参数，见模块顶部的默认值说明
+        self.request_size = request_size
+        self.max_requests = max_requests
+        self.window_size = window_size
+        self.parallel_threshold = parallel_threshold
+        self.parallel_channels = parallel_channels
+        # 目录传输的并发数，也是通道池里最多的SFTP通道数，大文件并行传输借用的通道也算在内；
+        # 每个SSH连接上同时打开的会话数另由SSHConnectionPool.max_sessions限制，超出时向同一主机再建一个连接
+        self.max_workers = max_workers
+        # 每个文件的传输速度，便于调参
+        self.transfer_stats = []
+        # 最近一次目录传输中每个文件的结果
+        self.last_report = []
+        self._stats_lock = threading.Lock()
+        self.ssh_pool = SSHConnectionPool()
+
+    def _ssh_session(self):
+        return self.ssh_pool.session(self.remote_host, self.remote_user, password=self.remote_password, private_key_path=self.private_key_path)
+
+    def _open_sftp(self):
+        # 用更大的通道窗口打开SFTP会话
+        return self.ssh_pool.open_sftp(self.remote_host, self.remote_user, password=self.remote_password,
+                                       private_key_path=self.private_key_path, window_size=self.window_size)
+
+    def _tune_remote_file(self, remote_file):
+        remote_file.set_pipelined(True)
+        remote_file.MAX_REQUEST_SIZE = self.request_size
+        remote_file.MAX_WRITE_CHUNK_SIZE = self.request_size
+
+    def _write_remote(self, remote_file, data):
+        # 流水线写入时paramiko要积压到100个以上的请求、并且已经有回复到达时才去读回复，
+        # 这里在途的写请求超过max_requests时先等最早的请求确认，和下载一样限制在途的请求数
+        remote_file.write(data)
+        requests = getattr(remote_file, '_reqs', None)
+        while requests is not None and len(requests) > self.max_requests:
+            remote_file.sftp._read_response(requests.popleft())
+
+    def _read_remote_range(self, remote_file, start, end):
+        # 一次性发出范围内所有读请求，同时在途的请求数不超过max_requests
+        chunks = [(offset, min(self.request_size, end - offset)) for offset in range(start, end, self.request_size)]
+        try:
+            return remote_file.readv(chunks, max_concurrent_prefetch_requests=self.max_requests)
+        except TypeError:
+            # 老版本paramiko不支持限制在途请求数
+            return remote_file.readv(chunks)
+
+    def _is_parallel(self, size):
+        return size >= self.parallel_threshold and self.parallel_channels > 1
 
-    def _establish_ssh_connection(self):
-        self.ssh_singleton.connect(self.remote_host, self.remote_user, password=self.remote_password, private_key_path=self.private_key_path)
+    def _split_ranges(self, size):
+        # 把 [0, size) 按请求大小对齐切成至少parallel_channels段，每段不超过PARALLEL_RANGE_SIZE
+        step = min(-(-size // self.parallel_channels), PARALLEL_RANGE_SIZE)
+        step = -(-step // self.request_size) * self.request_size
+        return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+    def _range_journal(self, direction, local_path, remote_path, size, mtime):
+        journal = RangeJournal(direction, self.remote_host, local_path, remote_path, size, mtime, self._split_ranges(size))
+        if not self.resume:
+            journal.clear()
+        return journal
+
+    def _run_ranges(self, sftp, pool, progress, transfer_range):
+        # 在调用方的通道和从pool借到的通道（合计最多parallel_channels个）上并行传输还没完成的范围，返回传输的字节数
+        # 池里没有富余的通道时少用几个通道，不会超过池的上限；每个通道依次取范围，每完成一个范围记录一次
+        # transfer_range(sftp, start, end) 传输一个范围
+        pending = queue.Queue()
+        for byte_range in progress.pending():
+            pending.put(byte_range)
+
+        def worker(channel):
+            transferred = 0
+            while True:
+                try:
+                    start, end = pending.get_nowait()
+                except queue.Empty:
+                    return transferred
+                transfer_range(channel, start, end)
+                progress.mark_done(start, end)
+                transferred += end - start
+
+        own_pool = pool is None
+        if own_pool:
+            pool = SFTPChannelPool(self._open_sftp, self.parallel_channels - 1)
+        try:
+            with contextlib.ExitStack() as stack:
+                channels = [sftp]
+                for _ in range(min(self.parallel_channels, pending.qsize()) - 1):
+                    extra = stack.enter_context(pool.extra_channel())
+                    if extra is None:
+                        break
+                    channels.append(extra)
+                with ThreadPoolExecutor(max_workers=len(channels)) as executor:
+                    futures = [executor.submit(worker, channel) for channel in channels]
+                    return sum(future.result() for future in futures)
+        finally:
+            if own_pool:
+                pool.close()
+
+    def _record_rate(self, action, path, transferred, seconds):
+        rate = transferred / 1048576 / max(seconds, 1e-6)
+        with self._stats_lock:
+            self.transfer_stats.append({'action': action, 'path': path, 'bytes': transferred, 'seconds': seconds, 'mb_per_s': rate})
+        if transferred >= TRANSFER_CHUNK_SIZE:
+            print(f"{action} {path}: {transferred / 1048576:.1f} MB in {seconds:.1f}s ({rate:.1f} MB/s)")
 
     def _normalize_path(self, path, is_directory):
         # 修正路径格式,因为有时路径中有不规则的符号，这是os自带的方法
@@ -70,11 +543,11 @@ class FileTransfer:
         return normalized_path
 
     def create_remote_directory(self, remote_path):
-        self._establish_ssh_connection()
-        ssh = self.ssh_singleton.get_ssh()
-        stdin, stdout, stderr = ssh.exec_command(f"mkdir -p {remote_path}")
-        if stderr.read().strip():
-            raise RuntimeError(f"Failed to create remote directory {remote_path}")
+        with self._ssh_session() as ssh:
+            stdin, stdout, stderr = ssh.exec_command(f"mkdir -p {remote_path}")
+            error = stderr.read().decode('utf-8')
+            if stdout.channel.recv_exit_status() != 0:
+                raise RuntimeError(f"Failed to create remote directory {remote_path}: {error.strip()}")
 
     def _get_directory_structure(self, dir_path):
         dirs = [] 
@@ -83,35 +556,210 @@ class FileTransfer:
         return dirs
 
     def _create_remote_directory_structure(self, local_dirs, remote_path):
-        self._establish_ssh_connection()
-        ssh = self.ssh_singleton.get_ssh()
         #create_remote_directory只是创建了一个目录，这里要递归创建所有目录
         for dir in local_dirs:
             remote_dir = os.path.join(remote_path, dir)
             self.create_remote_directory(remote_dir)
             
-    def _upload_file(self, local_file_path, remote_file_path):
-        self._establish_ssh_connection()
-        ssh = self.ssh_singleton.get_ssh()
-        sftp = ssh.open_sftp()
+    def _remote_checksum(self, sftp, remote_file_path):
+        # 优先在远程用sha256sum计算，远程没有这个命令时再通过SFTP读回来计算
+        with self._ssh_session() as ssh:
+            _, stdout, _ = ssh.exec_command(f"sha256sum -- {shlex.quote(remote_file_path)}")
+            output = stdout.read().decode('utf-8')
+            exit_status = stdout.channel.recv_exit_status()
+        if exit_status == 0 and output:
+            return output.split()[0]
+        with sftp.open(remote_file_path, 'rb') as remote_file:
+            remote_file.prefetch()
+            return file_checksum(remote_file)
+
+    def _should_verify(self, size, resumed):
+        if self.verify == 'auto':
+            return bool(resumed) or size >= VERIFY_SIZE_THRESHOLD
+        return bool(self.verify)
+
+    def _send_file(self, sftp, local_file_path, remote_file_path, offset, size):
+        # 从offset开始顺序写入，远程文件的大小就是已经写完的前缀，可以按大小续传
+        if offset >= size and size > 0:
+            return
+        start_time = time.time()
+        with open(local_file_path, 'rb') as local_file, sftp.open(remote_file_path, 'r+b' if offset else 'wb') as remote_file:
+            self._tune_remote_file(remote_file)
+            local_file.seek(offset)
+            remote_file.seek(offset)
+            while True:
+                data = local_file.read(TRANSFER_CHUNK_SIZE)
+                if not data:
+                    break
+                self._write_remote(remote_file, data)
+        self._record_rate('Uploaded', local_file_path, size - offset, time.time() - start_time)
+
+    def _send_parallel(self, sftp, local_file_path, remote_file_path, progress, pool=None):
+        # 大文件按范围在多个SFTP通道上并行写入，只传progress里还没完成的范围，返回是否是续传
+        if progress.done:
+            try:
+                sftp.stat(remote_file_path)
+            except IOError:
+                progress.clear()
+        resumed = bool(progress.done)
+        if resumed:
+            print(f"Resuming upload of {local_file_path}: {len(progress.done)}/{len(progress.ranges)} ranges already sent")
+        else:
+            progress.start()
+            with sftp.open(remote_file_path, 'wb'):
+                pass
+        start_time = time.time()
+        transferred = self._run_ranges(sftp, pool, progress, functools.partial(self._send_range, local_file_path, remote_file_path))
+        self._record_rate('Uploaded', local_file_path, transferred, time.time() - start_time)
+        return resumed
+
+    def _send_range(self, local_file_path, remote_file_path, sftp, start, end):
+        with open(local_file_path, 'rb') as local_file, sftp.open(remote_file_path, 'r+b') as remote_file:
+            self._tune_remote_file(remote_file)
+            local_file.seek(start)
+            remote_file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = local_file.read(min(TRANSFER_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                self._write_remote(remote_file, data)
+                remaining -= len(data)
+
+    # pool是目录传输用的通道池，大文件并行传输时从里面借额外的通道
+    def _upload_file(self, local_file_path, remote_file_path, journal=None, journal_key=None, sftp=None, pool=None):
+        own_sftp = sftp is None
+        if own_sftp:
+            sftp = self._open_sftp()
         try:
-            sftp.put(local_file_path, remote_file_path)
+            local_stat = os.stat(local_file_path)
+            progress = None
+            if self._is_parallel(local_stat.st_size):
+                progress = self._range_journal('upload', local_file_path, remote_file_path, local_stat.st_size, local_stat.st_mtime)
+            offset = 0
+            if self.resume:
+                try:
+                    remote_stat = sftp.stat(remote_file_path)
+                except IOError:
+                    remote_stat = None
+                # 上传完成后会把远程文件的修改时间设成和本地一样，大小和修改时间都相同说明上次已经传完；
+                # 并行传输中断的文件大小可能已经和本地一样，有范围记录时不能跳过
+                if (remote_stat is not None and self.verify is not True and remote_stat.st_size == local_stat.st_size
+                        and int(remote_stat.st_mtime) == int(local_stat.st_mtime)
+                        and (progress is None or not progress.in_progress())):
+                    if journal is not None:
+                        journal.mark_done(journal_key, local_stat.st_size, local_stat.st_mtime, None)
+                    if progress is not None:
+                        progress.clear()
+                    return
+                # 并行传输的文件按范围续传，不看远程文件的大小
+                offset = remote_stat.st_size if remote_stat is not None and progress is None else 0
+                # 远程文件比本地还大，说明不是同一个文件，只能重传；不校验时大小相同也不能认为已经传完
+                if offset > local_stat.st_size or (offset == local_stat.st_size and not self.verify):
+                    offset = 0
+            if progress is not None:
+                resumed = self._send_parallel(sftp, local_file_path, remote_file_path, progress, pool)
+            else:
+                if offset:
+                    print(f"Resuming upload of {local_file_path} at byte {offset}/{local_stat.st_size}")
+                self._send_file(sftp, local_file_path, remote_file_path, offset, local_stat.st_size)
+                resumed = offset > 0
+
+            checksum = None
+            if not self._should_verify(local_stat.st_size, resumed):
+                remote_size = sftp.stat(remote_file_path).st_size
+                if remote_size != local_stat.st_size:
+                    raise RuntimeError(f"Size mismatch after uploading {local_file_path}: {remote_size} != {local_stat.st_size}")
+            else:
+                with open(local_file_path, 'rb') as local_file:
+                    checksum = file_checksum(local_file)
+                if resumed and self._remote_checksum(sftp, remote_file_path) != checksum:
+                    # 续传接上的部分和本地不一致，从头重传一次
+                    print(f"Checksum mismatch after resuming {local_file_path}, uploading it again from the start.")
+                    if progress is not None:
+                        progress.clear()
+                        self._send_parallel(sftp, local_file_path, remote_file_path, progress, pool)
+                    else:
+                        self._send_file(sftp, local_file_path, remote_file_path, 0, local_stat.st_size)
+                    resumed = False
+                if not resumed and self._remote_checksum(sftp, remote_file_path) != checksum:
+                    raise RuntimeError(f"Checksum mismatch after uploading {local_file_path}")
+            sftp.utime(remote_file_path, (local_stat.st_atime, local_stat.st_mtime))
+            if progress is not None:
+                progress.clear()
+            if journal is not None:
+                journal.mark_done(journal_key, local_stat.st_size, local_stat.st_mtime, checksum)
         finally:
-            sftp.close()
+            if own_sftp:
+                sftp.close()
+
+    def _run_transfers(self, pool, tasks):
+        # tasks是 (相对路径, 大小, transfer(sftp)) 的列表
+        # 大文件优先调度，避免最后只剩一个大文件在跑；小文件按批提交，同一批在一个工作线程里依次传输，每个文件从通道池借一个通道
+        # 每个文件的结果记录到last_report，有文件失败时全部跑完后再抛出RuntimeError
+        tasks = sorted(tasks, key=lambda task: task[1], reverse=True)
+        batches = []
+        small = []
+        for task in tasks:
+            if task[1] >= SMALL_FILE_SIZE:
+                batches.append([task])
+                continue
+            small.append(task)
+            if len(small) >= SMALL_FILE_BATCH:
+                batches.append(small)
+                small = []
+        if small:
+            batches.append(small)
+
+        def run_batch(batch):
+            results = []
+            for relative_path, size, transfer in batch:
+                start_time = time.time()
+                try:
+                    with pool.channel() as sftp:
+                        transfer(sftp)
+                    results.append({'path': relative_path, 'size': size, 'status': 'ok', 'seconds': time.time() - start_time})
+                except Exception as e:
+                    logging.error(f"Failed to transfer {relative_path}: {e}")
+                    results.append({'path': relative_path, 'size': size, 'status': 'failed', 'error': str(e),
+                                    'seconds': time.time() - start_time})
+            return results
+
+        report = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(run_batch, batch) for batch in batches]
+            for future in as_completed(futures):
+                report.extend(future.result())
+        self.last_report = report
+
+        failed = [result for result in report if result['status'] == 'failed']
+        transferred = sum(result['size'] for result in report if result['status'] == 'ok')
+        print(f"Transferred {len(report) - len(failed)}/{len(report)} files ({transferred / 1048576:.1f} MB).")
+        if failed:
+            details = '; '.join(f"{result['path']}: {result['error']}" for result in failed[:10])
+            raise RuntimeError(f"{len(failed)} file(s) failed to transfer: {details}")
+        return report
 
     def _upload_directory(self, local_path, remote_path):
-        self._establish_ssh_connection()
-        ssh = self.ssh_singleton.get_ssh()
-        sftp = ssh.open_sftp()
-        try:
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                for root, dirs, files in os.walk(local_path):
-                    for file in files:
-                        local_file_path = os.path.join(root, file)
-                        remote_file_path = os.path.join(remote_path, os.path.relpath(local_file_path, local_path))
-                        executor.submit(self._upload_file, local_file_path, remote_file_path)
+        journal = TransferJournal('upload', self.remote_host, local_path, remote_path)
+        pool = SFTPChannelPool(self._open_sftp, self.max_workers)
+        tasks = []
+        for root, dirs, files in os.walk(local_path):
+            for file in files:
+                local_file_path = os.path.join(root, file)
+                relative_path = os.path.relpath(local_file_path, local_path)
+                local_stat = os.stat(local_file_path)
+                if journal.is_done(relative_path, local_stat.st_size, local_stat.st_mtime):
+                    continue
+                remote_file_path = os.path.join(remote_path, relative_path)
+                tasks.append((relative_path, local_stat.st_size,
+                              functools.partial(self._upload_file, local_file_path, remote_file_path, journal, relative_path, pool=pool)))
+
+        try:
+            self._run_transfers(pool, tasks)
+            journal.clear()
         finally:
-            sftp.close()
+            pool.close()
 
     def _is_remote_directory(self, sftp, remote_path):
         try:
@@ -146,15 +794,11 @@ class FileTransfer:
         except RuntimeError as e:
             print(f"uploading failure：{str(e)}")
             raise e
-        finally:
-            self.ssh_singleton.close()
 
     def download(self, remote_path, local_path):
         print('start downloading... ')
         try:
-            self._establish_ssh_connection()
-            ssh = self.ssh_singleton.get_ssh()
-            sftp = ssh.open_sftp()
+            sftp = self._open_sftp()
 
             try:
                 if self._is_remote_directory(sftp, remote_path):
@@ -169,27 +813,150 @@ class FileTransfer:
         except RuntimeError as e:
             print(f"download failure：{str(e)}")
             raise e
+
+    def _receive_file(self, sftp, remote_path, local_path, offset, size):
+        # 从offset开始顺序写入，本地文件的大小就是已经写完的前缀，可以按大小续传
+        if offset >= size and size > 0:
+            return
+        start_time = time.time()
+        if not offset:
+            open(local_path, 'wb').close()
+        self._receive_range(remote_path, local_path, offset, size, sftp)
+        self._record_rate('Downloaded', remote_path, size - offset, time.time() - start_time)
+
+    def _receive_parallel(self, sftp, remote_path, local_path, progress, pool=None):
+        # 大文件按范围在多个SFTP通道上并行读取，各范围直接写到本地文件的对应位置，只传progress里还没完成的范围，返回是否是续传
+        # 本地文件不预先扩展到完整大小，中断后也不会被当成已经下载完的文件
+        if progress.done and not os.path.exists(local_path):
+            progress.clear()
+        resumed = bool(progress.done)
+        if resumed:
+            print(f"Resuming download of {remote_path}: {len(progress.done)}/{len(progress.ranges)} ranges already received")
+        else:
+            progress.start()
+            open(local_path, 'wb').close()
+        start_time = time.time()
+        transferred = self._run_ranges(sftp, pool, progress,
+                                       lambda channel, start, end: self._receive_range(remote_path, local_path, start, end, channel))
+        self._record_rate('Downloaded', remote_path, transferred, time.time() - start_time)
+        return resumed
+
+    def _receive_range(self, remote_path, local_path, start, end, sftp=None):
+        own_sftp = sftp is None
+        if own_sftp:
+            sftp = self._open_sftp()
+        try:
+            with sftp.open(remote_path, 'rb') as remote_file, open(local_path, 'r+b') as local_file:
+                self._tune_remote_file(remote_file)
+                local_file.seek(start)
+                for data in self._read_remote_range(remote_file, start, end):
+                    local_file.write(data)
         finally:
-            self.ssh_singleton.close()
+            if own_sftp:
+                sftp.close()
 
-    def _download_file(self, sftp, remote_path, local_dir):
+    def _download_file(self, sftp, remote_path, local_dir, journal=None, journal_key=None, pool=None):
         remote_filename = os.path.basename(remote_path)
         local_path = os.path.join(local_dir, remote_filename)
-        sftp.get(remote_path, local_path)
+        remote_stat = sftp.stat(remote_path)
+        if journal is not None and journal.is_done(journal_key, remote_stat.st_size, remote_stat.st_mtime):
+            return
+
+        progress = None
+        if self._is_parallel(remote_stat.st_size):
+            progress = self._range_journal('download', local_path, remote_path, remote_stat.st_size, remote_stat.st_mtime)
+        offset = 0
+        # 并行传输的文件按范围续传，不看本地文件的大小
+        if self.resume and progress is None and os.path.exists(local_path):
+            offset = os.path.getsize(local_path)
+            # 本地文件比远程还大，说明不是同一个文件，只能重新下载；不校验时大小相同也不能认为已经下载完
+            if offset > remote_stat.st_size or (offset == remote_stat.st_size and not self.verify):
+                offset = 0
+        if progress is not None:
+            resumed = self._receive_parallel(sftp, remote_path, local_path, progress, pool)
+        else:
+            if offset:
+                print(f"Resuming download of {remote_path} at byte {offset}/{remote_stat.st_size}")
+            self._receive_file(sftp, remote_path, local_path, offset, remote_stat.st_size)
+            resumed = offset > 0
+
+        checksum = None
+        if not self._should_verify(remote_stat.st_size, resumed):
+            local_size = os.path.getsize(local_path)
+            if local_size != remote_stat.st_size:
+                raise RuntimeError(f"Size mismatch after downloading {remote_path}: {local_size} != {remote_stat.st_size}")
+        else:
+            remote_checksum = self._remote_checksum(sftp, remote_path)
+            with open(local_path, 'rb') as local_file:
+                checksum = file_checksum(local_file)
+            if checksum != remote_checksum and resumed:
+                # 续传接上的部分和远程不一致，从头重新下载一次
+                print(f"Checksum mismatch after resuming {remote_path}, downloading it again from the start.")
+                if progress is not None:
+                    progress.clear()
+                    self._receive_parallel(sftp, remote_path, local_path, progress, pool)
+                else:
+                    self._receive_file(sftp, remote_path, local_path, 0, remote_stat.st_size)
+                with open(local_path, 'rb') as local_file:
+                    checksum = file_checksum(local_file)
+            if checksum != remote_checksum:
+                raise RuntimeError(f"Checksum mismatch after downloading {remote_path}")
+        # 本地文件的修改时间和远程保持一致，下次下载时大小和时间都相同的文件可以直接跳过
+        os.utime(local_path, (time.time(), remote_stat.st_mtime))
+        if progress is not None:
+            progress.clear()
+        if journal is not None:
+            journal.mark_done(journal_key, remote_stat.st_size, remote_stat.st_mtime, checksum)
+
+    def _list_remote_directory(self, pool, remote_path):
+        with pool.channel() as sftp:
+            return sftp.listdir_attr(remote_path)
+
+    def _list_remote_tree(self, pool, remote_root, local_dir):
+        # 按层遍历远程目录树，同一层的目录在通道池上并行列出，同时在本地建好对应的文件夹
+        files = []
+        level = ['']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while level:
+                listings = executor.map(lambda relative_dir: self._list_remote_directory(pool, os.path.join(remote_root, relative_dir)), level)
+                next_level = []
+                for relative_dir, items in zip(level, listings):
+                    for item in items:
+                        relative_path = os.path.join(relative_dir, item.filename)
+                        if stat.S_ISDIR(item.st_mode):
+                            os.makedirs(os.path.join(local_dir, relative_path), exist_ok=True)
+                            next_level.append(relative_path)
+                        else:
+                            files.append((relative_path, item))
+                level = next_level
+        return files
 
     def _download_directory(self, sftp, remote_path, local_dir):
-        #注意，upload和download的逻辑不一样，upload是先创建所有的远程文件夹，再把上传文件到合适的文件夹，而download是每一层文件夹一层一层递归处理，即递归创建每层文件夹
-        # 创建文件夹后，随即下载文件
-        files_and_directories = sftp.listdir_attr(remote_path)
-        for item in files_and_directories:
-            item_name = item.filename
-            remote_item_path = os.path.join(remote_path, item_name)
-            local_item_path = os.path.join(local_dir, item_name)
-            if stat.S_ISDIR(item.st_mode):
-                os.makedirs(local_item_path, exist_ok=True)
-                self._download_directory(sftp, remote_item_path, local_item_path)
-            else:
-                self._download_file(sftp, remote_item_path, local_dir)
+        #注意，upload和download的逻辑不一样，upload是先创建所有的远程文件夹，再把上传文件到合适的文件夹，而download先列出整个远程目录树并创建本地文件夹
+        # 然后在通道池上并发下载文件，大小和修改时间都和本地相同的文件直接跳过
+        journal = TransferJournal('download', self.remote_host, local_dir, remote_path)
+        pool = SFTPChannelPool(self._open_sftp, self.max_workers)
+        try:
+            tasks = []
+            skipped = 0
+            for relative_path, item in self._list_remote_tree(pool, remote_path, local_dir):
+                local_file_path = os.path.join(local_dir, relative_path)
+                remote_file_path = os.path.join(remote_path, relative_path)
+                if (os.path.isfile(local_file_path) and os.path.getsize(local_file_path) == item.st_size
+                        and int(os.path.getmtime(local_file_path)) == int(item.st_mtime)
+                        and not os.path.exists(range_journal_path('download', self.remote_host, local_file_path, remote_file_path))):
+                    skipped += 1
+                    continue
+                tasks.append((relative_path, item.st_size,
+                              functools.partial(self._download_file, remote_path=remote_file_path,
+                                                local_dir=os.path.dirname(local_file_path), journal=journal, journal_key=relative_path,
+                                                pool=pool)))
+            if skipped:
+                print(f"Skipped {skipped} files that are already up to date.")
+            self._run_transfers(pool, tasks)
+            journal.clear()
+        finally:
+            pool.close()
 
 
 if __name__ == "__main__":
@@ -1,14 +1,87 @@
+import contextlib
+import csv
+import datetime
+import decimal
+import itertools
+import json
 import logging
 import os
 import re
 import pandas as pd
+import shlex
 import subprocess
+import tempfile
+import threading
+import time
+import zlib
+import queue
 import pymysql
+from pymysql.constants import FIELD_TYPE
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
-from file import FileTransfer, SSHSingleton
+from file import FileTransfer
+from remote import RemoteExecutor
 from container.container import Container
+from sqldump import (DEFAULT_CHUNK_SIZE, COMPRESS_COMMANDS, DECOMPRESS_COMMANDS, iter_range_statements,
+                     iter_classified_statements, classify_statement, compression_of, index_name, index_objects, index_tables, load_dump_index,
+                     open_sql_file, rename_statement_table, split_secondary_indexes, split_foreign_keys,
+                     constraint_name)
 from time import sleep
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+# export_database_parallel导出目录中的清单文件名
+MANIFEST_FILE_NAME = 'manifest.json'
+# 表以外的对象按这个顺序导出到各自的文件，导入时在数据之后按同样的顺序创建：视图可能调用函数，触发器可能调用存储过程
+OBJECT_FILE_NAMES = {'routines': 'routines.sql', 'views': 'views.sql', 'triggers': 'triggers.sql'}
+# 通过SSH通道流式收发数据时每次读写的字节数
+STREAM_CHUNK_SIZE = 1024 * 1024
+# 流式导入时打印进度的间隔秒数
+PROGRESS_INTERVAL = 5
+# 连接池默认配置：常驻连接数、高峰时额外允许的连接数、借出连接前是否探活、连接最长使用秒数（要小于服务端的wait_timeout）、等待空闲连接的秒数
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_PRE_PING = True
+DEFAULT_POOL_RECYCLE = 3600
+DEFAULT_POOL_TIMEOUT = 30
+# 批量插入时每条多行INSERT最多占max_allowed_packet的比例，给语句头和协议开销留出余量
+BULK_PACKET_RATIO = 0.9
+# 批量插入默认每插入这么多行提交一次；LOAD DATA时每批写一个临时文件
+DEFAULT_COMMIT_EVERY = 100000
+# DataFrame每次转换这么多行，把NaN换成NULL
+DATAFRAME_BATCH_ROWS = 100000
+# 流式读取查询结果时每个DataFrame的默认行数
+DEFAULT_DATAFRAME_CHUNK_ROWS = 100000
+# DataFrame建表时字符串列最长的字符数不超过这个值用VARCHAR，超过时按长度用TEXT、MEDIUMTEXT或LONGTEXT
+VARCHAR_MAX_LENGTH = 1024
+# DataFrame建表时VARCHAR的长度至少是当前最长字符串的这么多倍，再向上取整到VARCHAR_LENGTHS里的一档，给之后追加的数据留余量
+VARCHAR_HEADROOM = 2
+VARCHAR_LENGTHS = (255, VARCHAR_MAX_LENGTH)
+# MySQL一行里所有列加起来的字节数上限（TEXT和BLOB只算指针），utf8mb4的VARCHAR(n)按4n+2字节算
+ROW_SIZE_LIMIT = 65535
+# import_dataframe_to_table支持的写入方式
+DATAFRAME_LOAD_MODES = ('replace', 'append', 'upsert', 'swap')
+# 整表重新导入时先写入的影子表和换下来的旧表的后缀
+SHADOW_TABLE_SUFFIX = '__new'
+OLD_TABLE_SUFFIX = '__old'
+# 从SQL文件导入表时每执行这么多条INSERT提交一次，避免一个事务过大，出错时已经提交的部分也不会丢
+IMPORT_COMMIT_STATEMENTS = 100
+# 并行读取表时每个分片每次按主键翻页读取的行数
+DEFAULT_PAGE_ROWS = 50000
+# 按MySQL列类型给DataFrame列指定的类型，整数用可以存NULL的Int64，避免列变成object；DECIMAL保持Decimal对象不丢精度
+MYSQL_DTYPE_HINTS = {
+    FIELD_TYPE.TINY: 'Int64', FIELD_TYPE.SHORT: 'Int64', FIELD_TYPE.INT24: 'Int64', FIELD_TYPE.LONG: 'Int64',
+    FIELD_TYPE.LONGLONG: 'Int64', FIELD_TYPE.YEAR: 'Int64',
+    FIELD_TYPE.FLOAT: 'float64', FIELD_TYPE.DOUBLE: 'float64',
+    FIELD_TYPE.DATE: 'datetime64[ns]', FIELD_TYPE.DATETIME: 'datetime64[ns]', FIELD_TYPE.TIMESTAMP: 'datetime64[ns]',
+    FIELD_TYPE.VARCHAR: 'string', FIELD_TYPE.VAR_STRING: 'string', FIELD_TYPE.STRING: 'string',
+}
+# BINARY/VARBINARY和CHAR/VARCHAR的列类型相同，只能按字符集编号区分，63是binary字符集
+BINARY_CHARSET_NUMBER = 63
+
 # 本数据库导入时，如果不想导入特定的数据库或表，那么就可以用iimport_all_databases_from_sql_file或export_all_databases_from_sql_file把所有的数据库导入导出（数据库文件中要有创建数据库的mysql语句）
 # 只有想导入导出特定的数据库，才考虑用import_database,export_database（要指定数据库，导入的数据库文件要包含创建数据库的mysql语句）,import_table.export_tabl（要使用指定的数据库，要包含指定的表，数据库文件中要有表创建mysql语句）函数
 class MySQLDatabase:
@@ -16,7 +89,9 @@ class MySQLDatabase:
                  container_is_up=True,
                  location_type='local',
                  local_path=None,remote_path=None,service_name=None,remote_user=None,remote_host=None,private_key_path=None,remote_password=None,
-                 local_mysql_path=None, local_mysqldump_path=None,remote_mysql_path=None, remote_mysqldump_path= None):
+                 local_mysql_path=None, local_mysqldump_path=None,remote_mysql_path=None, remote_mysqldump_path= None,
+                 pool_size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW, pool_pre_ping=DEFAULT_POOL_PRE_PING,
+                 pool_recycle=DEFAULT_POOL_RECYCLE, pool_timeout=DEFAULT_POOL_TIMEOUT, local_infile=False):
         
         # 定义数据库连接参数，包括数据库的用户名、数据库的密码、数据库所在主机地址和端口
         # 注意数据库的主机地址和端口，既可以是本地，也可以是远程
@@ -51,21 +126,42 @@ class MySQLDatabase:
         self.remote_mysql_path = remote_mysql_path
         self.remote_mysqldump_path = remote_mysqldump_path 
         
-        # 定义SSH单例对象
-        self.ssh_singleton = SSHSingleton()
+        # 通过进程内共享的SSH连接池执行远程命令
+        self.remote = RemoteExecutor(self.remote_host, self.remote_user, password=self.remote_password, private_key_path=self.private_key_path)
+        # up_container创建的Container，之后重复使用
+        self.container = None
+        # 连接池配置，默认引擎和每个数据库的引擎都使用这套配置
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
+        self.pool_timeout = pool_timeout
+        # 是否允许客户端执行LOAD DATA LOCAL INFILE，还需要服务端开启local_infile
+        self.local_infile = local_infile
+        # 按数据库名缓存的引擎，见get_engine
+        self.engines = {}
+        self._engine_lock = threading.Lock()
         
         
         
         self.up_container()  
         
         self.engine=self.create_engine_with_retries()
-        self.connection=self.create_connection_with_retries ()     
         
+    def _create_engine(self, database_name=''):
+        return create_engine(f"mysql+pymysql://{self.mysqlusername}:{self.mysqlpassword}@{self.mysqlhost}:{self.mysqlport}/{database_name}",
+                             pool_size=self.pool_size, max_overflow=self.max_overflow, pool_pre_ping=self.pool_pre_ping,
+                             pool_recycle=self.pool_recycle, pool_timeout=self.pool_timeout,
+                             connect_args={'local_infile': True} if self.local_infile else {})
+
     def create_engine_with_retries(self):
+        # create_engine不会真正连接数据库，所以要借出一个连接试一下，数据库还没启动好时才能按max_attempts重试
         attempts = 0
         while attempts < self.max_attempts:
             try:
-                engine = create_engine(f"mysql+pymysql://{self.mysqlusername}:{self.mysqlpassword}@{self.mysqlhost}:{self.mysqlport}/")
+                engine = self._create_engine()
+                with engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
                 print("Engine created successfully.")
                 return engine
             except SQLAlchemyError as e:
@@ -77,53 +173,192 @@ class MySQLDatabase:
                 else:
                     raise
 
-    def create_connection_with_retries(self):
-        attempts = 0
-        while attempts < self.max_attempts:
-            try:
-                connection = pymysql.connect(user=self.mysqlusername, password=self.mysqlpassword, host=self.mysqlhost, port=self.mysqlport)
-                print("Connection established successfully.")
-                return connection
-            except pymysql.MySQLError as e:
-                logging.error(f"Error occurred while connecting to the database (pymysql): {e}")
-                attempts += 1
-                if attempts < self.max_attempts:
-                    print(f"Retrying to connect to the database in {self.sleep_time} seconds...")
-                    sleep(self.sleep_time)
-                else:
-                    raise
+    def get_engine(self, database_name=None):
+        # 每个数据库一个引擎，池里的连接建立时就选好了数据库，借出后不用再执行USE；database_name为None时返回默认引擎
+        if not database_name:
+            return self.engine
+        with self._engine_lock:
+            engine = self.engines.get(database_name)
+            if engine is None:
+                engine = self._create_engine(database_name)
+                self.engines[database_name] = engine
+            return engine
+
+    @contextlib.contextmanager
+    def raw_connection(self, database_name=None):
+        # 从连接池借出一个pymysql原生连接，离开with块时归还连接池（未提交的事务会被回滚），而不是关闭
+        connection = self.get_engine(database_name).raw_connection()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def close(self):
+        # 关闭所有连接池里的连接
+        with self._engine_lock:
+            engines = list(self.engines.values())
+            self.engines.clear()
+        for engine in engines + [self.engine]:
+            engine.dispose()
 
         
         
+    def get_container(self):
+        # 同一个实例只创建一次Container
+        if self.container is None:
+            self.container = Container(self.local_path, self.remote_path, self.location_type, self.service_name,
+                                       self.remote_host, self.remote_user,self.private_key_path, self.remote_password,
+                                       self.max_attempts, self.sleep_time)
+        return self.container
+
     def up_container(self):
         if not self.container_is_up:
             try:
-                container = Container(self.local_path, self.remote_path, self.location_type, self.service_name,
-                                      self.remote_host, self.remote_user,self.private_key_path, self.remote_password,
-                                      self.max_attempts, self.sleep_time)
+                container = self.get_container()
                 container.up_services()
             except Exception as e:
                 logging.error(f"Error occurred while starting the container: {e}")
                 raise     
     
-    def _establish_ssh_connection(self):
-        self.ssh_singleton.connect(self.remote_host, self.remote_user, password=self.remote_password, private_key_path=self.private_key_path)
-
-    def execute_ssh_command(self, command):
+    def run_ssh_command(self, command, timeout=None, check=False):
+        # 返回带退出码的CommandResult，check为True时命令失败抛出RuntimeError
         print("Executing SSH command:", command)
-        self._establish_ssh_connection()
-        ssh = self.ssh_singleton.get_ssh()
-        stdin, stdout, stderr = ssh.exec_command(command)
-        stdin = None
-        output = stdout.read().decode('utf-8')
-        error = stderr.read().decode('utf-8')
-        return stdin, output, error
+        return self.remote.run(command, timeout=timeout, check=check)
+
+    def execute_ssh_command(self, command, timeout=None):
+        result = self.run_ssh_command(command, timeout=timeout)
+        return None, result.stdout, result.stderr
 
     def get_transfer(self):
         transfer = FileTransfer(remote_host=self.remote_host, remote_user=self.remote_user, remote_password=self.remote_password,
                                 private_key_path=self.private_key_path)
         return transfer
 
+    # 管道中任意一个命令失败都要让整个命令失败，否则mysqldump出错会被压缩命令掩盖
+    @staticmethod
+    def _pipefail_command(command):
+        return f"bash -o pipefail -c {shlex.quote(command)}"
+
+    def _mysql_client_command(self, client_path, arguments=''):
+        return f"{client_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {arguments}".rstrip()
+
+    # 导入命令：.sql.gz、.sql.zst文件先在管道里解压再交给mysql
+    def _mysql_import_command(self, mysql_path, sql_file_path, database_name=''):
+        mysql_command = self._mysql_client_command(mysql_path, database_name)
+        compression = compression_of(sql_file_path)
+        if compression is None:
+            return f"{mysql_command} < {sql_file_path}"
+        return self._pipefail_command(f"{DECOMPRESS_COMMANDS[compression]} {sql_file_path} | {mysql_command}")
+
+    # 导出命令：目标文件是.sql.gz、.sql.zst时边导出边压缩
+    def _mysqldump_export_command(self, mysqldump_path, arguments, sql_file_path):
+        dump_command = self._mysql_client_command(mysqldump_path, arguments)
+        compression = compression_of(sql_file_path)
+        if compression is None:
+            return f"{dump_command} > {sql_file_path}"
+        return self._pipefail_command(f"{dump_command} | {COMPRESS_COMMANDS[compression]} > {sql_file_path}")
+
+    @staticmethod
+    def _drain_stderr(stderr):
+        # 在后台线程里持续读取远程命令的stderr：stdout和stderr共用通道的流控窗口，只读stdout时命令写满stderr就会卡住
+        # 返回一个函数，调用时等命令的stderr读完并返回其内容
+        chunks = []
+        thread = threading.Thread(target=lambda: chunks.append(stderr.read()), daemon=True)
+        thread.start()
+
+        def result():
+            thread.join()
+            return b''.join(chunks).decode('utf-8', 'replace')
+        return result
+
+    # 在远程执行mysqldump并压缩，压缩后的数据直接从SSH通道写入本地文件，远程磁盘上不落地
+    # 本地文件没有压缩扩展名时，传输时仍用gzip压缩，收到后在本地解压
+    # 先写到 <文件名>.tmp，导出成功后才替换目标文件，失败时不会破坏之前的导出文件
+    def _stream_remote_dump(self, arguments, sql_file_path):
+        compression = compression_of(sql_file_path)
+        decompressor = None if compression else zlib.decompressobj(zlib.MAX_WBITS | 16)
+        dump_command = self._mysql_client_command(self.remote_mysqldump_path, arguments)
+        command = self._pipefail_command(f"{dump_command} | {COMPRESS_COMMANDS[compression or 'gzip']}")
+
+        print(f"Streaming remote dump of {arguments} into {sql_file_path}...")
+        temp_path = sql_file_path + '.tmp'
+        with self.remote.session() as ssh:
+            _, stdout, stderr = ssh.exec_command(command)
+            errors = self._drain_stderr(stderr)
+            channel = stdout.channel
+            start_time = time.time()
+            received = 0
+            try:
+                with open(temp_path, 'wb') as file:
+                    while True:
+                        data = channel.recv(STREAM_CHUNK_SIZE)
+                        if not data:
+                            break
+                        received += len(data)
+                        file.write(decompressor.decompress(data) if decompressor else data)
+                    if decompressor:
+                        file.write(decompressor.flush())
+                exit_status = channel.recv_exit_status()
+                if exit_status != 0:
+                    raise Exception(f"Remote dump exited with status {exit_status}: {errors()}")
+                os.replace(temp_path, sql_file_path)
+            except BaseException:
+                channel.close()
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            elapsed = time.time() - start_time
+            print(f"Received {received / 1048576:.1f} MB compressed in {elapsed:.1f}s ({received / 1048576 / max(elapsed, 1e-6):.1f} MB/s).")
+
+    # 打开一个SSH执行通道运行mysql，把本地SQL文件分块写入它的标准输入，远程磁盘上不落地
+    # compress为True时用gzip压缩传输，远程解压后交给mysql；本地文件已经是.gz/.zst时原样传输，由远程解压
+    def _stream_sql_to_remote(self, sql_file_path, database_name='', compress=True):
+        compression = compression_of(sql_file_path)
+        compressor = None
+        if compression is None and compress:
+            compression = 'gzip'
+            compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        command = self._mysql_client_command(self.remote_mysql_path, database_name)
+        if compression is not None:
+            command = self._pipefail_command(f"{DECOMPRESS_COMMANDS[compression]} | {command}")
+
+        print(f"Streaming {sql_file_path} into remote mysql...")
+        with self.remote.session() as ssh:
+            stdin, stdout, stderr = ssh.exec_command(command)
+            errors = self._drain_stderr(stderr)
+            channel = stdin.channel
+            total = os.path.getsize(sql_file_path)
+            start_time = last_report = time.time()
+            read_bytes = sent_bytes = 0
+            with open(sql_file_path, 'rb') as file:
+                while True:
+                    data = file.read(STREAM_CHUNK_SIZE)
+                    if not data:
+                        break
+                    read_bytes += len(data)
+                    if compressor:
+                        data = compressor.compress(data)
+                    if data:
+                        channel.sendall(data)
+                        sent_bytes += len(data)
+                    if time.time() - last_report >= PROGRESS_INTERVAL:
+                        last_report = time.time()
+                        elapsed = last_report - start_time
+                        print(f"{read_bytes / 1048576:.1f}/{total / 1048576:.1f} MB ({read_bytes * 100 / max(total, 1):.0f}%), "
+                              f"{read_bytes / 1048576 / elapsed:.1f} MB/s, {sent_bytes / 1048576 / elapsed:.1f} MB/s on the wire")
+                if compressor:
+                    data = compressor.flush()
+                    channel.sendall(data)
+                    sent_bytes += len(data)
+            # 关闭写端，mysql读到EOF后才会退出
+            channel.shutdown_write()
+            exit_status = channel.recv_exit_status()
+            if exit_status != 0:
+                raise Exception(f"Remote mysql exited with status {exit_status}: {errors()}")
+            elapsed = time.time() - start_time
+            print(f"Streamed {read_bytes / 1048576:.1f} MB ({sent_bytes / 1048576:.1f} MB sent) in {elapsed:.1f}s "
+                  f"({read_bytes / 1048576 / max(elapsed, 1e-6):.1f} MB/s).")
+
     def create_user_and_grant_privileges(self, new_user, new_user_password, pri_database='*', pri_table='*', pri_host='%'):
         try:
             with self.engine.connect() as conn:
@@ -165,8 +400,7 @@ class MySQLDatabase:
     
     def create_table(self, database_name, table_name, fields):
         try:
-            with self.engine.connect() as conn:
-                conn.execute(text(f"USE {database_name}"))
+            with self.get_engine(database_name).connect() as conn:
                 field_definitions = ', '.join(fields)
                 conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table_name} ({field_definitions})"))
                 logging.info(f"Table '{table_name}' created successfully.")
@@ -176,8 +410,7 @@ class MySQLDatabase:
 
     def delete_table(self, database_name, table_name):
         try:
-            with self.engine.connect() as conn:
-                conn.execute(text(f"USE {database_name}"))
+            with self.get_engine(database_name).connect() as conn:
                 conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
             logging.info(f"Table '{table_name}' deleted successfully.")
         except SQLAlchemyError as e:
@@ -185,40 +418,45 @@ class MySQLDatabase:
             raise
 
     # 如果指定某库，那么，sql_file_path文件中的所有库和表都会被导入
-    def import_database(self, database_name, sql_file_path):
+    # parallel为True时不再通过mysql客户端单连接导入，而是用多个连接按表并行导入
+    # stream为True时远程导入不再先上传文件，而是通过SSH通道直接流式写入远程mysql
+    def import_database(self, database_name, sql_file_path, parallel=False, workers=4, stream=False):
+        if parallel:
+            return self.import_database_parallel(database_name, sql_file_path, workers=workers)
         if self.location_type == 'local':
             self.import_database_local(database_name, sql_file_path)
         elif self.location_type == 'remote':
-            self.import_database_remote(database_name, sql_file_path)
+            self.import_database_remote(database_name, sql_file_path, stream=stream)
         else:
             logging.error(f"Invalid location_type: {self.location_type}")
 
 
     def import_database_local(self, database_name, sql_file_path):
         try:
-            command = f"{self.local_mysql_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {database_name} < {sql_file_path}"
+            command = self._mysql_import_command(self.local_mysql_path, sql_file_path, database_name)
             subprocess.run(command, shell=True, check=True)
             logging.info(f"Database '{database_name}' imported successfully.")
         except Exception as e:
             logging.error(f"Error occurred while importing the database: {e}")
             raise
 
-    def import_database_remote(self, database_name, sql_file_path):
+    def import_database_remote(self, database_name, sql_file_path, stream=False, compress=True):
         attempt = 0
         while attempt < self.max_attempts:
             try:
+                if stream:
+                    self._stream_sql_to_remote(sql_file_path, database_name, compress=compress)
+                    logging.info(f"Database '{database_name}' imported successfully by streaming to remote server.")
+                    break
                 transfer = self.get_transfer()
                 # 上传时，远程要求是文件夹
                 transfer.upload(sql_file_path, "/tmp/")
                 # 导入时要求是文件下的数据文件
                 remote_sql_path = f"/tmp/{os.path.basename(sql_file_path)}"
-                command = f"{self.remote_mysql_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {database_name} < {remote_sql_path}"
-                stin, stout, error = self.execute_ssh_command(command)
-                
-                # 检查 error 变量
-                if error and "error" in error.lower():
-                    raise Exception(error)
-                
+                command = self._mysql_import_command(self.remote_mysql_path, remote_sql_path, database_name)
+                # 按退出码判断是否导入成功
+                self.run_ssh_command(command, check=True)
+
                 # 删除临时文件
                 delete_command = f"sudo rm {remote_sql_path}"
                 self.execute_ssh_command(delete_command)
@@ -234,6 +472,165 @@ class MySQLDatabase:
                     logging.error("Max retries reached. Failed to import database.")
                     raise
 
+    # 并行导入：借助索引把SQL文件按表拆成多个任务，先串行建表，再用workers个连接并发导入数据，最后创建触发器，
+    # 再按文件里的顺序创建视图、存储过程、函数和事件
+    # sql_file_path也可以是export_database_parallel导出的目录，这时按目录里的manifest.json导入
+    # defer_indexes为True时建表只保留主键，二级索引在数据导入完后按表并行建好
+    # 压缩的SQL文件不能按偏移seek，无法拆成并行任务，这时退回到mysql客户端单连接导入（边解压边导入）
+    def import_database_parallel(self, database_name, sql_file_path, workers=4, chunk_size=DEFAULT_CHUNK_SIZE, defer_indexes=True):
+        if os.path.isdir(sql_file_path):
+            return self.import_database_from_manifest(database_name, sql_file_path, workers, chunk_size, defer_indexes)
+        if compression_of(sql_file_path) is not None:
+            logging.warning(f"'{sql_file_path}' is compressed and cannot be imported in parallel, importing it with a single connection.")
+            return self.import_database(database_name, sql_file_path)
+        index = load_dump_index(sql_file_path, chunk_size)
+        # 文件里有同名的库时只导入这个库，只有一个库时导入到database_name下
+        tables = index_tables(index, database_name)
+        with open(sql_file_path, 'rb') as file:
+            session_statements = [statement.decode('utf-8') for statement in iter_range_statements(file, index['header'], chunk_size)]
+
+        schema_units, data_units, trigger_units = [], [], []
+        for table, entry in tables.items():
+            schema_units.append((table, sql_file_path, entry.get('drop', []) + entry.get('create', [])))
+            for byte_range in entry.get('insert', []):
+                data_units.append((table, sql_file_path, [byte_range]))
+            if entry.get('trigger'):
+                trigger_units.append((table, sql_file_path, entry['trigger']))
+        # 视图可能引用任何表，存储过程和事件也可能引用表，放在所有表和触发器之后，和export_database_parallel导出的目录一样
+        objects = index_objects(index, database_name)
+        if objects:
+            trigger_units.append(('objects', sql_file_path, objects))
+
+        return self._restore_parallel(database_name, session_statements, schema_units, data_units, trigger_units, workers, chunk_size,
+                                      defer_indexes)
+
+    def import_database_from_manifest(self, database_name, export_directory, workers=4, chunk_size=DEFAULT_CHUNK_SIZE,
+                                      defer_indexes=True):
+        with open(os.path.join(export_directory, MANIFEST_FILE_NAME), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+
+        def whole_file(file_name):
+            path = os.path.join(export_directory, file_name)
+            return path, [[0, os.path.getsize(path)]]
+
+        schema_units, data_units = [], []
+        for table, entry in manifest['tables'].items():
+            schema_units.append((table,) + whole_file(entry['schema']))
+            for chunk in entry['chunks']:
+                data_units.append((table,) + whole_file(chunk['file']))
+        # 存储过程、视图、触发器在数据导入完后按清单里的顺序创建
+        object_units = [(file_name,) + whole_file(file_name) for file_name in manifest.get('objects', [])]
+
+        return self._restore_parallel(database_name, manifest.get('session', []), schema_units, data_units, object_units, workers,
+                                      chunk_size, defer_indexes)
+
+    # 每个导入会话先恢复SQL文件头部的会话设置，再关闭外键和唯一性检查
+    def _open_restore_session(self, database_name, session_statements):
+        connection = self.get_engine(database_name).raw_connection()
+        # 改过会话设置的连接不能回到连接池给别人用，必须在改设置之前脱离连接池，关闭时直接断开
+        connection.detach()
+        try:
+            with connection.cursor() as cursor:
+                for statement in session_statements:
+                    cursor.execute(statement)
+                cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 0, SESSION UNIQUE_CHECKS = 0")
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    # indexes不为None时，建表语句去掉二级索引后执行，去掉的索引定义按表名记到indexes里
+    def _execute_unit(self, connection, sql_file_path, ranges, chunk_size, indexes=None):
+        with open(sql_file_path, 'rb') as file, connection.cursor() as cursor:
+            for statement in iter_range_statements(file, ranges, chunk_size):
+                if indexes is not None:
+                    kind, name = classify_statement(statement)
+                    if kind == 'create':
+                        statement, indexes[name] = split_secondary_indexes(statement.decode('utf-8'))
+                        cursor.execute(statement)
+                        continue
+                cursor.execute(statement.decode('utf-8'))
+        connection.commit()
+
+    def _restore_unit(self, database_name, session_statements, unit, chunk_size):
+        _, sql_file_path, ranges = unit
+        start_time = time.time()
+        connection = self._open_restore_session(database_name, session_statements)
+        try:
+            self._execute_unit(connection, sql_file_path, ranges, chunk_size)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        return time.time() - start_time
+
+    def _restore_parallel(self, database_name, session_statements, schema_units, data_units, trigger_units, workers, chunk_size,
+                          defer_indexes=True):
+        start_time = time.time()
+        report = {}
+        indexes = {} if defer_indexes else None
+
+        # 建表必须在导入数据之前完成，所以在一个会话里串行执行
+        connection = self._open_restore_session(database_name, session_statements)
+        try:
+            for table, sql_file_path, ranges in schema_units:
+                self._execute_unit(connection, sql_file_path, ranges, chunk_size, indexes)
+                report[table] = {'bytes': 0, 'seconds': 0.0, 'units': 0}
+        finally:
+            connection.close()
+        print(f"Created {len(schema_units)} tables in {time.time() - start_time:.1f}s.")
+
+        # 大的任务先导入，避免最后只剩一个大表在单连接上跑
+        data_units = sorted(data_units, key=lambda unit: sum(byte_range[1] - byte_range[0] for byte_range in unit[2]), reverse=True)
+        pending = {}
+        for table, _, _ in data_units:
+            pending[table] = pending.get(table, 0) + 1
+            report.setdefault(table, {'bytes': 0, 'seconds': 0.0, 'units': 0})
+
+        total_bytes = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._restore_unit, database_name, session_statements, unit, chunk_size): unit for unit in data_units}
+            for done, future in enumerate(as_completed(futures), 1):
+                table, _, ranges = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    logging.error(f"Error occurred while importing table '{table}': {e}")
+                    for other in futures:
+                        other.cancel()
+                    raise
+                unit_bytes = sum(byte_range[1] - byte_range[0] for byte_range in ranges)
+                total_bytes += unit_bytes
+                table_report = report[table]
+                table_report['bytes'] += unit_bytes
+                table_report['seconds'] += seconds
+                table_report['units'] += 1
+                pending[table] -= 1
+                elapsed = time.time() - start_time
+                print(f"[{done}/{len(data_units)}] {table}: {unit_bytes / 1048576:.1f} MB in {seconds:.1f}s "
+                      f"({unit_bytes / 1048576 / max(seconds, 1e-6):.1f} MB/s), total {total_bytes / 1048576 / max(elapsed, 1e-6):.1f} MB/s")
+                if pending[table] == 0:
+                    logging.info(f"Table '{table}' imported: {table_report['bytes'] / 1048576:.1f} MB in {table_report['units']} units.")
+
+        # 数据全部导入后再建二级索引，每张表一条ALTER TABLE，不同的表并行建
+        if indexes:
+            self._build_deferred_indexes(database_name, indexes, workers)
+
+        # 触发器放在数据之后创建，避免导入数据时被触发
+        if trigger_units:
+            connection = self._open_restore_session(database_name, session_statements)
+            try:
+                for table, sql_file_path, ranges in trigger_units:
+                    self._execute_unit(connection, sql_file_path, ranges, chunk_size)
+            finally:
+                connection.close()
+
+        elapsed = time.time() - start_time
+        print(f"Database '{database_name}' imported in parallel: {total_bytes / 1048576:.1f} MB in {elapsed:.1f}s "
+              f"({total_bytes / 1048576 / max(elapsed, 1e-6):.1f} MB/s) with {workers} connections.")
+        return report
+
     # 如果指定库，还指定表，那么，必须解析sql_file_path文件提取指定的库和指定表的语句，再执行导入操作
     def import_table(self, database_name, table_name, sql_file_path):
         if self.location_type == 'local':
@@ -243,45 +640,206 @@ class MySQLDatabase:
         else:
             logging.error(f"Invalid location_type: {self.location_type}")
 
-    def extract_table_sql(self, sql_file_path, table_name):
-        with open(sql_file_path, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
+    # 流式提取指定表（可以是一个表名，也可以是表名列表）的建表和插入语句，逐条产出，不会把整个文件读入内存
+    # use_index为True时，第一次会扫描整个文件并在旁边生成索引文件（目录不可写时只在内存里使用），之后直接 seek 到表所在的字节范围，不再从头扫描
+    # 文件里有多个库时用database指定从哪个库里提取，文件里只有一个库时可以不指定
+    def extract_table_sql(self, sql_file_path, table_name, chunk_size=DEFAULT_CHUNK_SIZE, use_index=True, include_triggers=False,
+                          database=None):
+        table_names = [table_name] if isinstance(table_name, str) else list(table_name)
+        kinds = ('create', 'insert', 'trigger') if include_triggers else ('create', 'insert')
+        for _, _, statement in self._iter_table_statements(sql_file_path, table_names, kinds, chunk_size, use_index, database):
+            yield statement.decode('utf-8')
 
-        table_sql = []
-        in_table = False
+    # 逐条产出 (类型, 表名, 语句字节串)，有索引时直接seek到各表的语句
+    def _iter_table_statements(self, sql_file_path, table_names, kinds, chunk_size=DEFAULT_CHUNK_SIZE, use_index=True, database=None):
+        # 压缩文件不能seek，只能流式扫描
+        if use_index and compression_of(sql_file_path) is None:
+            tables = index_tables(load_dump_index(sql_file_path, chunk_size), database)
+            with open(sql_file_path, 'rb') as file:
+                for name in table_names:
+                    entry = tables.get(name, {})
+                    for kind in kinds:
+                        for statement in iter_range_statements(file, entry.get(kind, []), chunk_size):
+                            yield kind, name, statement
+            return
 
-        for line in lines:
-            if line.strip().startswith(f"CREATE TABLE `{table_name}`") or line.strip().startswith(f"INSERT INTO `{table_name}`"):
-                in_table = True
-            if in_table:
-                table_sql.append(line)
-                if line.strip().endswith(';'):
-                    in_table = False
+        # 流式扫描时事先不知道文件里有哪些库：指定了库时只取这个库（和没有库名）的语句，
+        # 没有指定时每个表只取它第一次出现的那个库的语句，不会把不同库里的同名表混在一起
+        sources = {}
+        with open_sql_file(sql_file_path) as file:
+            for _, _, statement, kind, source, name in iter_classified_statements(file, chunk_size):
+                if kind not in kinds or name not in table_names:
+                    continue
+                if database is not None:
+                    if source not in (database, ''):
+                        continue
+                elif sources.setdefault(name, source) != source:
+                    continue
+                yield kind, name, statement
 
-        return ''.join(table_sql)
+    # 在同一个连接上逐条执行语句，用原生连接执行可以避免sqlalchemy的text()把数据里的冒号当成参数
+    # 每执行commit_every条语句提交一次，出错时只回滚最后没有提交的部分
+    def _execute_statements(self, database_name, statements, commit_every=IMPORT_COMMIT_STATEMENTS):
+        with self.raw_connection(database_name) as connection:
+            try:
+                with connection.cursor() as cursor:
+                    for count, statement in enumerate(statements, 1):
+                        cursor.execute(statement)
+                        if commit_every and count % commit_every == 0:
+                            connection.commit()
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
 
-    def import_table_local(self, database_name, table_name, sql_file_path):
+    # swap为True时导入到影子表后原子替换原表，导入期间原表一直可读，见reload_table_local
+    # defer_indexes为True时二级索引在数据导入完后再建，建索引失败时数据已经导入，表上没有这些索引，错误信息里列出缺少的索引
+    # SQL文件里有多个库时，用source_database指定表来自哪个库
+    def import_table_local(self, database_name, table_name, sql_file_path, swap=False, defer_indexes=False, source_database=None):
+        if swap:
+            return self.reload_table_local(database_name, table_name, sql_file_path, defer_indexes, source_database)
         try:
-            # 提取指定表的SQL语句
-            table_sql = self.extract_table_sql(sql_file_path, table_name)
-            if not table_sql:
+            # 提取指定表的SQL语句，这里只是生成器，执行时才会边读边导入
+            table_names = [table_name] if isinstance(table_name, str) else list(table_name)
+            statements = self._iter_table_statements(sql_file_path, table_names, ('create', 'insert'), database=source_database)
+            first_statement = next(statements, None)
+            if first_statement is None:
                 logging.error(f"No SQL statements found for table '{table_name}' in file '{sql_file_path}'")
                 return
 
             # 删除表（如果存在）
-            self.delete_table(database_name, table_name)
+            for name in table_names:
+                self.delete_table(database_name, name)
+
+            # defer_indexes为True时建表语句去掉二级索引，只保留主键（和外键需要的索引），数据导入完后再一次建好
+            indexes = {}
+
+            def prepared_statements():
+                for kind, name, statement in itertools.chain([first_statement], statements):
+                    statement = statement.decode('utf-8')
+                    if kind == 'create' and defer_indexes:
+                        statement, indexes[name] = split_secondary_indexes(statement)
+                    yield statement
 
             # 连接到数据库并执行SQL语句
-            with self.engine.connect() as conn:
-                conn.execute(text(f"USE {database_name}"))
-                for statement in table_sql.split(';'):
-                    if statement.strip():
-                        conn.execute(text(statement))
+            self._execute_statements(database_name, prepared_statements())
+            self._build_deferred_indexes(database_name, indexes)
             logging.info(f"Table '{table_name}' imported successfully.")
         except Exception as e:
             logging.error(f"Error occurred while importing the table: {e}")
             raise
        
+    # 不停机地重新导入一张表：建表语句和数据都导入到影子表 <表名>__new，defer_indexes为True时二级索引在数据导入完后用一条ALTER TABLE一次建好，
+    # 最后用RENAME TABLE原子地替换原表；任何一步失败都只删除影子表，原表不受影响
+    # 外键在替换后加到新表上；SQL文件里有这张表的触发器时用文件里的触发器，没有时保留原表的触发器
+    # 其他表有外键引用原表、或者 <表名>__old 已经存在时不能这样替换，开始导入前就报错
+    def reload_table_local(self, database_name, table_name, sql_file_path, defer_indexes=True, source_database=None):
+        shadow_table = table_name + SHADOW_TABLE_SUFFIX
+        start_time = time.time()
+        with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+            if self._table_exists(cursor, table_name):
+                self._check_swappable(cursor, table_name)
+        self.delete_table(database_name, shadow_table)
+        indexes = []
+        foreign_keys = []
+        triggers = []
+        created = False
+        statements = 0
+        connection = self._open_restore_session(database_name, [])
+        try:
+            with connection.cursor() as cursor:
+                for kind, _, statement in self._iter_table_statements(sql_file_path, [table_name], ('create', 'insert', 'trigger'),
+                                                                      database=source_database):
+                    if kind == 'trigger':
+                        # 触发器建在原表名上，替换之后才能创建
+                        triggers.append((None, statement.decode('utf-8')))
+                        continue
+                    statement = rename_statement_table(statement, shadow_table).decode('utf-8')
+                    if kind == 'create':
+                        statement, foreign_keys = split_foreign_keys(statement)
+                        if defer_indexes:
+                            statement, indexes = split_secondary_indexes(statement)
+                        cursor.execute(statement)
+                        created = True
+                        continue
+                    cursor.execute(statement)
+                    statements += 1
+                    if statements % IMPORT_COMMIT_STATEMENTS == 0:
+                        connection.commit()
+                connection.commit()
+                if not created:
+                    raise ValueError(f"No CREATE TABLE statement found for table '{table_name}' in file '{sql_file_path}'")
+                load_seconds = time.time() - start_time
+                self._add_indexes(cursor, shadow_table, indexes)
+        except Exception as e:
+            connection.rollback()
+            connection.close()
+            logging.error(f"Error occurred while reloading the table '{table_name}', the original table is untouched: {e}")
+            self.delete_table(database_name, shadow_table)
+            raise
+        connection.close()
+        try:
+            self._swap_table(database_name, table_name, shadow_table, foreign_keys, triggers or None)
+        except Exception:
+            self.delete_table(database_name, shadow_table)
+            raise
+        print(f"Table '{table_name}' reloaded in {time.time() - start_time:.1f}s (data {load_seconds:.1f}s, "
+              f"{len(indexes)} indexes {time.time() - start_time - load_seconds:.1f}s).")
+
+    @staticmethod
+    def _add_indexes(cursor, table_name, definitions):
+        # 所有二级索引用一条ALTER TABLE添加，表数据只扫描一遍；InnoDB一条ALTER只能新建一个全文索引，全文索引分开添加
+        fulltext = [definition for definition in definitions if definition.upper().startswith('FULLTEXT')]
+        others = [definition for definition in definitions if definition not in fulltext]
+        for group in ([others] if others else []) + [[definition] for definition in fulltext]:
+            cursor.execute(f"ALTER TABLE `{table_name}` " + ', '.join(f"ADD {definition}" for definition in group))
+
+    # 数据导入完后补建推迟的二级索引，indexes是 {表名: 索引定义列表}，不同的表用各自的连接同时建，最多workers个
+    # 有表建失败时等其他表建完，再抛出RuntimeError列出没有建好索引的表和缺少的索引定义，数据已经导入，不删除这些表
+    def _build_deferred_indexes(self, database_name, indexes, workers=1):
+        indexes = {table: definitions for table, definitions in indexes.items() if definitions}
+        if not indexes:
+            return
+        start_time = time.time()
+
+        def build(table):
+            with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+                self._add_indexes(cursor, table, indexes[table])
+
+        failed = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(indexes)))) as executor:
+            futures = {executor.submit(build, table): table for table in indexes}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Error occurred while building indexes of table '{futures[future]}': {e}")
+                    failed[futures[future]] = e
+        if failed:
+            details = '; '.join(f"'{table}' ({error}), missing: {', '.join(indexes[table])}" for table, error in failed.items())
+            raise RuntimeError(f"Data was imported but the secondary indexes of {len(failed)} table(s) could not be built, "
+                               f"the tables are left without them: {details}")
+        print(f"Built {sum(len(definitions) for definitions in indexes.values())} secondary indexes on {len(indexes)} tables "
+              f"in {time.time() - start_time:.1f}s.")
+
+    @staticmethod
+    def _drop_secondary_indexes(cursor, table_name, keep_unique=False):
+        # 删除已有表的二级索引（外键需要的除外），返回删除的索引定义，数据导入完后用_add_indexes加回来
+        # keep_unique为True时保留唯一索引，写入期间仍然检查重复
+        cursor.execute(f"SHOW CREATE TABLE `{table_name}`")
+        _, indexes = split_secondary_indexes(cursor.fetchone()[1])
+        if keep_unique:
+            indexes = [definition for definition in indexes if not definition.upper().startswith('UNIQUE')]
+        if indexes:
+            cursor.execute(f"ALTER TABLE `{table_name}` " + ', '.join(f"DROP INDEX `{index_name(definition)}`" for definition in indexes))
+        return indexes
+
+    @staticmethod
+    def _table_exists(cursor, table_name):
+        cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                       (table_name,))
+        return bool(cursor.fetchone()[0])
+
     def import_table_remote(self, database_name, table_name, sql_file_path):
         try:
             #sq_file_path提供的是数据库文件，它既可以在远程，也可以在本地提供
@@ -291,7 +849,7 @@ class MySQLDatabase:
             if stdout.strip() == 'true':
                 logging.info(f"Importing existing remote SQL file: {sql_file_path} to table: {table_name} in database: {database_name}")
                 # 提取指定表的SQL语句
-                table_sql = self.extract_table_sql(sql_file_path, table_name)
+                table_sql = ';\n'.join(self.extract_table_sql(sql_file_path, table_name))
                 if not table_sql:
                     logging.error(f"No SQL statements found for table '{table_name}' in file '{sql_file_path}'")
                     return
@@ -301,7 +859,7 @@ class MySQLDatabase:
 
                 # 执行导入命令
                 command = f"{self.remote_mysql_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {database_name} -e \"{table_sql}\""
-                self.execute_ssh_command(command)
+                self.run_ssh_command(command, check=True)
                 logging.info(f"Table '{table_name}' imported successfully to remote server.")
             else:
                 logging.info(f"SQL file: {sql_file_path} does not exist remotely, uploading from local.")
@@ -310,7 +868,7 @@ class MySQLDatabase:
                 transfer.upload(sql_file_path, sql_file_path)
 
                 # 提取指定表的SQL语句
-                table_sql = self.extract_table_sql(sql_file_path, table_name)
+                table_sql = ';\n'.join(self.extract_table_sql(sql_file_path, table_name))
                 if not table_sql:
                     logging.error(f"No SQL statements found for table '{table_name}' in file '{sql_file_path}'")
                     return
@@ -320,14 +878,17 @@ class MySQLDatabase:
 
                 # 执行导入命令
                 command = f"{self.remote_mysql_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {database_name} -e \"{table_sql}\""
-                self.execute_ssh_command(command)
+                self.run_ssh_command(command, check=True)
                 logging.info(f"Table '{table_name}' imported successfully to remote server.")
         except Exception as e:
             logging.error(f"Error occurred while importing the table to remote server: {e}")
             raise
            
     
-    def export_database(self, database_name, sql_file_path):
+    # parallel为True时sql_file_path是一个目录，每个表按主键范围切块并行导出，目录里还有一个manifest.json
+    def export_database(self, database_name, sql_file_path, parallel=False, workers=4):
+        if parallel:
+            return self.export_database_parallel(database_name, sql_file_path, workers=workers)
         if self.location_type == 'local':
             self.export_database_local(database_name, sql_file_path)
         elif self.location_type == 'remote':
@@ -337,7 +898,7 @@ class MySQLDatabase:
     # 导入指定库
     def export_database_local(self, database_name, sql_file_path):
         try:
-            command = f"{self.local_mysqldump_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {database_name} > {sql_file_path}"
+            command = self._mysqldump_export_command(self.local_mysqldump_path, database_name, sql_file_path)
             subprocess.run(command, shell=True, check=True)
             logging.info(f"Database '{database_name}' exported successfully.")
         except Exception as e:
@@ -346,19 +907,254 @@ class MySQLDatabase:
      
     def export_database_remote(self, database_name, sql_file_path):
         try:
-            # 在远程服务器上执行导出命令
-            remote_sql_file_path = os.path.join('/tmp', os.path.basename(sql_file_path))
-            command = f"{self.remote_mysqldump_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {database_name} > {remote_sql_file_path}"
-            self.execute_ssh_command(command)
-
-            # 下载SQL文件到本地
-            transfer = self.get_transfer()
-            transfer.download(remote_sql_file_path, sql_file_path)
+            # 在远程服务器上执行导出命令，压缩后直接流式写入本地文件
+            self._stream_remote_dump(database_name, sql_file_path)
             logging.info(f"Database '{database_name}' exported successfully from remote server.")
         except Exception as e:
             logging.error(f"Error occurred while exporting the database from remote server: {e}")
             raise
          
+    # 并行导出：在全局读锁下给每个工作连接开启一致性快照，解锁后各连接在同一个快照里并发导出各表的数据块
+    # 存储过程、函数、视图和触发器也会导出，事件（EVENT）不导出，清单的not_exported里会注明
+    def export_database_parallel(self, database_name, export_directory, workers=4, chunk_rows=500000, rows_per_statement=1000):
+        os.makedirs(export_directory, exist_ok=True)
+        start_time = time.time()
+        session_statements = ["SET NAMES utf8mb4", "SET TIME_ZONE = '+00:00'"]
+
+        connections = []
+        lock_connection = self.engine.raw_connection()
+        try:
+            with lock_connection.cursor() as lock_cursor:
+                lock_cursor.execute("FLUSH TABLES WITH READ LOCK")
+                try:
+                    for _ in range(workers):
+                        connection = self.engine.raw_connection()
+                        # 改过时区和隔离级别的连接不回到连接池
+                        connection.detach()
+                        connections.append(connection)
+                        with connection.cursor() as cursor:
+                            for statement in session_statements:
+                                cursor.execute(statement)
+                            cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+                    binlog = self._binlog_position(lock_cursor)
+                finally:
+                    lock_cursor.execute("UNLOCK TABLES")
+        except Exception:
+            for connection in connections:
+                connection.close()
+            raise
+        finally:
+            lock_connection.close()
+        print(f"Consistent snapshot started on {workers} connections.")
+
+        try:
+            # 在快照内规划任务：每个表一个建表文件，数据按主键范围切成多个文件
+            tasks = []
+            manifest_tables = {}
+            with connections[0].cursor() as cursor:
+                cursor.execute(f"SHOW FULL TABLES FROM `{database_name}` WHERE Table_type = 'BASE TABLE'")
+                tables = [row[0] for row in cursor.fetchall()]
+                for table in tables:
+                    cursor.execute(f"SHOW CREATE TABLE `{database_name}`.`{table}`")
+                    schema_file = f"{table}.schema.sql"
+                    with open(os.path.join(export_directory, schema_file), 'w', encoding='utf-8') as file:
+                        file.write(f"DROP TABLE IF EXISTS `{table}`;\n{cursor.fetchone()[1]};\n")
+
+                    conditions = [None]
+                    primary_key = self._get_integer_primary_key(cursor, database_name, table)
+                    if primary_key is not None:
+                        cursor.execute(f"SELECT MIN(`{primary_key}`), MAX(`{primary_key}`) FROM `{database_name}`.`{table}`")
+                        low, high = cursor.fetchone()
+                        cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                                       (database_name, table))
+                        estimated_rows = cursor.fetchone()[0] or 0
+                        parts = max(1, -(-estimated_rows // chunk_rows))
+                        if low is not None and parts > 1:
+                            conditions = [self._key_range_condition(primary_key, start, stop)
+                                          for start, stop in self._split_key_range(low, high, parts)]
+
+                    manifest_tables[table] = {'schema': schema_file, 'primary_key': primary_key, 'chunks': []}
+                    for number, condition in enumerate(conditions, 1):
+                        chunk_file = f"{table}.{number:05d}.sql"
+                        tasks.append((table, condition, chunk_file))
+                        manifest_tables[table]['chunks'].append({'file': chunk_file, 'condition': condition})
+
+                objects, not_exported = self._export_objects(cursor, database_name, export_directory)
+
+            # 每个工作线程从队列里取一个快照连接，保证所有数据块都来自同一个快照
+            idle_connections = queue.Queue()
+            for connection in connections:
+                idle_connections.put(connection)
+            chunk_results = {}
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self._export_chunk, idle_connections, database_name, table, condition,
+                                           os.path.join(export_directory, chunk_file), rows_per_statement): chunk_file
+                           for table, condition, chunk_file in tasks}
+                for done, future in enumerate(as_completed(futures), 1):
+                    chunk_file = futures[future]
+                    try:
+                        rows, seconds = future.result()
+                    except Exception as e:
+                        logging.error(f"Error occurred while exporting '{chunk_file}': {e}")
+                        for other in futures:
+                            other.cancel()
+                        raise
+                    chunk_results[chunk_file] = rows
+                    print(f"[{done}/{len(tasks)}] {chunk_file}: {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-6):.0f} rows/s)")
+        finally:
+            for connection in connections:
+                connection.rollback()
+                connection.close()
+
+        for entry in manifest_tables.values():
+            for chunk in entry['chunks']:
+                chunk['rows'] = chunk_results[chunk['file']]
+        manifest = {
+            'database': database_name,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'binlog': binlog,
+            'session': session_statements,
+            'tables': manifest_tables,
+            'objects': objects,
+            'not_exported': not_exported,
+        }
+        with open(os.path.join(export_directory, MANIFEST_FILE_NAME), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2)
+
+        total_rows = sum(chunk_results.values())
+        logging.info(f"Database '{database_name}' exported in parallel: {len(tasks)} chunks, {total_rows} rows in {time.time() - start_time:.1f}s.")
+        return manifest
+
+    @staticmethod
+    def _binlog_position(cursor):
+        # 记录快照对应的binlog位置，只是附带信息：MySQL 8.4去掉了SHOW MASTER STATUS，改用SHOW BINARY LOG STATUS，
+        # 没有REPLICATION CLIENT权限时两个都会失败，这时返回None，不影响导出
+        for statement in ("SHOW MASTER STATUS", "SHOW BINARY LOG STATUS"):
+            try:
+                cursor.execute(statement)
+                row = cursor.fetchone()
+            except pymysql.MySQLError as e:
+                error = e
+                continue
+            return {'file': row[0], 'position': row[1]} if row else None
+        logging.warning(f"Cannot read the binary log position, it is not recorded in the manifest: {error}")
+        return None
+
+    # 把存储过程、函数、视图和触发器的定义写到OBJECT_FILE_NAMES里的文件，返回 (按创建顺序排列的文件名列表, 没有导出的对象说明列表)
+    def _export_objects(self, cursor, database_name, export_directory):
+        # 默认库设成导出的库，SHOW CREATE VIEW输出的定义里本库的表就不带库名，可以导入到别的库名下
+        cursor.execute(f"USE `{database_name}`")
+        not_exported = ['events']
+        definitions = {'routines': [], 'views': [], 'triggers': []}
+
+        for kind in ('PROCEDURE', 'FUNCTION'):
+            cursor.execute(f"SHOW {kind} STATUS WHERE Db = %s", (database_name,))
+            for name in [row[1] for row in cursor.fetchall()]:
+                cursor.execute(f"SHOW CREATE {kind} `{name}`")
+                body = cursor.fetchone()[2]
+                if body is None:
+                    # 没有权限查看定义时SHOW CREATE返回NULL
+                    logging.warning(f"No privilege to read the definition of {kind.lower()} '{name}', it is not exported.")
+                    not_exported.append(f"{kind.lower()} {name}")
+                    continue
+                definitions['routines'].append(f"DROP {kind} IF EXISTS `{name}`;\nDELIMITER ;;\n{body};;\nDELIMITER ;\n")
+
+        cursor.execute(f"SHOW FULL TABLES FROM `{database_name}` WHERE Table_type = 'VIEW'")
+        views = {}
+        for name in [row[0] for row in cursor.fetchall()]:
+            cursor.execute(f"SHOW CREATE VIEW `{name}`")
+            views[name] = cursor.fetchone()[1]
+        for name in self._order_views(views):
+            definitions['views'].append(f"DROP VIEW IF EXISTS `{name}`;\n{views[name]};\n")
+
+        cursor.execute(f"SHOW TRIGGERS FROM `{database_name}`")
+        for name in [row[0] for row in cursor.fetchall()]:
+            cursor.execute(f"SHOW CREATE TRIGGER `{name}`")
+            body = cursor.fetchone()[2]
+            definitions['triggers'].append(f"DROP TRIGGER IF EXISTS `{name}`;\nDELIMITER ;;\n{body};;\nDELIMITER ;\n")
+
+        objects = []
+        for kind, file_name in OBJECT_FILE_NAMES.items():
+            if definitions[kind]:
+                with open(os.path.join(export_directory, file_name), 'w', encoding='utf-8') as file:
+                    file.write(''.join(definitions[kind]))
+                objects.append(file_name)
+        return objects, not_exported
+
+    @staticmethod
+    def _order_views(views):
+        # 被引用的视图排在引用它的视图前面，views是 {视图名: 建视图语句}
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered or name in visiting:
+                return
+            visiting.add(name)
+            for other in views:
+                if other != name and f"`{other}`" in views[name]:
+                    visit(other)
+            ordered.append(name)
+
+        for name in views:
+            visit(name)
+        return ordered
+
+    # 只有单列整数主键才能按范围切块，其他情况返回None
+    def _get_integer_primary_key(self, cursor, database_name, table_name):
+        cursor.execute("SELECT k.COLUMN_NAME, c.DATA_TYPE FROM information_schema.KEY_COLUMN_USAGE k "
+                       "JOIN information_schema.COLUMNS c ON c.TABLE_SCHEMA = k.TABLE_SCHEMA AND c.TABLE_NAME = k.TABLE_NAME AND c.COLUMN_NAME = k.COLUMN_NAME "
+                       "WHERE k.TABLE_SCHEMA = %s AND k.TABLE_NAME = %s AND k.CONSTRAINT_NAME = 'PRIMARY' ORDER BY k.ORDINAL_POSITION",
+                       (database_name, table_name))
+        rows = cursor.fetchall()
+        if len(rows) == 1 and rows[0][1].lower() in ('tinyint', 'smallint', 'mediumint', 'int', 'bigint'):
+            return rows[0][0]
+        return None
+
+    # 把 [low, high] 切成parts段，返回 (start, stop) 列表，stop不包含在内，最后一段的stop为None
+    @staticmethod
+    def _split_key_range(low, high, parts):
+        span = high - low + 1
+        parts = max(1, min(parts, span))
+        bounds = [low + span * i // parts for i in range(parts)]
+        return [(bounds[i], bounds[i + 1] if i + 1 < parts else None) for i in range(parts)]
+
+    @staticmethod
+    def _key_range_condition(column, start, stop):
+        if stop is None:
+            return f"`{column}` >= {start}"
+        return f"`{column}` >= {start} AND `{column}` < {stop}"
+
+    @staticmethod
+    def _sql_literal(connection, value):
+        # 二进制值写成十六进制字面量：pymysql转义bytes得到的字符串里含有代理字符，不能按utf-8写入文件，导入时也不能按utf-8解码
+        if isinstance(value, (bytes, bytearray)):
+            return f"X'{value.hex()}'"
+        return connection.escape(value)
+
+    def _export_chunk(self, idle_connections, database_name, table, condition, chunk_path, rows_per_statement):
+        start_time = time.time()
+        connection = idle_connections.get()
+        rows = 0
+        try:
+            # 用流式游标逐行读取，写成多行INSERT语句
+            with connection.cursor(pymysql.cursors.SSCursor) as cursor, open(chunk_path, 'w', encoding='utf-8') as file:
+                query = f"SELECT * FROM `{database_name}`.`{table}`"
+                if condition:
+                    query += f" WHERE {condition}"
+                cursor.execute(query)
+                while True:
+                    batch = cursor.fetchmany(rows_per_statement)
+                    if not batch:
+                        break
+                    values = ','.join('(' + ','.join(self._sql_literal(connection, value) for value in row) + ')' for row in batch)
+                    file.write(f"INSERT INTO `{table}` VALUES {values};\n")
+                    rows += len(batch)
+        finally:
+            idle_connections.put(connection)
+        return rows, time.time() - start_time
+
     # 导入指定表，不同于导入，他可以直接在命令行指定要导入的表
     def export_table(self, database_name, table_name, sql_file_path):
         if self.location_type == 'local':
@@ -370,7 +1166,7 @@ class MySQLDatabase:
 
     def export_table_local(self, database_name, table_name, sql_file_path):
         try:
-            command = f"{self.local_mysqldump_path} -u {self.mysqlusername} -p{self.password} -h {self.mysqlhost} --port={self.mysqlport} {database_name} {table_name} > {sql_file_path}"
+            command = self._mysqldump_export_command(self.local_mysqldump_path, f"{database_name} {table_name}", sql_file_path)
             subprocess.run(command, shell=True, check=True)
             logging.info(f"Table '{table_name}' in database '{database_name}' exported successfully.")
         except Exception as e:
@@ -379,14 +1175,8 @@ class MySQLDatabase:
  
     def export_table_remote(self, database_name, table_name, sql_file_path):
         try:
-            # 在远程服务器上执行导出命令
-            remote_sql_file_path = os.path.join('/tmp', os.path.basename(sql_file_path))
-            command = f"{self.remote_mysqldump_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} {database_name} {table_name} > {remote_sql_file_path}"
-            self.execute_ssh_command(command)
-
-            # 下载SQL文件到本地
-            transfer = self.get_transfer()
-            transfer.download(remote_sql_file_path, sql_file_path)
+            # 在远程服务器上执行导出命令，压缩后直接流式写入本地文件
+            self._stream_remote_dump(f"{database_name} {table_name}", sql_file_path)
             logging.info(f"Table '{table_name}' in database '{database_name}' exported successfully from remote server.")
         except Exception as e:
             logging.error(f"Error occurred while exporting the table from remote server: {e}")
@@ -399,12 +1189,13 @@ class MySQLDatabase:
 
         if self.location_type == 'local':
             result = subprocess.run(command_show_dbs, shell=True, capture_output=True, text=True)
-            output = result.stdout
-            error = result.stderr
+            exit_status, output, error = result.returncode, result.stdout, result.stderr
         else:
-            _, output, error = self.execute_ssh_command(command_show_dbs)
+            result = self.run_ssh_command(command_show_dbs)
+            exit_status, output, error = result.exit_status, result.stdout, result.stderr
 
-        if error.strip() and 'Using a password on the command line interface can be insecure' not in error:
+        # mysql在命令行里带密码时总会在stderr里输出警告，所以只看退出码
+        if exit_status != 0:
             raise Exception(f"Error fetching databases: {error}")
 
         if not output.strip():
@@ -431,9 +1222,8 @@ class MySQLDatabase:
                         return
 
                     database_list = ' '.join(databases)
-                    command = (f"{self.local_mysqldump_path} -u {self.mysqlusername} "
-                               f"-p{self.mysqlpassword} -h {self.mysqlhost} "
-                               f"--port={self.mysqlport} --add-drop-database --databases {database_list} > {sql_file_path}")
+                    command = self._mysqldump_export_command(self.local_mysqldump_path,
+                                                             f"--add-drop-database --databases {database_list}", sql_file_path)
                     subprocess.run(command, shell=True, check=True)
                     logging.info(f"All databases exported successfully.")
                 except Exception as e:
@@ -446,22 +1236,8 @@ class MySQLDatabase:
                         print("No databases found or failed to connect to the MySQL server.")
                         return
 
-                    remote_sql_file_path = os.path.join('/tmp', os.path.basename(sql_file_path))
                     database_list = ' '.join(databases)
-                    remote_command = (f"{self.remote_mysqldump_path} -u{self.mysqlusername} "
-                                      f"-p{self.mysqlpassword} -h {self.mysqlhost} "
-                                      f"--port={self.mysqlport} --add-drop-database --databases {database_list} > {remote_sql_file_path}")
-                    print(f"Executing remote command to export databases: {remote_command}")
-                    _, output, error = self.execute_ssh_command(remote_command)
-
-                    print(f"Remote command export output: {output}")
-                    print(f"Remote command export error output: {error}")
-
-                    if error.strip() and 'Using a password on the command line interface can be insecure' not in error:
-                        raise Exception(f"Error exporting databases remotely: {error}")
-
-                    transfer = self.get_transfer()
-                    transfer.download(remote_sql_file_path, '/tmp')
+                    self._stream_remote_dump(f"--add-drop-database --databases {database_list}", sql_file_path)
 
                     print(f"All databases exported successfully from remote server.")
                 except Exception as e:
@@ -471,24 +1247,25 @@ class MySQLDatabase:
             logging.error(f"Error occurred while exporting all databases: {e}")
             raise
 
-    def import_all_databases_from_sql_file(self, sql_file_path):
+    def import_all_databases_from_sql_file(self, sql_file_path, stream=False, compress=True):
         try:
             if self.location_type == 'local':
-                command = f"{self.local_mysql_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} < {sql_file_path}"
+                command = self._mysql_import_command(self.local_mysql_path, sql_file_path)
                 subprocess.run(command, shell=True, check=True)
 
             elif self.location_type == 'remote':
                 attempt = 0
                 while attempt < self.max_attempts:
                     try:
+                        if stream:
+                            self._stream_sql_to_remote(sql_file_path, compress=compress)
+                            logging.info("All databases imported successfully by streaming to remote server.")
+                            break
                         transfer = self.get_transfer()
                         transfer.upload(sql_file_path, "/tmp/")
                         remote_sql_path = f"/tmp/{os.path.basename(sql_file_path)}"
-                        remote_command = f"{self.remote_mysql_path} -u {self.mysqlusername} -p{self.mysqlpassword} -h {self.mysqlhost} --port={self.mysqlport} < {remote_sql_path}"
-                        _, _, error = self.execute_ssh_command(remote_command)
-
-                        if error and "error" in error.lower():
-                            raise Exception(error)
+                        remote_command = self._mysql_import_command(self.remote_mysql_path, remote_sql_path)
+                        self.run_ssh_command(remote_command, check=True)
 
                         delete_command = f"sudo rm {remote_sql_path}"
                         self.execute_ssh_command(delete_command)
@@ -510,59 +1287,623 @@ class MySQLDatabase:
             logging.error(f"Error occurred while importing all databases from SQL file: {e}")
             raise
     
-    def export_table_to_dataframe(self, database_name, table_name=None, query=None):
+    # chunksize为None时返回整个结果的DataFrame；指定chunksize时返回逐批生成DataFrame的迭代器，arrow为True时生成pyarrow.RecordBatch
+    # 两种方式都用服务端游标流式读取，dtype可以覆盖按列类型推断出的类型
+    def export_table_to_dataframe(self, database_name, table_name=None, query=None, chunksize=None, dtype=None, arrow=False):
+        if query:
+            if table_name:
+                logging.warning("Both table name and query provided. Ignoring the table name and using the provided query.")
+            final_query = query
+        elif table_name:
+            final_query = f"SELECT * FROM `{table_name}`"
+        else:
+            logging.error("Either table name or query must be provided.")
+            return None
+
+        if chunksize:
+            return self.iter_query_chunks(database_name, final_query, chunksize, dtype, arrow)
         try:
-            with self.engine.connect() as connection:
-                connection.execute(text(f"USE {database_name}")) 
-                if query:
-                    logging.warning("Both table name anquery provided. Ignoring the table name and using the provided query.")
-                    final_query = query
-                elif table_name:
-                    final_query = f"SELECT * FROM {table_name}"
-                else:
-                    logging.error("Either table name or query must be provided.")
-                    return None
+            chunks = list(self.iter_query_chunks(database_name, final_query, DEFAULT_DATAFRAME_CHUNK_ROWS, dtype))
+            df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+            logging.info("Data exported successfully.")
+            return df
+        except (SQLAlchemyError, pymysql.MySQLError) as e:
+            logging.error(f"Error occurred while exporting data: {e}")
+            return None
 
-                df = pd.read_sql(final_query, connection)
-                logging.info("Data exported successfully.")
-                return df
-        except SQLAlchemyError as e:
-            logging.error(f"Error occurred while importing data: {e}")
+    def iter_query_chunks(self, database_name, query, chunksize=DEFAULT_DATAFRAME_CHUNK_ROWS, dtype=None, arrow=False, params=None):
+        # 用服务端游标(SSCursor)逐批读取查询结果，结果集不会整个缓存在客户端，内存占用只和chunksize有关
+        # 结果为空时也会生成一个带列名和类型的空DataFrame
+        if arrow and pyarrow is None:
+            raise ImportError("The pyarrow package is required to read Arrow record batches.")
+        with self.raw_connection(database_name) as connection:
+            with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+                cursor.execute(query, params)
+                columns = [column[0] for column in cursor.description]
+                dtypes = self._result_dtypes(cursor)
+                dtypes.update(dtype or {})
+                first = True
+                while True:
+                    rows = cursor.fetchmany(chunksize)
+                    if not rows and not first:
+                        break
+                    first = False
+                    frame = self._typed_dataframe(rows, columns, dtypes)
+                    yield pyarrow.RecordBatch.from_pandas(frame, preserve_index=False) if arrow else frame
+
+    # 并行读取整张表：按单列整数主键的范围切成shards个分片，每个分片用连接池里的一个连接，按主键翻页读取（WHERE id > 上一页最后的id ORDER BY id LIMIT page_size）
+    # 没有callback时按主键顺序拼成一个DataFrame返回；有callback时每个分片读完就调用callback(分片序号, DataFrame)，不在内存里保留结果
+    # 没有单列整数主键的表退回到export_table_to_dataframe单连接流式读取
+    def read_table_parallel(self, database_name, table_name, shards=4, page_size=DEFAULT_PAGE_ROWS, columns=None, dtype=None,
+                            callback=None):
+        start_time = time.time()
+        with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+            key = self._get_integer_primary_key(cursor, database_name, table_name)
+            if key is not None:
+                cursor.execute(f"SELECT MIN(`{key}`), MAX(`{key}`) FROM `{table_name}`")
+                low, high = cursor.fetchone()
+        if key is None:
+            logging.warning(f"Table '{table_name}' has no single integer primary key, reading it on one connection.")
+            frame = self.export_table_to_dataframe(database_name, table_name, dtype=dtype)
+            if callback is not None:
+                callback(0, frame)
+                return None
+            return frame
+        if low is None:
+            ranges = [(0, None)]
+        else:
+            ranges = self._split_key_range(low, high, shards)
+        if columns and key not in columns:
+            columns = [key] + list(columns)
+        select_list = ', '.join(f"`{column}`" for column in columns) if columns else '*'
+
+        def read_shard(shard):
+            start, stop = ranges[shard]
+            pages = []
+            with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+                condition = f"`{key}` >= %s"
+                last = start
+                while True:
+                    query = f"SELECT {select_list} FROM `{table_name}` WHERE {condition}"
+                    params = [last]
+                    if stop is not None:
+                        query += f" AND `{key}` < %s"
+                        params.append(stop)
+                    cursor.execute(query + f" ORDER BY `{key}` LIMIT {int(page_size)}", params)
+                    rows = cursor.fetchall()
+                    if not pages:
+                        names = [column[0] for column in cursor.description]
+                        key_index = names.index(key)
+                        dtypes = self._result_dtypes(cursor)
+                        dtypes.update(dtype or {})
+                    if rows or not pages:
+                        pages.append(self._typed_dataframe(rows, names, dtypes))
+                    if len(rows) < page_size:
+                        break
+                    # 之后的每一页都从上一页最后一个主键之后开始，不用OFFSET
+                    condition = f"`{key}` > %s"
+                    last = rows[-1][key_index]
+            frame = pages[0] if len(pages) == 1 else pd.concat(pages, ignore_index=True)
+            return shard, frame
+
+        frames = [None] * len(ranges)
+        total_rows = 0
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [pool.submit(read_shard, shard) for shard in range(len(ranges))]
+            for future in as_completed(futures):
+                shard, frame = future.result()
+                total_rows += len(frame)
+                if callback is not None:
+                    callback(shard, frame)
+                else:
+                    frames[shard] = frame
+        elapsed = time.time() - start_time
+        print(f"Read {total_rows} rows from '{database_name}.{table_name}' in {len(ranges)} shards in {elapsed:.1f}s "
+              f"({total_rows / max(elapsed, 1e-6):.0f} rows/s).")
+        if callback is not None:
             return None
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def _result_dtypes(cursor):
+        # 按结果集每列的MySQL类型给出DataFrame列的类型，二进制字符串列保持bytes，不转换成string
+        dtypes = {}
+        for column, field in zip(cursor.description, cursor._result.fields):
+            column_dtype = MYSQL_DTYPE_HINTS.get(column[1])
+            if column_dtype is None or (column_dtype == 'string' and field.charsetnr == BINARY_CHARSET_NUMBER):
+                continue
+            dtypes[column[0]] = column_dtype
+        return dtypes
+
+    @staticmethod
+    def _typed_dataframe(rows, columns, dtypes):
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        for column, column_dtype in dtypes.items():
+            if column not in frame:
+                continue
+            try:
+                if str(column_dtype).startswith('datetime64'):
+                    # 0000-00-00这样的无效日期读出来是字符串，转换成NaT
+                    frame[column] = pd.to_datetime(frame[column], errors='coerce')
+                else:
+                    frame[column] = frame[column].astype(column_dtype)
+            except (TypeError, ValueError, OverflowError):
+                # 比如超出Int64范围的无符号BIGINT，保持原来的类型
+                logging.warning(f"Column '{column}' cannot be converted to {column_dtype}, keeping it as {frame[column].dtype}.")
+        return frame
 
-    def import_dataframe_to_table(self, dataframe, database_name, table_name):
+    # 按DataFrame列的类型和实际数据推断MySQL列类型：整数按取值范围选最小的整数类型，字符串按最长的长度留出余量选VARCHAR或TEXT，
+    # Decimal按位数选DECIMAL，时间用DATETIME(6)保留微秒，布尔用TINYINT(1)；可以为空的整数(Int64)同样映射成整数类型
+    @staticmethod
+    def _mysql_column_type(series):
+        dtype = series.dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            return 'TINYINT(1)'
+        if pd.api.types.is_integer_dtype(dtype):
+            values = series.dropna()
+            low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+            unsigned = pd.api.types.is_unsigned_integer_dtype(dtype)
+            for name, bits in (('TINYINT', 8), ('SMALLINT', 16), ('MEDIUMINT', 24), ('INT', 32), ('BIGINT', 64)):
+                if unsigned and high < 1 << bits:
+                    return f"{name} UNSIGNED"
+                if not unsigned and -(1 << bits - 1) <= low and high < 1 << bits - 1:
+                    return name
+            return 'BIGINT UNSIGNED'
+        if pd.api.types.is_float_dtype(dtype):
+            return 'FLOAT' if dtype == 'float32' else 'DOUBLE'
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return 'DATETIME(6)'
+        if pd.api.types.is_timedelta64_dtype(dtype):
+            return 'TIME(6)'
+
+        values = series.dropna()
+        if not len(values):
+            return 'VARCHAR(255)'
+        first = values.iloc[0]
+        if isinstance(first, bool):
+            return 'TINYINT(1)'
+        if isinstance(first, decimal.Decimal):
+            digits = [value.as_tuple() for value in values if value.is_finite()]
+            scale = max((-exponent for _, _, exponent in digits if exponent < 0), default=0)
+            integer_digits = max((len(numbers) + exponent for _, numbers, exponent in digits), default=1)
+            precision = min(65, max(integer_digits, 1) + scale)
+            return f"DECIMAL({precision},{min(scale, 30, precision)})"
+        if isinstance(first, datetime.datetime):
+            return 'DATETIME(6)'
+        if isinstance(first, datetime.date):
+            return 'DATE'
+        if isinstance(first, (bytes, bytearray)):
+            length = int(values.map(len).max())
+            return 'BLOB' if length < 1 << 16 else 'MEDIUMBLOB' if length < 1 << 24 else 'LONGBLOB'
+        length = int(values.astype('string').str.len().max())
+        for size in VARCHAR_LENGTHS:
+            if length * VARCHAR_HEADROOM <= size:
+                return f"VARCHAR({size})"
+        # utf8mb4每个字符最多4个字节
+        return 'TEXT' if length * 4 < 1 << 16 else 'MEDIUMTEXT' if length * 4 < 1 << 24 else 'LONGTEXT'
+
+    @staticmethod
+    def _fit_row_size(column_types):
+        # 所有VARCHAR加起来超过一行的字节数上限时，从最长的VARCHAR开始依次改成TEXT；其它列按每列16字节估算
+        lengths = {column: int(match.group(1)) for column, column_type in column_types.items()
+                   if (match := re.fullmatch(r'VARCHAR\((\d+)\)', column_type))}
+        row_size = sum(length * 4 + 2 for length in lengths.values()) + 16 * (len(column_types) - len(lengths))
+        for column in sorted(lengths, key=lengths.get, reverse=True):
+            if row_size <= ROW_SIZE_LIMIT:
+                break
+            column_types[column] = 'TEXT'
+            row_size -= lengths[column] * 4 + 2 - 16
+        return column_types
+
+    def dataframe_fields(self, dataframe, primary_key=None):
+        # 生成create_table需要的字段定义列表
+        column_types = self._fit_row_size({column: self._mysql_column_type(dataframe[column]) for column in dataframe.columns})
+        fields = [f"`{column}` {column_type}" for column, column_type in column_types.items()]
+        if primary_key:
+            keys = [primary_key] if isinstance(primary_key, str) else list(primary_key)
+            fields.append(f"PRIMARY KEY ({', '.join(f'`{key}`' for key in keys)})")
+        return fields
+
+    # 把DataFrame写入表，mode可以是：
+    # 'replace' 删除原表，按DataFrame推断的类型重新建表后写入
+    # 'append'  表不存在时建表，追加写入；defer_indexes为True且已有的表是空表时，先去掉非唯一的二级索引，数据写完再一次建好
+    # 'upsert'  表不存在时建表，按主键或唯一键插入或更新（INSERT ... ON DUPLICATE KEY UPDATE）
+    # 'swap'    写入影子表 <表名>__new，写完后用RENAME TABLE原子地替换原表，写入期间原表一直可以读；
+    #           原表存在时影子表按原表的结构(CREATE TABLE ... LIKE)建立，defer_indexes为True时先去掉二级索引，数据写完再一次建好；
+    #           原表的外键和触发器在替换后加到新表上；其他表有外键引用原表、或者 <表名>__old 已经存在时不能替换，写入前就报错
+    # 数据通过bulk_insert写入：允许LOAD DATA LOCAL INFILE时把DataFrame按列向量化地转换成TSV文件导入，否则用多行INSERT
+    def import_dataframe_to_table(self, dataframe, database_name, table_name, mode='replace', primary_key=None, method='auto',
+                                  commit_every=DEFAULT_COMMIT_EVERY, defer_indexes=True):
         if not table_name:
             logging.error("必须提供表名。")
             return
+        if mode not in DATAFRAME_LOAD_MODES:
+            raise ValueError(f"Invalid mode. Must be one of: {', '.join(DATAFRAME_LOAD_MODES)}.")
 
         try:
-            with self.engine.connect() as connection:
-                connection.execute(text(f"USE {database_name}"))
-
-                # 获取DataFrame的列名和数据类型
-                dtype_mapping = {
-                    'int64': 'INT',
-                    'float64': 'FLOAT',
-                    'object': 'TEXT',
-                    'bool': 'BOOLEAN',
-                    'datetime64[ns]': 'DATETIME'
-                    # 添加其他数据类型的映射
-                }
-                columns_definition = ', '.join([f"{column} {dtype_mapping[str(dataframe[column].dtype)]}" for column in dataframe.columns])
-
-                # 创建新表或替换现有表
-                connection.execute(text(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_definition})"))
-
-                # 转换DataFrame的数据类型以匹配表的定义
-                dataframe = dataframe.astype({column: str(dataframe[column].dtype) for column in dataframe.columns})
-
-                # 导出DataFrame到数据库表
-                dataframe.to_sql(table_name, con=self.engine, if_exists='replace', index=False)
-
-                logging.info(f"DataFrame数据成功导入到表'{table_name}'。")
-        except SQLAlchemyError as e:
+            fields = self.dataframe_fields(dataframe, primary_key)
+            target_table = table_name
+            update_columns = None
+            indexes = []
+            shadow_like = False
+            if mode == 'replace':
+                self.delete_table(database_name, table_name)
+            elif mode == 'swap':
+                target_table = table_name + SHADOW_TABLE_SUFFIX
+                self.delete_table(database_name, target_table)
+                with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+                    if self._table_exists(cursor, table_name):
+                        self._check_swappable(cursor, table_name)
+                        cursor.execute(f"CREATE TABLE `{target_table}` LIKE `{table_name}`")
+                        shadow_like = True
+            elif mode == 'append' and defer_indexes:
+                # 表里已经有数据时重建索引要扫描全部旧数据，只对空表推迟建索引
+                with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+                    if self._table_exists(cursor, table_name):
+                        cursor.execute(f"SELECT 1 FROM `{table_name}` LIMIT 1")
+                        if cursor.fetchone() is None:
+                            # 唯一索引要保留，否则重复的行会先写进去，最后加唯一索引时才失败
+                            indexes = self._drop_secondary_indexes(cursor, table_name, keep_unique=True)
+            elif mode == 'upsert':
+                # upsert要靠唯一索引判断重复，不能推迟建索引
+                keys = [primary_key] if isinstance(primary_key, str) else list(primary_key or [])
+                update_columns = [column for column in dataframe.columns if column not in keys] or True
+
+            try:
+                self.create_table(database_name, target_table, fields)
+                if shadow_like and defer_indexes:
+                    with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+                        indexes = self._drop_secondary_indexes(cursor, target_table)
+                report = self.bulk_insert(database_name, target_table, dataframe, method=method, commit_every=commit_every,
+                                          update_columns=update_columns)
+                if indexes:
+                    with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+                        self._add_indexes(cursor, target_table, indexes)
+                    indexes = []
+                if mode == 'swap':
+                    self._swap_table(database_name, table_name, target_table)
+            except Exception:
+                # 影子表导入失败时原表保持不变
+                if mode == 'swap':
+                    self.delete_table(database_name, target_table)
+                elif indexes:
+                    # 追加失败时把去掉的索引加回来，表结构保持不变；加回失败只记录日志，抛出的仍是原来的错误
+                    try:
+                        with self.raw_connection(database_name) as connection, connection.cursor() as cursor:
+                            self._add_indexes(cursor, target_table, indexes)
+                    except Exception as e:
+                        logging.error(f"Failed to restore the secondary indexes of table '{target_table}' "
+                                      f"({'; '.join(indexes)}): {e}")
+                raise
+            logging.info(f"DataFrame数据成功导入到表'{table_name}'。")
+            return report
+        except (SQLAlchemyError, pymysql.MySQLError) as e:
             logging.error(f"导入DataFrame到表时发生错误：{e}")
             raise
+
+    def _check_swappable(self, cursor, table_name):
+        # <表名>__old已经存在时不能替换，那张表不是这里建的，不能替别人删掉
+        # 其他表的外键引用这张表时，RENAME TABLE会把这些外键改成引用 <表名>__old，之后删除旧表会失败，所以也不允许替换
+        # 表自己引用自己的外键不影响替换
+        old_table = table_name + OLD_TABLE_SUFFIX
+        if self._table_exists(cursor, old_table):
+            raise ValueError(f"Table '{old_table}' already exists, rename or drop it before swapping '{table_name}'.")
+        cursor.execute("SELECT CONSTRAINT_SCHEMA, TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+                       "WHERE UNIQUE_CONSTRAINT_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = %s "
+                       "AND NOT (CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s)", (table_name, table_name))
+        references = [f"{schema}.{table} ({constraint})" for schema, table, constraint in cursor.fetchall()]
+        if references:
+            raise ValueError(f"Table '{table_name}' is referenced by foreign keys of {', '.join(references)} and cannot be swapped.")
+
+    @staticmethod
+    def _trigger_names(cursor, table_name):
+        cursor.execute("SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE EVENT_OBJECT_SCHEMA = DATABASE() "
+                       "AND EVENT_OBJECT_TABLE = %s ORDER BY ACTION_TIMING, EVENT_MANIPULATION, ACTION_ORDER", (table_name,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def _table_triggers(self, cursor, table_name):
+        # 表上的触发器，按执行顺序返回 [(sql_mode, CREATE TRIGGER语句)]
+        triggers = []
+        for name in self._trigger_names(cursor, table_name):
+            cursor.execute(f"SHOW CREATE TRIGGER `{name}`")
+            row = cursor.fetchone()
+            triggers.append((row[1], row[2]))
+        return triggers
+
+    # 一条RENAME TABLE同时完成两次改名，其他会话看到的要么是旧表要么是新表，不会出现表不存在的时刻
+    # 影子表上没有外键（CREATE TABLE ... LIKE不复制外键，外键的约束名在库里唯一，也不能和原表同名），RENAME时触发器跟着原表走，
+    # 所以改名前记下原表的外键和触发器（foreign_keys、triggers不为None时用给定的，triggers是 [(sql_mode或None, 语句)]），
+    # 改名后先从旧表上删掉触发器和外键腾出名字，再加到新表上，最后才删除旧表；加外键时关闭外键检查，只改元数据，不重新校验和复制整张表
+    def _swap_table(self, database_name, table_name, shadow_table, foreign_keys=None, triggers=None):
+        old_table = table_name + OLD_TABLE_SUFFIX
+        connection = self.get_engine(database_name).raw_connection()
+        # 要改会话变量，这个连接不能再回到连接池
+        connection.detach()
+        try:
+            with connection.cursor() as cursor:
+                exists = self._table_exists(cursor, table_name)
+                if exists:
+                    # 导入期间可能有别的会话加了外键或建了旧表，替换前再检查一次
+                    self._check_swappable(cursor, table_name)
+                    if foreign_keys is None:
+                        cursor.execute(f"SHOW CREATE TABLE `{table_name}`")
+                        _, foreign_keys = split_foreign_keys(cursor.fetchone()[1])
+                    if triggers is None:
+                        triggers = self._table_triggers(cursor, table_name)
+                    cursor.execute(f"RENAME TABLE `{table_name}` TO `{old_table}`, `{shadow_table}` TO `{table_name}`")
+                else:
+                    cursor.execute(f"RENAME TABLE `{shadow_table}` TO `{table_name}`")
+                try:
+                    if exists:
+                        for name in self._trigger_names(cursor, old_table):
+                            cursor.execute(f"DROP TRIGGER `{name}`")
+                        cursor.execute(f"SHOW CREATE TABLE `{old_table}`")
+                        _, old_keys = split_foreign_keys(cursor.fetchone()[1])
+                        names = [constraint_name(definition) for definition in old_keys if constraint_name(definition)]
+                        if names:
+                            cursor.execute(f"ALTER TABLE `{old_table}` " + ', '.join(f"DROP FOREIGN KEY `{name}`" for name in names))
+                    for sql_mode, statement in triggers or []:
+                        if sql_mode is not None:
+                            cursor.execute("SET SESSION sql_mode = %s", (sql_mode,))
+                        cursor.execute(statement)
+                    if foreign_keys:
+                        cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 0")
+                        cursor.execute(f"ALTER TABLE `{table_name}` " + ', '.join(f"ADD {definition}" for definition in foreign_keys))
+                except Exception as e:
+                    logging.error(f"Table '{table_name}' was swapped in but its triggers or foreign keys could not be restored, "
+                                  f"the previous table is kept as '{old_table}': {e}")
+                    raise
+                if exists:
+                    cursor.execute(f"DROP TABLE `{old_table}`")
+        finally:
+            connection.close()
+        logging.info(f"Table '{table_name}' swapped in from '{shadow_table}'.")
+
+    def insert_data(self, database_name, table_name, data, columns=None):
+        return self.bulk_insert(database_name, table_name, data, columns=columns, method='insert')
+
+    @staticmethod
+    def _bulk_rows(data, columns):
+        # 把DataFrame、字典或序列组成的可迭代对象统一成 (列名, 元组迭代器)，DataFrame里的NaN转换成None
+        if isinstance(data, pd.DataFrame):
+            columns = list(columns or data.columns)
+
+            def dataframe_rows():
+                for start in range(0, len(data), DATAFRAME_BATCH_ROWS):
+                    batch = data.iloc[start:start + DATAFRAME_BATCH_ROWS][columns].astype(object)
+                    yield from batch.where(batch.notna(), None).itertuples(index=False, name=None)
+            return columns, dataframe_rows()
+
+        rows = iter(data)
+        first = next(rows, None)
+        if first is None:
+            return columns, iter(())
+        rows = itertools.chain([first], rows)
+        if isinstance(first, dict):
+            columns = list(columns or first)
+            return columns, (tuple(row.get(column) for column in columns) for row in rows)
+        return columns, (tuple(row) for row in rows)
+
+    @staticmethod
+    def _tsv_field(value):
+        # LOAD DATA默认格式的一个字段：制表符分隔，反斜杠转义，\N表示NULL
+        if value is None:
+            return b'\\N'
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, datetime.timedelta):
+            value = MySQLDatabase._time_literal(value)
+        data = value if isinstance(value, bytes) else str(value).encode('utf-8')
+        return data.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n').replace(b'\r', b'\\r').replace(b'\0', b'\\0')
+
+    @staticmethod
+    def _time_literal(value):
+        # TIME列的文本格式 [-]HH:MM:SS.ffffff，小时数可以超过24
+        sign = '-' if value < datetime.timedelta(0) else ''
+        value = abs(value)
+        seconds = value.days * 86400 + value.seconds
+        return f"{sign}{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{value.microseconds:06d}"
+
+    def _server_allows_local_infile(self, cursor):
+        cursor.execute("SELECT @@GLOBAL.local_infile")
+        return bool(int(cursor.fetchone()[0]))
+
+    # 批量插入：data可以是行的可迭代对象（元组、列表或字典）、DataFrame，或者带表头的CSV文件路径
+    # method为'insert'时拼接成不超过max_allowed_packet的多行INSERT；为'load'时每批写一个临时文件，用LOAD DATA LOCAL INFILE导入
+    # method为'auto'时，只要客户端（local_infile参数）和服务端都允许就用LOAD DATA，否则用多行INSERT
+    # update_columns为True或列名列表时生成INSERT ... ON DUPLICATE KEY UPDATE，LOAD DATA不支持这种写法，会改用多行INSERT
+    # 每插入commit_every行提交一次，出错时回滚未提交的部分，已经提交的批次保留；返回插入行数、耗时和每秒行数
+    def bulk_insert(self, database_name, table_name, data, columns=None, method='auto', commit_every=DEFAULT_COMMIT_EVERY,
+                    update_columns=None):
+        if method not in ('auto', 'insert', 'load'):
+            raise ValueError("Invalid method. Must be 'auto', 'insert' or 'load'.")
+        if method == 'load' and update_columns:
+            raise ValueError("LOAD DATA cannot update duplicate keys, use method='insert'.")
+        start_time = time.time()
+        report = {'rows': 0, 'statements': 0}
+        with self.raw_connection(database_name) as connection:
+            try:
+                with connection.cursor() as cursor:
+                    if method == 'auto':
+                        # 二进制列没法写进文本格式的TSV，只能用INSERT
+                        use_load = (self.local_infile and not update_columns and
+                                    not (isinstance(data, pd.DataFrame) and self._has_binary_column(data)) and
+                                    self._server_allows_local_infile(cursor))
+                        method = 'load' if use_load else 'insert'
+                    if isinstance(data, str):
+                        if method == 'load':
+                            self._load_csv_file(cursor, table_name, data, columns, report)
+                            connection.commit()
+                        else:
+                            with open(data, 'r', encoding='utf-8', newline='') as file:
+                                reader = csv.reader(file)
+                                header = next(reader)
+                                # 和LOAD DATA一致，CSV里的NULL表示空值
+                                rows = (tuple(None if value == 'NULL' else value for value in row) for row in reader)
+                                self._insert_rows(connection, cursor, table_name, columns or header, rows, commit_every,
+                                                  update_columns, report)
+                    elif method == 'load' and isinstance(data, pd.DataFrame):
+                        self._load_dataframe(connection, cursor, table_name, data, list(columns or data.columns), commit_every, report)
+                    else:
+                        columns, rows = self._bulk_rows(data, columns)
+                        if method == 'load':
+                            self._load_rows(connection, cursor, table_name, columns, rows, commit_every, report)
+                        else:
+                            self._insert_rows(connection, cursor, table_name, columns, rows, commit_every, update_columns, report)
+            except Exception as e:
+                connection.rollback()
+                logging.error(f"Error occurred while inserting into '{table_name}' after {report['rows']} committed rows: {e}")
+                raise
+        elapsed = time.time() - start_time
+        report.update(method=method, seconds=elapsed, rows_per_second=report['rows'] / max(elapsed, 1e-6))
+        print(f"Inserted {report['rows']} rows into '{database_name}.{table_name}' with {method} in {elapsed:.1f}s "
+              f"({report['rows_per_second']:.0f} rows/s, {report['statements']} statements).")
+        return report
+
+    def _insert_rows(self, connection, cursor, table_name, columns, rows, commit_every, update_columns, report):
+        cursor.execute("SELECT @@max_allowed_packet")
+        packet_limit = int(int(cursor.fetchone()[0]) * BULK_PACKET_RATIO)
+        column_list = f" ({', '.join(f'`{column}`' for column in columns)})" if columns else ''
+        prefix = f"INSERT INTO `{table_name}`{column_list} VALUES "
+        suffix = ''
+        if update_columns:
+            if update_columns is True:
+                if not columns:
+                    raise ValueError("Column names are required to update duplicate keys.")
+                update_columns = columns
+            suffix = " ON DUPLICATE KEY UPDATE " + ', '.join(f"`{column}` = VALUES(`{column}`)" for column in update_columns)
+        limit = packet_limit - len(prefix.encode('utf-8')) - len(suffix.encode('utf-8'))
+
+        values = []
+        size = 0
+        uncommitted = 0
+
+        def flush():
+            cursor.execute(prefix + ','.join(values) + suffix)
+            report['statements'] += 1
+
+        for row in rows:
+            literal = connection.escape(row)
+            length = (len(literal) if literal.isascii() else len(literal.encode('utf-8'))) + 1
+            if values and size + length > limit:
+                flush()
+                values = []
+                size = 0
+            values.append(literal)
+            size += length
+            uncommitted += 1
+            if commit_every and uncommitted >= commit_every:
+                flush()
+                connection.commit()
+                report['rows'] += uncommitted
+                values = []
+                size = 0
+                uncommitted = 0
+        if values:
+            flush()
+        connection.commit()
+        report['rows'] += uncommitted
+
+    def _load_statement(self, table_name, path, columns, options=''):
+        column_list = f" ({', '.join(f'`{column}`' for column in columns)})" if columns else ''
+        escaped_path = path.replace('\\', '\\\\').replace("'", "\\'")
+        return f"LOAD DATA LOCAL INFILE '{escaped_path}' INTO TABLE `{table_name}` CHARACTER SET utf8mb4{options}{column_list}"
+
+    def _load_rows(self, connection, cursor, table_name, columns, rows, commit_every, report):
+        # pymysql只能从文件读取LOAD DATA LOCAL的数据，每批行写到一个临时文件里再导入
+        while True:
+            with tempfile.NamedTemporaryFile(suffix='.tsv') as file:
+                count = 0
+                for row in itertools.islice(rows, commit_every or None):
+                    file.write(b'\t'.join(self._tsv_field(value) for value in row) + b'\n')
+                    count += 1
+                if not count:
+                    break
+                file.flush()
+                cursor.execute(self._load_statement(table_name, file.name, columns))
+                self._check_load_warnings(cursor, table_name)
+                connection.commit()
+                report['rows'] += count
+                report['statements'] += 1
+
+    @staticmethod
+    def _has_binary_column(dataframe):
+        for column in dataframe.columns:
+            if dataframe[column].dtype == object:
+                values = dataframe[column].dropna()
+                if len(values) and isinstance(values.iloc[0], (bytes, bytearray)):
+                    return True
+        return False
+
+    @staticmethod
+    def _check_load_warnings(cursor, table_name):
+        # LOAD DATA遇到截断、类型不对的值时只产生警告，数据会被改写后照样写入，所以有警告就报错，回滚这一批
+        cursor.execute("SHOW WARNINGS LIMIT 5")
+        warnings = [warning for warning in cursor.fetchall() if warning[0] != 'Note']
+        if warnings:
+            details = '; '.join(f"{level} {code}: {message}" for level, code, message in warnings)
+            raise RuntimeError(f"LOAD DATA into '{table_name}' produced warnings: {details}")
+
+    @staticmethod
+    def _tsv_column(series):
+        # 把一列整体转换成LOAD DATA默认格式的文本，空值写成\N，字符串里的反斜杠、制表符和换行符转义
+        # 布尔写成0/1，时间间隔写成TIME列的 HH:MM:SS.ffffff；object列按第一个非空值判断是不是布尔或时间间隔
+        if series.dtype == object:
+            values = series.dropna()
+            if len(values) and isinstance(values.iloc[0], bool):
+                series = series.astype('boolean')
+            elif len(values) and isinstance(values.iloc[0], datetime.timedelta):
+                series = pd.to_timedelta(series)
+        if pd.api.types.is_bool_dtype(series.dtype):
+            series = series.astype('Int8')
+        if pd.api.types.is_timedelta64_dtype(series.dtype):
+            parts = series.abs().dt.components.astype('Int64')
+            sign = pd.Series(['-' if negative else '' for negative in series < pd.Timedelta(0)], index=series.index, dtype='string')
+            text = (sign + (parts['days'] * 24 + parts['hours']).astype('string').str.zfill(2) + ':' +
+                    parts['minutes'].astype('string').str.zfill(2) + ':' + parts['seconds'].astype('string').str.zfill(2) + '.' +
+                    (parts['milliseconds'] * 1000 + parts['microseconds']).astype('string').str.zfill(6))
+            text = text.where(series.notna())
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            text = series.astype('string')
+        elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+            text = series.dt.strftime('%Y-%m-%d %H:%M:%S.%f').astype('string')
+        else:
+            text = series.astype('string')
+            for old, new in (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'), ('\0', '\\0')):
+                text = text.str.replace(old, new, regex=False)
+        return text.fillna('\\N')
+
+    def _dataframe_tsv(self, dataframe):
+        columns = [self._tsv_column(dataframe[column]) for column in dataframe.columns]
+        lines = columns[0].str.cat(columns[1:], sep='\t') if len(columns) > 1 else columns[0]
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _load_dataframe(self, connection, cursor, table_name, dataframe, columns, commit_every, report):
+        # 不逐行处理，每批行按列向量化地转换成TSV临时文件，再用LOAD DATA LOCAL INFILE导入
+        step = commit_every or len(dataframe) or 1
+        for start in range(0, len(dataframe), step):
+            batch = dataframe.iloc[start:start + step][columns]
+            with tempfile.NamedTemporaryFile(suffix='.tsv') as file:
+                file.write(self._dataframe_tsv(batch))
+                file.flush()
+                cursor.execute(self._load_statement(table_name, file.name, columns))
+            self._check_load_warnings(cursor, table_name)
+            connection.commit()
+            report['rows'] += len(batch)
+            report['statements'] += 1
+
+    def _load_csv_file(self, cursor, table_name, csv_file_path, columns, report):
+        # CSV文件直接交给LOAD DATA，不在Python里解析；按RFC 4180的格式读取（引号内的两个引号表示一个引号），列名默认取表头
+        with open(csv_file_path, 'rb') as file:
+            first_line = file.readline()
+        header = next(csv.reader([first_line.decode('utf-8-sig')]))
+        terminator = '\\r\\n' if first_line.endswith(b'\r\n') else '\\n'
+        options = (" FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+                   f"LINES TERMINATED BY '{terminator}' IGNORE 1 LINES")
+        rows = cursor.execute(self._load_statement(table_name, os.path.abspath(csv_file_path), columns or header, options))
+        self._check_load_warnings(cursor, table_name)
+        report['rows'] += rows
+        report['statements'] += 1
         
            
 if __name__ == "__main__":
@@ -0,0 +1,279 @@
+import asyncio
+import codecs
+import contextlib
+import functools
+import select
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from file import SSHConnectionPool
+
+# 读取远程命令输出时每次读取的字节数
+OUTPUT_CHUNK_SIZE = 32768
+# 异步接口最多同时在执行线程里运行的命令数
+DEFAULT_CONCURRENCY = 16
+
+_executor = ThreadPoolExecutor(max_workers=DEFAULT_CONCURRENCY, thread_name_prefix='remote')
+
+
+def _read_in_background(file):
+    # 在后台线程里把file读完，返回一个函数，调用时等读完并返回读到的字节
+    chunks = []
+    thread = threading.Thread(target=lambda: chunks.append(file.read()), daemon=True)
+    thread.start()
+
+    def result():
+        thread.join()
+        return b''.join(chunks)
+    return result
+
+
+class CommandResult:
+    # 一条命令的执行结果，用退出码判断成败，而不是在stderr里找"error"
+    def __init__(self, host, command, exit_status, stdout, stderr, seconds, timed_out=False):
+        self.host = host
+        self.command = command
+        self.exit_status = exit_status
+        self.stdout = stdout
+        self.stderr = stderr
+        self.seconds = seconds
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.exit_status == 0 and not self.timed_out
+
+    def check(self):
+        if not self.ok:
+            reason = f"timed out after {self.seconds:.0f}s" if self.timed_out else f"exited with status {self.exit_status}"
+            message = f"Command on {self.host} {reason}: {self.command}"
+            if self.stderr.strip():
+                message += f"\n{self.stderr.strip()}"
+            raise RuntimeError(message)
+        return self
+
+    def __repr__(self):
+        return f"CommandResult(host={self.host!r}, exit_status={self.exit_status}, seconds={self.seconds:.2f}, command={self.command!r})"
+
+
+class RemoteExecutor:
+    # 通过共享的SSH连接池在一台主机上执行命令
+    # run是同步接口；run_async把run放到执行线程里，可以在事件循环里同时跑很多台主机上的命令
+    def __init__(self, host, username, password=None, private_key_path=None):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.private_key_path = private_key_path
+        self.pool = SSHConnectionPool()
+
+    def session(self):
+        return self.pool.session(self.host, self.username, password=self.password, private_key_path=self.private_key_path)
+
+    def run(self, command, timeout=None, on_output=None, check=False):
+        # on_output(stream, text) 在收到输出时立即调用，stream是'stdout'或'stderr'
+        # 超过timeout秒还没结束的命令会被关闭通道，结果里timed_out为True
+        start_time = time.time()
+        deadline = None if timeout is None else start_time + timeout
+        output = {'stdout': [], 'stderr': []}
+        decoders = {name: codecs.getincrementaldecoder('utf-8')(errors='replace') for name in output}
+        timed_out = False
+
+        def drain(channel):
+            for name, ready, recv in (('stdout', channel.recv_ready, channel.recv),
+                                      ('stderr', channel.recv_stderr_ready, channel.recv_stderr)):
+                while ready():
+                    text = decoders[name].decode(recv(OUTPUT_CHUNK_SIZE))
+                    if text:
+                        output[name].append(text)
+                        if on_output is not None:
+                            on_output(name, text)
+
+        with self.session() as ssh:
+            channel = ssh.get_transport().open_session()
+            try:
+                channel.exec_command(command)
+                while True:
+                    drain(channel)
+                    if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                        break
+                    wait = 1.0
+                    if deadline is not None:
+                        wait = deadline - time.time()
+                        if wait <= 0:
+                            timed_out = True
+                            break
+                        wait = min(wait, 1.0)
+                    select.select([channel], [], [], wait)
+                exit_status = -1 if timed_out else channel.recv_exit_status()
+            finally:
+                channel.close()
+
+        for name in output:
+            tail = decoders[name].decode(b'', final=True)
+            if tail:
+                output[name].append(tail)
+        result = CommandResult(self.host, command, exit_status, ''.join(output['stdout']), ''.join(output['stderr']),
+                               time.time() - start_time, timed_out)
+        return result.check() if check else result
+
+    @contextlib.contextmanager
+    def stream(self, command, mode='r'):
+        # 以二进制流的方式执行命令，mode为'r'时读取命令的标准输出，为'w'时向命令的标准输入写入，数据边产生边处理，不会整体读进内存
+        # 离开with块时等待命令结束，退出码不为0时抛出RuntimeError
+        if mode not in ('r', 'w'):
+            raise ValueError("Invalid mode. Must be 'r' or 'w'.")
+        start_time = time.time()
+        with self.session() as ssh:
+            channel = ssh.get_transport().open_session()
+            try:
+                channel.exec_command(command)
+                # stdout和stderr共用通道的流控窗口，调用方处理数据期间没人读的输出要在后台读掉，
+                # 否则命令写满窗口（比如tar对正在变化的文件输出大量警告）后会卡住
+                errors = _read_in_background(channel.makefile_stderr('rb', OUTPUT_CHUNK_SIZE))
+                if mode == 'r':
+                    stdout = channel.makefile('rb', OUTPUT_CHUNK_SIZE)
+                    yield stdout
+                    # 调用方没有读完的输出也要读掉，否则命令可能因为窗口写满而无法结束
+                    while stdout.read(OUTPUT_CHUNK_SIZE):
+                        pass
+                    output = b''
+                else:
+                    output = _read_in_background(channel.makefile('rb', OUTPUT_CHUNK_SIZE))
+                    yield channel.makefile_stdin('wb', OUTPUT_CHUNK_SIZE)
+                    channel.shutdown_write()
+                    output = output()
+                errors = errors()
+                exit_status = channel.recv_exit_status()
+            finally:
+                channel.close()
+        CommandResult(self.host, command, exit_status, output.decode('utf-8', 'replace'), errors.decode('utf-8', 'replace'),
+                      time.time() - start_time).check()
+
+    def read_line(self, command, timeout):
+        # 执行命令，返回标准输出的第一行；读到第一行就关闭通道返回，不等命令结束，timeout秒内没有输出时返回空字符串
+        # 关闭通道后远程命令在下一次写输出时结束，所以命令本身也应该有超时，比如用timeout命令包起来
+        deadline = time.time() + timeout
+        data = b''
+        with self.session() as ssh:
+            channel = ssh.get_transport().open_session()
+            try:
+                channel.exec_command(command)
+                while b'\n' not in data:
+                    if channel.recv_ready():
+                        chunk = channel.recv(OUTPUT_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        data += chunk
+                        continue
+                    wait = deadline - time.time()
+                    if wait <= 0 or channel.exit_status_ready():
+                        break
+                    select.select([channel], [], [], min(wait, 1.0))
+            finally:
+                channel.close()
+        return data.split(b'\n', 1)[0].decode('utf-8', 'replace')
+
+    async def run_async(self, command, timeout=None, on_output=None, check=False):
+        loop = asyncio.get_running_loop()
+        if on_output is not None:
+            # 输出回调切回事件循环线程执行
+            callback = on_output
+            on_output = lambda stream, text: loop.call_soon_threadsafe(callback, stream, text)
+        return await loop.run_in_executor(_executor, functools.partial(self.run, command, timeout, on_output, check))
+
+
+class LocalExecutor:
+    # 和RemoteExecutor接口相同，在本机执行命令，方便local和remote两种模式用同一套代码
+    host = 'localhost'
+
+    def run(self, command, timeout=None, on_output=None, check=False, cwd=None):
+        start_time = time.time()
+        try:
+            completed = subprocess.run(command, shell=isinstance(command, str), cwd=cwd, capture_output=True, text=True,
+                                       timeout=timeout)
+            result = CommandResult(self.host, command, completed.returncode, completed.stdout, completed.stderr,
+                                   time.time() - start_time)
+        except subprocess.TimeoutExpired as e:
+            result = CommandResult(self.host, command, -1, e.stdout or '', e.stderr or '', time.time() - start_time, timed_out=True)
+        if on_output is not None:
+            for name in ('stdout', 'stderr'):
+                if getattr(result, name):
+                    on_output(name, getattr(result, name))
+        return result.check() if check else result
+
+    @contextlib.contextmanager
+    def stream(self, command, mode='r', cwd=None):
+        if mode not in ('r', 'w'):
+            raise ValueError("Invalid mode. Must be 'r' or 'w'.")
+        start_time = time.time()
+        # 不读取的输出写到临时文件里，避免管道写满后命令卡住
+        with tempfile.TemporaryFile() as errors, tempfile.TemporaryFile() as output:
+            process = subprocess.Popen(command, shell=isinstance(command, str), cwd=cwd,
+                                       stdin=subprocess.PIPE if mode == 'w' else subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE if mode == 'r' else output, stderr=errors)
+            try:
+                if mode == 'r':
+                    with process.stdout:
+                        yield process.stdout
+                        while process.stdout.read(OUTPUT_CHUNK_SIZE):
+                            pass
+                else:
+                    with process.stdin:
+                        yield process.stdin
+                exit_status = process.wait()
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+            output.seek(0)
+            errors.seek(0)
+            CommandResult(self.host, command, exit_status, output.read().decode('utf-8', 'replace'),
+                          errors.read().decode('utf-8', 'replace'), time.time() - start_time).check()
+
+    def read_line(self, command, timeout, cwd=None):
+        # 和RemoteExecutor.read_line一样，读到第一行就结束命令返回
+        process = subprocess.Popen(command, shell=isinstance(command, str), cwd=cwd, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            ready, _, _ = select.select([process.stdout], [], [], timeout)
+            line = process.stdout.readline() if ready else b''
+        finally:
+            process.kill()
+            process.stdout.close()
+            process.wait()
+        return line.split(b'\n', 1)[0].decode('utf-8', 'replace')
+
+    async def run_async(self, command, timeout=None, on_output=None, check=False, cwd=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(self.run, command, timeout, on_output, check, cwd))
+
+
+async def gather_commands(commands, timeout=None, check=False):
+    # commands是 (executor, command) 的列表，全部同时执行，按原顺序返回结果
+    results = await asyncio.gather(*(executor.run_async(command, timeout=timeout) for executor, command in commands))
+    if check:
+        for result in results:
+            result.check()
+    return results
+
+
+def run_commands(commands, timeout=None, check=False):
+    # 在同步代码里同时执行多条命令，按原顺序返回结果，总耗时约等于最慢的那一条；异步代码请用gather_commands
+    results = run_concurrently(lambda item: item[0].run(item[1], timeout=timeout), commands)
+    if check:
+        for result in results:
+            result.check()
+    return results
+
+
+def run_concurrently(function, items):
+    # 在线程池里同时对每个元素调用function，按原顺序返回结果，用于同时等待多个服务
+    # 直接用线程池而不是asyncio.run，在已经有事件循环的线程里（异步代码、Jupyter）也能调用
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(items), DEFAULT_CONCURRENCY)) as executor:
+        return list(executor.map(function, items))
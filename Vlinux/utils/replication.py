@@ -1,5 +1,6 @@
 import yaml
 import pymysql
+import pymysql.cursors
 import os
 import sys
 from time import sleep
@@ -132,7 +133,7 @@ class MySQLReplication:
 
     # 连接测试
         try:
-            with db.connection.cursor() as cursor:
+            with db.raw_connection() as connection, connection.cursor() as cursor:
                 cursor.execute("SELECT 1")
             print("Successfully connected to the master database.")
         except Exception as e:
@@ -154,7 +155,7 @@ class MySQLReplication:
 
      # 连接测试
         try:
-            with db.connection.cursor() as cursor:
+            with db.raw_connection() as connection, connection.cursor() as cursor:
                 cursor.execute("SELECT 1")
             print("Successfully connected to the slave database.")
         except Exception as e:
@@ -167,8 +168,8 @@ class MySQLReplication:
         query = "SHOW MASTER STATUS;"
 
         try:
-            # 使用 pymysql 直接执行查询
-            with self.db_master.connection.cursor() as cursor:
+            # 从连接池借出原生连接执行查询，用完归还，不关闭共享的连接
+            with self.db_master.raw_connection() as connection, connection.cursor() as cursor:
                 cursor.execute(query)
                 result = cursor.fetchone()
             if result:
@@ -178,8 +179,6 @@ class MySQLReplication:
                 return binlog_file, binlog_position
         except Exception as e:
             print(f"Failed to get master status: {e}")
-        finally:
-            self.db_master.connection.close()
         return None, None
 
     def import_data_from_db_master_to_db_slave(self):
@@ -215,22 +214,22 @@ class MySQLReplication:
         """
 
         try:
-            with self.db_slave.connection.cursor() as cursor:
-                cursor.execute("STOP SLAVE IO_THREAD;")  # 停止I/O线程
-                cursor.execute(replication_query)
-                cursor.execute("START SLAVE;")
-            self.db_slave.connection.commit()
+            with self.db_slave.raw_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("STOP SLAVE IO_THREAD;")  # 停止I/O线程
+                    cursor.execute(replication_query)
+                    cursor.execute("START SLAVE;")
+                connection.commit()
             print("Replication set up successfully.")
         except Exception as e:
             print(f"Failed to set up replication: {e}")
             raise
-        finally:
-            self.db_slave.connection.close()
 
     def check_replication_status(self):
         query = "SHOW SLAVE STATUS;"
         try:
-            with self.db_slave.connection.cursor() as cursor:
+            # 按列名读取结果需要DictCursor
+            with self.db_slave.raw_connection() as connection, connection.cursor(pymysql.cursors.DictCursor) as cursor:
                 cursor.execute(query)
                 result = cursor.fetchone()
                 if result:
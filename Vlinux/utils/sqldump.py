@@ -0,0 +1,561 @@
+import gzip
+import json
+import logging
+import os
+import re
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 流式解析SQL文件时每次读取的字节数，内存占用只和这个值以及单条语句的长度有关，和文件大小无关
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+_WHITESPACE = re.compile(rb"\s*")
+_QUOTE_END = {
+    b"'": re.compile(rb"[\\']"),
+    b'"': re.compile(rb'[\\"]'),
+    b"`": re.compile(rb"`"),
+}
+_DELIMITER_COMMAND = re.compile(rb"DELIMITER\s", re.IGNORECASE)
+
+_NAME = rb"(?:`(?:[^`]|``)+`|[\w$]+)"
+_TABLE_STATEMENT = re.compile(
+    rb"\s*(?:/\*!\d*\s*)?"
+    rb"(?P<kind>CREATE\s+TABLE(?:\s+IF\s+NOT\s+EXISTS)?|INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|DROP\s+TABLE(?:\s+IF\s+EXISTS)?)\s+"
+    rb"(?:(?P<database>" + _NAME + rb")\s*\.\s*)?(?P<table>" + _NAME + rb")",
+    re.IGNORECASE)
+# mysqldump导出的触发器形如 /*!50003 CREATE*/ /*!50017 DEFINER=...*/ /*!50003 TRIGGER `trg` BEFORE INSERT ON `t` ...
+_TRIGGER_STATEMENT = re.compile(
+    rb"\s*(?:/\*!\d*\s*)?CREATE\b.*?\bTRIGGER\s+(?:" + _NAME + rb"\s*\.\s*)?" + _NAME +
+    rb"\s+(?:BEFORE|AFTER)\s+\w+\s+ON\s+(?:(?P<database>" + _NAME + rb")\s*\.\s*)?(?P<table>" + _NAME + rb")",
+    re.IGNORECASE | re.DOTALL)
+# 视图、存储过程、函数、事件的创建和删除语句，mysqldump会在前面加上 ALGORITHM=、DEFINER=、SQL SECURITY 这些选项，
+# 可能分在几个版本注释里，例如 /*!50001 CREATE ALGORITHM=UNDEFINED */ /*!50013 DEFINER=`root`@`%` SQL SECURITY DEFINER */ /*!50001 VIEW `v` AS ...
+_OBJECT_STATEMENT = re.compile(
+    rb"\s*(?:/\*!\d*\s*)?(?:CREATE|DROP)\b"
+    rb"(?:\s+|\*/|/\*!\d*|OR\s+REPLACE\b|ALGORITHM\s*=\s*\w+|DEFINER\s*=\s*(?:(?!\*/)\S)+|SQL\s+SECURITY\s+\w+)*?"
+    rb"\b(?:VIEW|PROCEDURE|FUNCTION|EVENT)\s+(?:IF\s+EXISTS\s+)?(?:(?P<database>" + _NAME + rb")\s*\.\s*)?(?P<table>" + _NAME + rb")",
+    re.IGNORECASE)
+# mysqldump在 /*!50001 ... */ 里为视图建临时的占位表，最后再删掉占位表建真正的视图，这些语句属于视图，不属于表
+_VIEW_PLACEHOLDER = re.compile(rb"\s*/\*!50001\s")
+_SET_STATEMENT = re.compile(rb"\s*(?:/\*!\d*\s*)?SET\s", re.IGNORECASE)
+# mysqldump --databases/--all-databases 导出的文件用 USE `库名` 切换当前库
+_USE_STATEMENT = re.compile(rb"\s*USE\s+(?P<database>" + _NAME + rb")\s*$", re.IGNORECASE)
+
+# 索引文件和SQL文件放在一起，文件名后加上这个后缀
+INDEX_SUFFIX = '.idx.json'
+# 合并INSERT范围的规则（block_size）改变后索引的含义也变了，所以版本号和block_size都要和索引文件里的一致
+INDEX_VERSION = 4
+# 同一个表连续的INSERT最多合并成这么大的一块，方便并行导入时把大表拆成多个任务
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024
+
+# 按扩展名识别压缩格式，导入导出时用对应的命令在管道里压缩/解压
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+COMPRESS_COMMANDS = {'gzip': 'gzip -c', 'zstd': 'zstd -q -c'}
+DECOMPRESS_COMMANDS = {'gzip': 'gzip -dc', 'zstd': 'zstd -q -dc'}
+
+
+def compression_of(sql_file_path):
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(sql_file_path)[1].lower())
+
+
+def open_sql_file(sql_file_path, mode='rb'):
+    # 透明地打开 .sql、.sql.gz、.sql.zst 文件，只支持二进制模式
+    compression = compression_of(sql_file_path)
+    if compression == 'gzip':
+        return gzip.open(sql_file_path, mode)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("The zstandard package is required to read or write .zst files.")
+        return zstandard.open(sql_file_path, mode)
+    return open(sql_file_path, mode)
+
+
+def _statement_pattern(delimiter):
+    # 普通状态下需要关注的记号：分隔符、引号、注释开头
+    return re.compile(re.escape(delimiter) + rb"|['\"`#]|--|/\*")
+
+
+def iter_sql_statements(file, chunk_size=DEFAULT_CHUNK_SIZE, start=0, end=None, delimiter=b';'):
+    # 按固定大小分块读取二进制文件，逐条产出 (起始偏移, 结束偏移, 语句)
+    # 语句可以跨行，引号里的分号、注释里的分号都不会被当成语句结束；支持mysqldump中的 DELIMITER 命令
+    # 偏移是字节偏移，结束偏移包含分隔符，所以可以直接用来 seek 定位；从DELIMITER块的中间开始读时用delimiter指定当时的分隔符
+    for statement_start, statement_end, statement, _ in _iter_statements(file, chunk_size, start, end, delimiter):
+        yield statement_start, statement_end, statement
+
+
+def _iter_statements(file, chunk_size, start, end, delimiter):
+    # 和iter_sql_statements一样，每条语句多产出它所用的分隔符
+    if start:
+        file.seek(start)
+    remaining = None if end is None else end - start
+
+    buf = b''
+    base = start
+    pos = 0
+    stmt_start = None
+    state = None
+    pattern = _statement_pattern(delimiter)
+    eof = False
+    need_data = True
+
+    while True:
+        if need_data:
+            if eof:
+                break
+            # 丢弃已经处理完的部分，只保留当前语句，再读入新的数据块
+            cut = pos if stmt_start is None else stmt_start
+            if cut:
+                buf = buf[cut:]
+                base += cut
+                pos -= cut
+                if stmt_start is not None:
+                    stmt_start = 0
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = file.read(size) if size > 0 else b''
+            if chunk:
+                buf += chunk
+                if remaining is not None:
+                    remaining -= len(chunk)
+            else:
+                eof = True
+            need_data = False
+
+        length = len(buf)
+
+        if state is None:
+            if stmt_start is None:
+                # 语句之间的空白、注释和 DELIMITER 命令都不属于任何语句
+                pos = _WHITESPACE.match(buf, pos).end()
+                # 判断注释和 DELIMITER 命令至少要看到 "DELIMITER " 这么多字节
+                if pos >= length or (pos + 10 > length and not eof):
+                    need_data = True
+                    continue
+                if _DELIMITER_COMMAND.match(buf, pos):
+                    newline = buf.find(b'\n', pos)
+                    if newline < 0 and not eof:
+                        need_data = True
+                        continue
+                    line_end = length if newline < 0 else newline
+                    parts = buf[pos:line_end].split(None, 1)
+                    if len(parts) < 2:
+                        raise ValueError(f"DELIMITER command without a delimiter at byte offset {base + pos}.")
+                    delimiter = parts[1].strip()
+                    pattern = _statement_pattern(delimiter)
+                    pos = line_end + 1
+                    continue
+                if buf.startswith(b'#', pos) or buf.startswith(b'--', pos):
+                    if buf[pos:pos + 1] == b'#' or buf[pos + 2:pos + 3] in (b'', b' ', b'\t', b'\r', b'\n'):
+                        state = b'--'
+                        pos += 1
+                        continue
+                stmt_start = pos
+
+            match = pattern.search(buf, pos)
+            if match is None:
+                # 数据块末尾可能截断了分隔符或注释开头，留到下次一起扫描
+                pos = max(pos, length - max(len(delimiter), 2) + 1)
+                need_data = True
+                continue
+            token = match.group()
+            if token == delimiter:
+                statement = buf[stmt_start:match.start()].rstrip()
+                if statement:
+                    yield base + stmt_start, base + match.end(), statement, delimiter
+                stmt_start = None
+                pos = match.end()
+            elif token == b'--':
+                # 只有 "-- " 才是注释，像 a--1 这样的表达式不是
+                if match.end() >= length and not eof:
+                    pos = match.start()
+                    need_data = True
+                    continue
+                if buf[match.end():match.end() + 1] in (b'', b' ', b'\t', b'\r', b'\n'):
+                    state = b'--'
+                    pos = match.end()
+                else:
+                    pos = match.start() + 1
+            elif token == b'#':
+                state = b'--'
+                pos = match.end()
+            elif token == b'/*':
+                state = b'/*'
+                pos = match.end()
+            else:
+                state = token
+                pos = match.end()
+
+        elif state == b'--':
+            newline = buf.find(b'\n', pos)
+            if newline < 0:
+                pos = length
+                need_data = True
+                continue
+            state = None
+            pos = newline + 1
+
+        elif state == b'/*':
+            close = buf.find(b'*/', pos)
+            if close < 0:
+                pos = max(pos, length - 1)
+                need_data = True
+                continue
+            state = None
+            pos = close + 2
+
+        else:
+            match = _QUOTE_END[state].search(buf, pos)
+            if match is None:
+                pos = length
+                need_data = True
+                continue
+            # 反斜杠转义和两个连续引号都需要看下一个字节
+            if match.end() >= length and not eof:
+                pos = match.start()
+                need_data = True
+                continue
+            if match.group() == b'\\':
+                pos = match.end() + 1
+            elif buf[match.end():match.end() + 1] == state:
+                pos = match.end() + 1
+            else:
+                state = None
+                pos = match.end()
+
+    # 文件最后一条语句可能没有分隔符
+    if stmt_start is not None:
+        statement = buf[stmt_start:].rstrip()
+        if statement:
+            yield base + stmt_start, base + len(buf), statement, delimiter
+
+
+def _unquote_name(name):
+    if name.startswith(b'`'):
+        name = name[1:-1].replace(b'``', b'`')
+    return name.decode('utf-8')
+
+
+def _classify(statement):
+    # 返回 (类型, 语句里写的库名或None, 表名)
+    match = _TABLE_STATEMENT.match(statement)
+    if match is not None:
+        kind = match.group('kind').split()[0].upper()
+        kind = {b'CREATE': 'create', b'DROP': 'drop'}.get(kind, 'insert')
+        if kind != 'insert' and _VIEW_PLACEHOLDER.match(statement):
+            kind = 'object'
+    else:
+        match = _TRIGGER_STATEMENT.match(statement)
+        kind = 'trigger'
+        if match is None:
+            match = _OBJECT_STATEMENT.match(statement)
+            kind = 'object'
+        if match is None:
+            return None, None, None
+    database = match.group('database')
+    return kind, None if database is None else _unquote_name(database), _unquote_name(match.group('table'))
+
+
+def classify_statement(statement):
+    # 判断语句属于哪个表，返回 (类型, 表名)，类型是 'drop'、'create'、'insert'、'trigger' 之一，其他语句返回 (None, None)
+    # 视图、存储过程、函数、事件的语句类型是 'object'，名字是对象名
+    kind, _, table = _classify(statement)
+    return kind, table
+
+
+def iter_classified_statements(file, chunk_size=DEFAULT_CHUNK_SIZE):
+    # 逐条产出 (起始偏移, 结束偏移, 语句, 类型, 库名, 表名)，库名来自语句里的 库名.表名 或之前的USE语句，
+    # 没有USE语句、表名也不带库名时库名是空字符串；不属于任何表的语句类型、库名和表名都是None
+    for start, end, statement, kind, database, table, _ in _iter_classified(file, chunk_size):
+        yield start, end, statement, kind, database, table
+
+
+def _iter_classified(file, chunk_size):
+    # 和iter_classified_statements一样，每条语句多产出它所用的分隔符
+    current = ''
+    for start, end, statement, delimiter in _iter_statements(file, chunk_size, 0, None, b';'):
+        kind, database, table = _classify(statement)
+        if kind is None:
+            match = _USE_STATEMENT.match(statement)
+            if match is not None:
+                current = _unquote_name(match.group('database'))
+            yield start, end, statement, None, None, None, delimiter
+            continue
+        yield start, end, statement, kind, current if database is None else database, table, delimiter
+
+
+def _dump_signature(sql_file_path):
+    stat_result = os.stat(sql_file_path)
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+def _append_range(ranges, start, end, delimiter, merge):
+    # merge为True且分隔符相同时接到上一个范围后面；分隔符不是分号时（DELIMITER块里的语句）记在范围的第三项，重新读取时要用它
+    extra = [] if delimiter == b';' else [delimiter.decode('utf-8')]
+    if merge and ranges and ranges[-1][2:] == extra:
+        ranges[-1][1] = end
+    else:
+        ranges.append([start, end] + extra)
+
+
+def build_dump_index(sql_file_path, chunk_size=DEFAULT_CHUNK_SIZE, block_size=DEFAULT_BLOCK_SIZE):
+    # 扫描一遍SQL文件，记录每个表的删表、建表、插入、触发器语句所在的字节范围
+    # 压缩文件不能高效地 seek，所以只给未压缩的文件建立索引
+    # 同一个表连续的多条INSERT会合并成不超过block_size的范围；header记录第一个表之前的SET语句，用于恢复会话设置
+    # 表按库分开记录：databases是 {库名: {表名: 语句范围}}，多个库里的同名表不会混在一起
+    # 视图、存储过程、函数、事件按文件里的顺序记在 objects: {库名: 语句范围} 里，连同它们前后保存、恢复会话变量的SET语句
+    if compression_of(sql_file_path) is not None:
+        raise ValueError(f"Cannot index compressed SQL file '{sql_file_path}', decompress it first.")
+    size, mtime = _dump_signature(sql_file_path)
+    databases = {}
+    objects = {}
+    header = []
+    # 上一条表或对象语句之后的SET语句，下一条是对象语句时一起记到对象里
+    pending = []
+    previous = None
+    with open(sql_file_path, 'rb') as file:
+        for start, end, statement, kind, database, table, delimiter in _iter_classified(file, chunk_size):
+            if kind is None:
+                if not databases and not objects and _SET_STATEMENT.match(statement):
+                    _append_range(header, start, end, delimiter, previous == 'header')
+                    previous = 'header'
+                elif _SET_STATEMENT.match(statement):
+                    if isinstance(previous, tuple) and previous[0] == 'object':
+                        _append_range(objects[previous[1]], start, end, delimiter, True)
+                    else:
+                        pending.append((start, end, delimiter))
+                        previous = 'pending'
+                else:
+                    pending = []
+                    previous = None
+                continue
+            if kind == 'object':
+                ranges = objects.setdefault(database, [])
+                merge = previous == ('object', database)
+                for pending_start, pending_end, pending_delimiter in pending:
+                    _append_range(ranges, pending_start, pending_end, pending_delimiter, merge)
+                    merge = True
+                _append_range(ranges, start, end, delimiter, merge)
+                pending = []
+                previous = ('object', database)
+                continue
+            pending = []
+            ranges = databases.setdefault(database, {}).setdefault(table, {}).setdefault(kind, [])
+            merge = previous == (kind, database, table) and end - ranges[-1][0] <= block_size
+            _append_range(ranges, start, end, delimiter, merge)
+            previous = (kind, database, table)
+    return {'version': INDEX_VERSION, 'block_size': block_size, 'size': size, 'mtime': mtime, 'header': header,
+            'databases': databases, 'objects': objects}
+
+
+def _index_database(index, database):
+    # 文件里有这个库时用这个库，文件里只有一个库时用这个库（可以导入到别的库名下），
+    # 有多个库又没有指定库时无法确定用哪个，抛出ValueError
+    names = list(dict.fromkeys(list(index['databases']) + list(index['objects'])))
+    if database in names:
+        return database
+    if len(names) <= 1:
+        return names[0] if names else None
+    listed = ', '.join(name or '(no database)' for name in names)
+    if database is None:
+        raise ValueError(f"SQL file contains several databases ({listed}), specify one of them.")
+    raise ValueError(f"Database '{database}' not found in SQL file, it contains: {listed}.")
+
+
+def index_tables(index, database=None):
+    # 返回索引里某个库的 {表名: 语句范围}，库的选择见_index_database
+    return index['databases'].get(_index_database(index, database), {})
+
+
+def index_objects(index, database=None):
+    # 返回索引里某个库的视图、存储过程、函数、事件语句的范围，要在数据和触发器都导入完后按顺序执行
+    return index['objects'].get(_index_database(index, database), [])
+
+
+def load_dump_index(sql_file_path, chunk_size=DEFAULT_CHUNK_SIZE, rebuild=False, block_size=DEFAULT_BLOCK_SIZE):
+    # 读取SQL文件旁边的索引文件，版本、block_size、文件大小或修改时间对不上时重新建立索引并保存
+    index_path = sql_file_path + INDEX_SUFFIX
+    size, mtime = _dump_signature(sql_file_path)
+    if not rebuild and os.path.exists(index_path):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+            if (index.get('version') == INDEX_VERSION and index.get('block_size') == block_size
+                    and index.get('size') == size and index.get('mtime') == mtime):
+                return index
+            logging.info(f"Index '{index_path}' is out of date, rebuilding.")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to read index '{index_path}', rebuilding: {e}")
+
+    logging.info(f"Indexing SQL file '{sql_file_path}', this reads the whole file once.")
+    index = build_dump_index(sql_file_path, chunk_size, block_size)
+    temp_path = index_path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+        os.replace(temp_path, index_path)
+    except OSError as e:
+        # 目录只读或没有写权限时不保存索引，只在内存里使用，下次再重新扫描
+        logging.warning(f"Failed to save index '{index_path}', continuing without saving it: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    return index
+
+
+def iter_range_statements(file, ranges, chunk_size=DEFAULT_CHUNK_SIZE):
+    # 直接 seek 到索引记录的字节范围，逐条产出其中的语句；范围的第三项是DELIMITER块里的分隔符
+    for start, end, *delimiter in ranges:
+        delimiter = delimiter[0].encode('utf-8') if delimiter else b';'
+        for _, _, statement in iter_sql_statements(file, chunk_size, start, end, delimiter):
+            yield statement
+
+
+def rename_statement_table(statement, table_name):
+    # 把建表或插入语句里的表名换成table_name，用于把数据导入到影子表
+    match = _TABLE_STATEMENT.match(statement)
+    if match is None:
+        raise ValueError("Statement does not create or insert into a table.")
+    quoted = b'`' + table_name.encode('utf-8').replace(b'`', b'``') + b'`'
+    return statement[:match.start('table')] + quoted + statement[match.end('table'):]
+
+
+def _scan_parentheses(text, start=0):
+    # 从start开始找第一个不在引号里的左括号，返回 (左括号位置, 对应的右括号位置)
+    depth = 0
+    quote = None
+    opening = None
+    index = start
+    while index < len(text):
+        char = text[index]
+        if quote is not None:
+            if char == '\\' and quote != '`':
+                index += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+        elif char == '(':
+            if opening is None:
+                opening = index
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0 and opening is not None:
+                return opening, index
+        index += 1
+    raise ValueError("Unbalanced parentheses in statement.")
+
+
+def _split_top_level(text):
+    # 按不在括号和引号里的逗号切分
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if quote is not None:
+            if char == '\\' and quote != '`':
+                index += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:index].strip())
+            start = index + 1
+        index += 1
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+_INDEX_DEFINITION = re.compile(r"(?:(?:UNIQUE|FULLTEXT|SPATIAL)\s+)?(?:KEY|INDEX)\b\s*(?P<name>`(?:[^`]|``)+`|\w+)?", re.IGNORECASE)
+_FOREIGN_KEY_DEFINITION = re.compile(r"(?:CONSTRAINT\b.*?)?FOREIGN\s+KEY\b", re.IGNORECASE | re.DOTALL)
+
+
+def _definition_columns(definition):
+    # 索引或外键定义里第一个括号中的列名，去掉前缀长度和排序方向
+    opening, closing = _scan_parentheses(definition)
+    columns = []
+    for part in _split_top_level(definition[opening + 1:closing]):
+        # 函数索引 ((expr)) 没有列名
+        head = part.split('(')[0].split()
+        columns.append(head[0].strip('`').replace('``', '`').lower() if head else '')
+    return columns
+
+
+def index_name(definition):
+    match = _INDEX_DEFINITION.match(definition)
+    if match is None or match.group('name') is None:
+        raise ValueError(f"Cannot find the index name in '{definition}'.")
+    return match.group('name').strip('`').replace('``', '`')
+
+
+_CONSTRAINT_NAME = re.compile(r"CONSTRAINT\s+(?P<name>`(?:[^`]|``)+`|\w+)", re.IGNORECASE)
+
+
+def constraint_name(definition):
+    # 外键定义 CONSTRAINT `名字` FOREIGN KEY ... 里的约束名，没有写名字时返回None
+    match = _CONSTRAINT_NAME.match(definition)
+    return None if match is None else match.group('name').strip('`').replace('``', '`')
+
+
+def split_foreign_keys(create_statement):
+    # 把CREATE TABLE语句拆成 (不带外键的建表语句, 外键定义列表)
+    # 外键的约束名在整个库里唯一，影子表不能带着和原表同名的外键建立，要等替换原表后再加上
+    opening, closing = _scan_parentheses(create_statement)
+    definitions = _split_top_level(create_statement[opening + 1:closing])
+    foreign_keys = [definition for definition in definitions if _FOREIGN_KEY_DEFINITION.match(definition)]
+    if not foreign_keys:
+        return create_statement, []
+    kept = [definition for definition in definitions if definition not in foreign_keys]
+    statement = create_statement[:opening + 1] + '\n  ' + ',\n  '.join(kept) + '\n' + create_statement[closing:]
+    return statement, foreign_keys
+
+
+_COLUMN_DEFINITION = re.compile(r"(?P<name>`(?:[^`]|``)+`|\w+)\s", re.IGNORECASE)
+_NOT_COLUMN = re.compile(r"(?:PRIMARY|UNIQUE|FULLTEXT|SPATIAL|KEY|INDEX|CONSTRAINT|FOREIGN|CHECK)\b", re.IGNORECASE)
+_AUTO_INCREMENT = re.compile(r"\bAUTO_INCREMENT\b", re.IGNORECASE)
+
+
+def _auto_increment_columns(definitions):
+    # 定义里带AUTO_INCREMENT的列名（小写）；列的COMMENT和DEFAULT字符串去掉后再找，避免误判
+    columns = []
+    for definition in definitions:
+        match = _COLUMN_DEFINITION.match(definition)
+        if match is None or _NOT_COLUMN.match(definition):
+            continue
+        if _AUTO_INCREMENT.search(re.sub(r"'(?:[^'\\]|\\.|'')*'", "''", definition)):
+            columns.append(match.group('name').strip('`').replace('``', '`').lower())
+    return columns
+
+
+def split_secondary_indexes(create_statement):
+    # 把CREATE TABLE语句拆成 (不带二级索引的建表语句, 二级索引定义列表)，主键和外键保留在建表语句里
+    # 外键要求引用列上有索引，以外键列开头的索引也保留，否则MySQL会自动建一个，之后再加回来就重复了
+    # 以自增列开头的索引也保留：自增列必须是某个索引的第一列，去掉后建表会失败
+    opening, closing = _scan_parentheses(create_statement)
+    definitions = _split_top_level(create_statement[opening + 1:closing])
+    foreign_keys = [_definition_columns(definition[definition.upper().index('FOREIGN'):])
+                    for definition in definitions if _FOREIGN_KEY_DEFINITION.match(definition)]
+    auto_increment = _auto_increment_columns(definitions)
+    kept = []
+    indexes = []
+    for definition in definitions:
+        if _INDEX_DEFINITION.match(definition):
+            columns = _definition_columns(definition)
+            if (not any(columns[:len(foreign_key)] == foreign_key for foreign_key in foreign_keys)
+                    and columns[0] not in auto_increment):
+                indexes.append(definition)
+                continue
+        kept.append(definition)
+    statement = create_statement[:opening + 1] + '\n  ' + ',\n  '.join(kept) + '\n' + create_statement[closing:]
+    return statement, indexes
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块之间用同级导入（from sqldump import ...），测试时把Vlinux/utils加到sys.path里
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,91 @@
+import io
+import os
+import random
+
+import pytest
+
+from chunkstore import BLOCK_SIZE, ChunkStore, iter_chunks
+
+MIN_SIZE = 4 * BLOCK_SIZE
+AVG_SIZE = 16 * BLOCK_SIZE
+MAX_SIZE = 64 * BLOCK_SIZE
+
+
+def random_bytes(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+def chunks(data):
+    return list(iter_chunks(io.BytesIO(data), MIN_SIZE, AVG_SIZE, MAX_SIZE))
+
+
+def test_chunks_cover_the_stream_within_bounds():
+    data = random_bytes(300 * BLOCK_SIZE + 100, 1)
+    parts = chunks(data)
+    assert b''.join(parts) == data
+    assert all(MIN_SIZE <= len(part) <= MAX_SIZE for part in parts[:-1])
+    assert all(len(part) % BLOCK_SIZE == 0 for part in parts[:-1])
+
+
+def test_chunk_boundaries_recover_after_an_insertion():
+    # 前面插入几条记录后只有第一个块变化，后面的内容仍然切出相同的块
+    data = random_bytes(16 * 1024 * 1024, 2)
+    shifted = random_bytes(3 * BLOCK_SIZE, 3) + data
+    original = set(iter_chunks(io.BytesIO(data)))
+    changed = list(iter_chunks(io.BytesIO(shifted)))
+    assert len(changed) > 4
+    assert [part in original for part in changed[1:]] == [True] * (len(changed) - 1)
+
+
+def test_chunk_sizes_must_be_block_multiples():
+    with pytest.raises(ValueError):
+        list(iter_chunks(io.BytesIO(b'x'), MIN_SIZE + 1, AVG_SIZE, MAX_SIZE))
+
+
+def test_empty_stream_has_no_chunks():
+    assert chunks(b'') == []
+
+
+def test_store_deduplicates_and_restores(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    data = random_bytes(3 * 1024 * 1024, 4)
+    first = store.store_stream(io.BytesIO(data))
+    second = store.store_stream(io.BytesIO(data))
+    assert first['size'] == len(data) and first['new_chunks'] == len({digest for digest, _ in first['chunks']})
+    assert second['new_chunks'] == 0 and second['new_bytes'] == 0
+    restored = io.BytesIO()
+    store.restore_stream(first['chunks'], restored)
+    assert restored.getvalue() == data
+
+
+def test_corrupted_chunk_is_detected(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    digest, _ = store.put(b'payload')
+    path = store._find_chunk(digest)
+    with open(path, 'wb') as file:
+        file.write(b'garbage')
+    with pytest.raises(Exception):
+        store.get(digest)
+    os.remove(path)
+    with pytest.raises(ValueError):
+        store.get(digest)
+
+
+def test_remove_snapshot_collects_unreferenced_chunks(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    kept, _ = store.put(b'shared')
+    dropped, _ = store.put(b'only in old')
+    orphan, _ = store.put(b'left by a failed backup')
+    store.write_snapshot({'id': 'old', 'volumes': [{'chunks': [[kept, 6], [dropped, 11]]}]})
+    store.write_snapshot({'id': 'new', 'volumes': [{'chunks': [[kept, 6]]}]})
+    assert store.list_snapshots() == ['new', 'old']
+    assert store.remove_snapshot('old') == 2
+    assert store.has(kept) and not store.has(dropped) and not store.has(orphan)
+    assert store.load_snapshot()['id'] == 'new'
+
+
+def test_new_snapshot_ids_are_unique(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    first = store.new_snapshot_id()
+    store.write_snapshot({'id': first, 'volumes': []})
+    assert store.new_snapshot_id() != first
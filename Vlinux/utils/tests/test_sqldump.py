@@ -0,0 +1,160 @@
+import io
+
+import pytest
+
+from sqldump import (build_dump_index, index_objects, index_tables, iter_range_statements, iter_sql_statements,
+                     load_dump_index, rename_statement_table, split_foreign_keys, split_secondary_indexes)
+
+DUMP = b"""/*!40101 SET NAMES utf8mb4 */;
+-- a comment; with a semicolon
+USE `shop`;
+DROP TABLE IF EXISTS `orders`;
+CREATE TABLE `orders` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `note` varchar(20) DEFAULT ';',
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB;
+INSERT INTO `orders` VALUES (1,'a;b'),(2,'it''s');
+INSERT INTO `orders` VALUES (3,"q;\\";");
+INSERT INTO `orders` /* block; comment */ VALUES (4,'x');
+DELIMITER ;;
+/*!50003 CREATE*/ /*!50017 DEFINER=`root`@`%`*/ /*!50003 TRIGGER `orders_bi` BEFORE INSERT ON `orders` FOR EACH ROW BEGIN SET NEW.note = 'x;'; END */;;
+DELIMITER ;
+/*!50001 DROP VIEW IF EXISTS `recent`*/;
+/*!50001 SET @saved_cs_client = @@character_set_client */;
+/*!50001 CREATE ALGORITHM=UNDEFINED DEFINER=`root`@`%` SQL SECURITY DEFINER VIEW `recent` AS select `orders`.`id` AS `id` from `orders` */;
+/*!50001 SET character_set_client = @saved_cs_client */;
+DELIMITER ;;
+CREATE DEFINER=`root`@`%` PROCEDURE `cleanup`()
+BEGIN
+  DELETE FROM `orders` WHERE `note` = ';';
+END ;;
+DELIMITER ;
+"""
+
+
+def statements(data, chunk_size):
+    return [statement for _, _, statement in iter_sql_statements(io.BytesIO(data), chunk_size)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 20])
+def test_statements_do_not_depend_on_chunk_size(chunk_size):
+    assert statements(DUMP, chunk_size) == statements(DUMP, 1 << 20)
+
+
+def test_quotes_comments_and_delimiters():
+    parsed = statements(DUMP, 5)
+    assert b"INSERT INTO `orders` VALUES (1,'a;b'),(2,'it''s')" in parsed
+    assert b'INSERT INTO `orders` VALUES (3,"q;\\";")' in parsed
+    assert any(statement.endswith(b"SET NEW.note = 'x;'; END */") for statement in parsed)
+    assert any(statement.endswith(b"DELETE FROM `orders` WHERE `note` = ';';\nEND") for statement in parsed)
+    assert not any(statement.lstrip().upper().startswith(b'DELIMITER') for statement in parsed)
+
+
+def test_offsets_point_at_the_statements():
+    for start, end, statement in iter_sql_statements(io.BytesIO(DUMP), 16):
+        assert statement.strip() in DUMP[start:end]
+
+
+def test_reading_a_range_inside_a_delimiter_block():
+    start = DUMP.index(b'CREATE DEFINER')
+    parsed = [statement for _, _, statement in iter_sql_statements(io.BytesIO(DUMP), 8, start, len(DUMP), b';;')]
+    assert len(parsed) == 1 and parsed[0].startswith(b'CREATE DEFINER') and parsed[0].endswith(b'END')
+
+
+@pytest.fixture
+def dump_path(tmp_path):
+    path = tmp_path / 'shop.sql'
+    path.write_bytes(DUMP)
+    return str(path)
+
+
+def test_index_records_table_statements(dump_path):
+    index = build_dump_index(dump_path, chunk_size=32)
+    tables = index_tables(index)
+    assert set(tables) == {'orders'}
+    with open(dump_path, 'rb') as file:
+        inserts = list(iter_range_statements(file, tables['orders']['insert'], 32))
+        triggers = list(iter_range_statements(file, tables['orders']['trigger'], 32))
+        creates = list(iter_range_statements(file, tables['orders']['create'], 32))
+    assert len(inserts) == 3
+    assert len(creates) == 1 and creates[0].startswith(b'CREATE TABLE')
+    # 触发器在DELIMITER块里，范围要记下当时的分隔符
+    assert len(tables['orders']['trigger'][0]) == 3
+    assert len(triggers) == 1 and b'TRIGGER `orders_bi`' in triggers[0]
+
+
+def test_index_merges_consecutive_inserts_up_to_block_size(dump_path):
+    merged = index_tables(build_dump_index(dump_path, block_size=1 << 20))['orders']['insert']
+    separate = index_tables(build_dump_index(dump_path, block_size=1))['orders']['insert']
+    assert len(merged) == 1
+    assert len(separate) == 3
+
+
+def test_index_records_objects_in_order(dump_path):
+    index = build_dump_index(dump_path)
+    assert index_objects(index, 'shop') == index_objects(index)
+    with open(dump_path, 'rb') as file:
+        objects = list(iter_range_statements(file, index_objects(index)))
+    assert objects[0].startswith(b'/*!50001 DROP VIEW')
+    assert objects[1].startswith(b'/*!50001 SET @saved_cs_client')
+    assert b'VIEW `recent`' in objects[2]
+    assert objects[3].startswith(b'/*!50001 SET character_set_client')
+    assert objects[4].startswith(b'CREATE DEFINER') and objects[4].endswith(b'END')
+
+
+def test_index_selects_database(dump_path, tmp_path):
+    # 只有一个库时可以导入到别的库名下
+    assert set(index_tables(build_dump_index(dump_path), 'other')) == {'orders'}
+    path = tmp_path / 'two.sql'
+    path.write_bytes(b"USE `a`;\nCREATE TABLE `t` (`x` int);\nUSE `b`;\nCREATE TABLE `u` (`y` int);\n")
+    index = build_dump_index(str(path))
+    assert set(index_tables(index, 'b')) == {'u'}
+    for database in (None, 'c'):
+        with pytest.raises(ValueError):
+            index_tables(index, database)
+
+
+def test_saved_index_is_reused_and_rebuilt_when_stale(dump_path):
+    index = load_dump_index(dump_path)
+    assert load_dump_index(dump_path) == index
+    with open(dump_path, 'ab') as file:
+        file.write(b"INSERT INTO `orders` VALUES (5,'y');\n")
+    assert load_dump_index(dump_path)['size'] == index['size'] + len(b"INSERT INTO `orders` VALUES (5,'y');\n")
+
+
+def test_rename_statement_table():
+    assert rename_statement_table(b"INSERT INTO `t` VALUES (1)", 'u__new') == b"INSERT INTO `u__new` VALUES (1)"
+    with pytest.raises(ValueError):
+        rename_statement_table(b"SELECT 1", 'u')
+
+
+CREATE = """CREATE TABLE `items` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `code` int NOT NULL,
+  `order_id` int NOT NULL,
+  `name` varchar(20) DEFAULT 'a, (b)',
+  `body` text,
+  PRIMARY KEY (`code`),
+  KEY `by_id` (`id`),
+  UNIQUE KEY `by_name` (`name`(10)),
+  KEY `by_order` (`order_id`,`name`),
+  FULLTEXT KEY `by_body` (`body`),
+  CONSTRAINT `items_order` FOREIGN KEY (`order_id`) REFERENCES `orders` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB"""
+
+
+def test_split_secondary_indexes():
+    statement, indexes = split_secondary_indexes(CREATE)
+    assert indexes == ["UNIQUE KEY `by_name` (`name`(10))", "FULLTEXT KEY `by_body` (`body`)"]
+    # 主键、外键、外键需要的索引和自增列的索引留在建表语句里
+    for kept in ('PRIMARY KEY (`code`)', 'KEY `by_id` (`id`)', 'KEY `by_order`', 'CONSTRAINT `items_order`', "DEFAULT 'a, (b)'"):
+        assert kept in statement
+    assert statement.endswith(') ENGINE=InnoDB')
+
+
+def test_split_foreign_keys():
+    statement, foreign_keys = split_foreign_keys(CREATE)
+    assert foreign_keys == ["CONSTRAINT `items_order` FOREIGN KEY (`order_id`) REFERENCES `orders` (`id`) ON DELETE CASCADE"]
+    assert 'FOREIGN KEY' not in statement and 'KEY `by_order`' in statement
+    assert split_foreign_keys("CREATE TABLE `t` (`a` int)") == ("CREATE TABLE `t` (`a` int)", [])